@@ -15,6 +15,7 @@ from sdx_controller.handlers.connection_handler import (
     connection_state_machine,
 )
 from sdx_controller.messaging.rpc_queue_consumer import RpcConsumer
+from sdx_controller.utils.connection_events import get_connection_events
 from sdx_controller.utils.db_utils import DbUtils
 
 logger = logging.getLogger(__name__)
@@ -95,8 +96,18 @@ def create_provisioning_timeout_thread(app):
                     connection, _ = connection_state_machine(
                         connection, ConnectionStateMachine.State.DOWN
                     )
-                    app.db_instance.add_key_value_pair_to_db(
-                        MongoCollections.CONNECTIONS, service_id, connection
+                    app.db_instance.update_fields_in_json(
+                        MongoCollections.CONNECTIONS,
+                        service_id,
+                        {
+                            field_name: connection[field_name]
+                            for field_name in (
+                                "status",
+                                "provisioning_timeout_handled",
+                                "partial_cleanup_requested",
+                                "timeout_reason",
+                            )
+                        },
                     )
                     cleanup_status, cleanup_code = (
                         connection_handler.cleanup_partial_connection(
@@ -106,6 +117,7 @@ def create_provisioning_timeout_thread(app):
                     logger.info(
                         f"[ProvisioningTimeout] Cleanup result for {service_id}: {cleanup_status}, code={cleanup_code}"
                     )
+                    get_connection_events().notify(service_id)
             except Exception as e:
                 logger.exception(
                     f"[ProvisioningTimeout] Error while monitoring connections: {e}"
@@ -4,6 +4,9 @@ from asgiref.wsgi import WsgiToAsgi
 from flask import redirect
 
 from sdx_controller import create_app
+from sdx_controller.handlers.placement_queue import close_placement_queue
+from sdx_controller.messaging.topic_queue_producer import close_publisher
+from sdx_controller.utils.topology_store import close_topology_store
 
 # This is a `connexion.apps.flask_app.FlaskApp` that we created using
 # connexion.App().
@@ -35,10 +38,15 @@ def on_app_exit():
     Do some cleanup on exit.
 
     We run a message queue consumer in a separate thread, and here we
-    signal the thread that we're exiting.
+    signal the thread that we're exiting.  We also finish queued
+    placements, close the connection that we publish messages on, and
+    save topology changes that have not been written yet.
     """
     if application.rpc_consumer:
         application.rpc_consumer.stop_threads()
+    close_placement_queue()
+    close_publisher()
+    close_topology_store()
 
 
 if __name__ == "__main__":
@@ -3,21 +3,32 @@ import logging
 import os
 import time
 import uuid
+from itertools import chain
 
 import connexion
 from flask import current_app
 from sdx_datamodel.connection_sm import ConnectionStateMachine
 from sdx_datamodel.constants import MongoCollections
+from sdx_pce.utils.exceptions import SameSwitchRequestError
 
 from sdx_controller.handlers.connection_handler import (
     ConnectionHandler,
     connection_state_machine,
     get_connection_status,
+    get_connection_statuses,
     parse_conn_status,
 )
+from sdx_controller.handlers.placement_queue import (
+    PLACEMENT_ASYNC,
+    PlacementQueueFull,
+    get_placement_queue,
+)
 
 # from sdx_controller.models.l2vpn_service_id_body import L2vpnServiceIdBody  # noqa: E501
+from sdx_controller.utils.connection_events import get_connection_events
 from sdx_controller.utils.db_utils import DbUtils
+from sdx_controller.utils.json_stream import iter_json_object, json_stream_response
+from sdx_controller.utils.te_lock import get_te_lock
 
 LOG_FORMAT = (
     "%(levelname) -10s %(asctime)s %(name) -30s %(funcName) "
@@ -29,16 +40,12 @@ logger.setLevel(logging.getLevelName(os.getenv("LOG_LEVEL", "DEBUG")))
 ROLLBACK_SETTLE_TIMEOUT_SECONDS = float(
     os.getenv("ROLLBACK_SETTLE_TIMEOUT_SECONDS", "5")
 )
-ROLLBACK_SETTLE_POLL_SECONDS = float(os.getenv("ROLLBACK_SETTLE_POLL_SECONDS", "0.2"))
 
 # PATCH must wait for async OXP provisioning responses before deciding whether
 # the new service is really up or needs rollback to the previous request.
 PATCH_PROVISIONING_SETTLE_TIMEOUT_SECONDS = int(
     os.getenv("PATCH_PROVISIONING_SETTLE_TIMEOUT_SECONDS", "10")
 )
-PATCH_PROVISIONING_SETTLE_POLL_SECONDS = int(
-    os.getenv("PATCH_PROVISIONING_SETTLE_POLL_SECONDS", "1")
-)
 
 # Get DB connection and tables set up.
 db_instance = DbUtils()
@@ -46,34 +53,37 @@ db_instance.initialize_db()
 connection_handler = ConnectionHandler(db_instance)
 
 
-def _wait_for_patch_provisioning_to_settle(service_id):
-    deadline = time.time() + PATCH_PROVISIONING_SETTLE_TIMEOUT_SECONDS
-    connection = db_instance.get_value_from_db(MongoCollections.CONNECTIONS, service_id)
+def _read_connection(service_id):
+    return db_instance.get_value_from_db(MongoCollections.CONNECTIONS, service_id)
 
-    while time.time() < deadline:
-        connection = db_instance.get_value_from_db(
-            MongoCollections.CONNECTIONS, service_id
-        )
+
+def _wait_for_patch_provisioning_to_settle(service_id):
+    # The connection is read again only when an OXP response (or the
+    # provisioning timeout) changes it.
+    def settled(connection):
         if not connection:
-            return None
+            return True
 
         status = connection.get("status")
-        if status != str(ConnectionStateMachine.State.UNDER_PROVISIONING):
-            oxp_response = connection.get("oxp_response") or {}
-            breakdown = db_instance.get_value_from_db(
-                MongoCollections.BREAKDOWNS, service_id
-            )
-            expected_oxp_responses = len(breakdown) if breakdown else 0
-            if connection.get("partial_cleanup_requested") and (
-                not expected_oxp_responses or len(oxp_response) < expected_oxp_responses
-            ):
-                time.sleep(PATCH_PROVISIONING_SETTLE_POLL_SECONDS)
-                continue
-            return connection
-
-        time.sleep(PATCH_PROVISIONING_SETTLE_POLL_SECONDS)
+        if status == str(ConnectionStateMachine.State.UNDER_PROVISIONING):
+            return False
+        if not connection.get("partial_cleanup_requested"):
+            return True
+        oxp_response = connection.get("oxp_response") or {}
+        breakdown = db_instance.get_value_from_db(
+            MongoCollections.BREAKDOWNS, service_id
+        )
+        expected_oxp_responses = len(breakdown) if breakdown else 0
+        return bool(expected_oxp_responses) and len(oxp_response) >= (
+            expected_oxp_responses
+        )
 
-    return connection
+    return get_connection_events().wait_for(
+        service_id,
+        lambda: _read_connection(service_id),
+        settled,
+        PATCH_PROVISIONING_SETTLE_TIMEOUT_SECONDS,
+    )
 
 
 def delete_connection(service_id):
@@ -150,49 +160,180 @@ def get_connection_by_id(service_id):
     return value
 
 
-def get_connections():  # noqa: E501
+def get_connections(
+    limit=None, cursor=None, status=None, port_id=None, domain=None, fields=None
+):  # noqa: E501
     """
     List all connections
 
     connection details # noqa: E501
 
+    :param limit: most connections to return
+    :type limit: int
+    :param cursor: service ID after which to start, from X-Next-Cursor
+    :type cursor: str
+    :param status: status of connections to return
+    :type status: str
+    :param port_id: ID of an endpoint port of connections to return
+    :type port_id: str
+    :param domain: domain of connections to return
+    :type domain: str
+    :param fields: fields of connections to return
+    :type fields: List[str]
+
     :rtype: Connection
     """
-    values = db_instance.get_all_entries_in_collection(MongoCollections.CONNECTIONS)
-    if not values:
+    statuses, next_cursor = get_connection_statuses(
+        db_instance,
+        limit=limit,
+        cursor=cursor,
+        status=status,
+        port_id=port_id,
+        domain=domain,
+        fields=fields,
+    )
+    first = next(statuses, None)
+    if first is None:
         return "No connection was found", 404
-    return_values = {}
-    for connection in values:
-        service_id = next(iter(connection))
-        logger.info(f"service_id: {service_id}")
-        connection_status = get_connection_status(db_instance, service_id)
-        if connection_status:
-            return_values[service_id] = connection_status.get(service_id)
-    return return_values
+    # Send connections as they are read from the DB.
+    return json_stream_response(
+        iter_json_object(chain([first], statuses)),
+        headers=next_cursor_header(next_cursor),
+    )
 
 
-def get_archived_connections():
+def get_archived_connections(limit=None, cursor=None, since=None, until=None):
     """
     List all archived connections.
 
+    :param limit: most services to return archived connections of
+    :type limit: int
+    :param cursor: service ID after which to start, from X-Next-Cursor
+    :type cursor: str
+    :param since: earliest archive time, in seconds since the epoch
+    :type since: int
+    :param until: latest archive time, in seconds since the epoch
+    :type until: int
+
     :rtype: dict
     """
-    values = db_instance.get_all_entries_in_collection(
-        MongoCollections.HISTORICAL_CONNECTIONS
+    archived, next_cursor = connection_handler.get_all_archived_connections(
+        limit=limit, cursor=cursor, since=since, until=until
     )
-    if not values:
+
+    first = next(archived, None)
+    if first is None:
         return "No archived connection was found", 404
+    return json_stream_response(
+        iter_json_object(chain([first], archived)),
+        headers=next_cursor_header(next_cursor),
+    )
 
-    return_values = {}
-    for archived_connection in values:
-        service_id = next(iter(archived_connection))
-        archived_events = connection_handler.get_archived_connections(service_id)
-        if archived_events:
-            return_values[service_id] = archived_events
 
-    if not return_values:
-        return "No archived connection was found", 404
-    return return_values
+def next_cursor_header(next_cursor):
+    """
+    Return the headers that tell where the next page of a listing
+    starts, if there is one.
+    """
+    if next_cursor is None:
+        return {}
+    return {"X-Next-Cursor": next_cursor}
+
+
+def _request_error_code(request_err):
+    """
+    Return the HTTP code of an error found when validating a request.
+    """
+    error_code = getattr(request_err, "request_code", None)
+    if isinstance(error_code, int):
+        return error_code
+    # Backward-compatible fallback for exception strings like "... (Code: 400)".
+    err_text = str(request_err)
+    if "Code:" in err_text:
+        candidate = err_text.split("Code:")[-1].replace(")", "").strip()
+        try:
+            return int(candidate)
+        except (TypeError, ValueError):
+            logger.warning(
+                f"Could not parse error code from validation error: {err_text}"
+            )
+    return 400
+
+
+def _place_requested_connection(te_manager, body):
+    """
+    Place a connection that has been saved as REQUESTED, and mark it
+    REJECTED if it cannot be placed.  Return `(reason, code)`.
+    """
+    service_id = body["id"]
+    reason, code = connection_handler.place_connection(te_manager, body)
+
+    if code // 100 == 2:
+        # conn_status = ConnectionStateMachine.State.UNDER_PROVISIONING
+        # body, _ = connection_state_machine(body, conn_status)
+        # db_instance.update_field_in_json(
+        #    MongoCollections.CONNECTIONS,
+        #    service_id,
+        #    "status",
+        #    str(conn_status),
+        # )
+        logger.info(f"place_connection succeeds: ID: {service_id} body='{body}'")
+    else:
+        conn_status = ConnectionStateMachine.State.REJECTED
+        body, _ = connection_state_machine(body, conn_status)
+        db_instance.update_field_in_json(
+            MongoCollections.CONNECTIONS,
+            service_id,
+            "status",
+            str(conn_status),
+        )
+    logger.info(
+        f"place_connection result: ID: {service_id} reason='{reason}', code={code}"
+    )
+    return reason, code
+
+
+def _place_queued_connection(te_manager, body):
+    """
+    Place a connection taken from the placement queue.  Connections
+    that were deleted or changed while queued are left alone, and the
+    reason a connection could not be placed is kept with it.
+    """
+    service_id = body["id"]
+    current_conn = db_instance.get_value_from_db(
+        MongoCollections.CONNECTIONS, service_id
+    )
+    if not current_conn or current_conn.get("status") != body["status"]:
+        logger.info(f"Not placing {service_id}: it was changed while queued")
+        return
+
+    # Time spent in the queue does not count against the OXP response
+    # timeout.
+    body["provisioning_started_at"] = time.time()
+    db_instance.update_field_in_json(
+        MongoCollections.CONNECTIONS,
+        service_id,
+        "provisioning_started_at",
+        body["provisioning_started_at"],
+    )
+
+    try:
+        reason, code = _place_requested_connection(te_manager, body)
+    except Exception as e:
+        logger.exception(f"Placing {service_id} failed: {e}")
+        reason, code = f"Failed, reason: {e}", 500
+        if body["status"] == str(ConnectionStateMachine.State.REQUESTED):
+            body, _ = connection_state_machine(
+                body, ConnectionStateMachine.State.REJECTED
+            )
+
+    if code // 100 != 2:
+        # Keep the reason, which the client did not get in a response.
+        db_instance.update_fields_in_json(
+            MongoCollections.CONNECTIONS,
+            service_id,
+            {"status": body["status"], "placement_reason": reason},
+        )
 
 
 def place_connection(body):
@@ -220,6 +361,29 @@ def place_connection(body):
         body["id"] = service_id
         logger.info(f"Request has no ID. Generated ID: {service_id}")
 
+    # Requests are placed in the background, and answered with 202
+    # right away, when asked for with "Prefer: respond-async".
+    prefer = connexion.request.headers.get("Prefer", "")
+    respond_async = PLACEMENT_ASYNC or "respond-async" in prefer
+    if respond_async:
+        # Only check the request here; the placement queue finds a path.
+        try:
+            with get_te_lock():
+                traffic_matrix = current_app.te_manager.generate_traffic_matrix(
+                    connection_request=body
+                )
+        except SameSwitchRequestError:
+            traffic_matrix = True
+        except Exception as request_err:
+            logger.error(f"Invalid connection request {service_id}: {request_err}")
+            return f"Error: {request_err}", _request_error_code(request_err)
+        if traffic_matrix is None:
+            return (
+                "Error: Request does not have a valid JSON or body is "
+                "incomplete/incorrect",
+                400,
+            )
+
     conn_status = ConnectionStateMachine.State.REQUESTED
     body["status"] = str(conn_status)
 
@@ -232,33 +396,42 @@ def place_connection(body):
 
     db_instance.add_key_value_pair_to_db(MongoCollections.CONNECTIONS, service_id, body)
 
-    logger.info(
-        f"Handling request {service_id} with te_manager: {current_app.te_manager}"
-    )
-    reason, code = connection_handler.place_connection(current_app.te_manager, body)
+    if respond_async:
+        try:
+            get_placement_queue().submit(
+                _place_queued_connection, current_app.te_manager, body
+            )
+        except PlacementQueueFull as e:
+            reason = f"Failed, reason: {e}"
+            body, _ = connection_state_machine(
+                body, ConnectionStateMachine.State.REJECTED
+            )
+            db_instance.update_fields_in_json(
+                MongoCollections.CONNECTIONS,
+                service_id,
+                {"status": body["status"], "placement_reason": reason},
+            )
+            return {
+                "service_id": service_id,
+                "status": parse_conn_status(body["status"]),
+                "reason": reason,
+            }, 503
 
-    if code // 100 == 2:
-        # conn_status = ConnectionStateMachine.State.UNDER_PROVISIONING
-        # body, _ = connection_state_machine(body, conn_status)
-        # db_instance.update_field_in_json(
-        #    MongoCollections.CONNECTIONS,
-        #    service_id,
-        #    "status",
-        #    str(conn_status),
-        # )
-        logger.info(f"place_connection succeeds: ID: {service_id} body='{body}'")
-    else:
-        conn_status = ConnectionStateMachine.State.REJECTED
-        body, _ = connection_state_machine(body, conn_status)
-        db_instance.update_field_in_json(
-            MongoCollections.CONNECTIONS,
-            service_id,
-            "status",
-            str(conn_status),
+        logger.info(f"Queued placement of {service_id}")
+        return (
+            {
+                "service_id": service_id,
+                "status": parse_conn_status(body["status"]),
+                "reason": "Connection request accepted",
+            },
+            202,
+            {"Location": f"{connexion.request.base_url.rstrip('/')}/{service_id}"},
         )
+
     logger.info(
-        f"place_connection result: ID: {service_id} reason='{reason}', code={code}"
+        f"Handling request {service_id} with te_manager: {current_app.te_manager}"
     )
+    reason, code = _place_requested_connection(current_app.te_manager, body)
 
     current_conn = db_instance.get_value_from_db(
         MongoCollections.CONNECTIONS, f"{service_id}"
@@ -320,23 +493,16 @@ def patch_connection(service_id, body=None):  # noqa: E501
     te_manager = current_app.te_manager  # Assuming te_manager is accessible like this
     try:
         # Validate the new request body
-        traffic_matrix = te_manager.generate_traffic_matrix(connection_request=new_body)
+        with get_te_lock():
+            traffic_matrix = te_manager.generate_traffic_matrix(
+                connection_request=new_body
+            )
     except Exception as request_err:
         logger.error("ERROR: invalid patch request: " + str(request_err))
-        error_code = getattr(request_err, "request_code", None)
-        if not isinstance(error_code, int):
-            # Backward-compatible fallback for exception strings like "... (Code: 400)".
-            error_code = 400
-            err_text = str(request_err)
-            if "Code:" in err_text:
-                candidate = err_text.split("Code:")[-1].replace(")", "").strip()
-                try:
-                    error_code = int(candidate)
-                except (TypeError, ValueError):
-                    logger.warning(
-                        f"Could not parse error code from patch validation error: {err_text}"
-                    )
-        return f"Error: patch request is not valid: {request_err}", error_code
+        return (
+            f"Error: patch request is not valid: {request_err}",
+            _request_error_code(request_err),
+        )
     if traffic_matrix is None:
         return (
             "Error: patch request is not valid: "
@@ -503,17 +669,14 @@ def patch_connection(service_id, body=None):  # noqa: E501
                 "status",
                 str(conn_status),
             )
-            deadline = time.time() + ROLLBACK_SETTLE_TIMEOUT_SECONDS
-            while time.time() < deadline:
-                current_conn = db_instance.get_value_from_db(
-                    MongoCollections.CONNECTIONS, service_id
-                )
-                current_status = current_conn.get("status") if current_conn else None
-                if current_status != str(
-                    ConnectionStateMachine.State.UNDER_PROVISIONING
-                ):
-                    break
-                time.sleep(ROLLBACK_SETTLE_POLL_SECONDS)
+            get_connection_events().wait_for(
+                service_id,
+                lambda: _read_connection(service_id),
+                lambda current_conn: not current_conn
+                or current_conn.get("status")
+                != str(ConnectionStateMachine.State.UNDER_PROVISIONING),
+                ROLLBACK_SETTLE_TIMEOUT_SECONDS,
+            )
         logger.info(
             f"Roll back connection result: ID: {service_id} reason='{rollback_conn_reason}', code={rollback_conn_code}"
         )
@@ -543,6 +706,16 @@ def patch_connection(service_id, body=None):  # noqa: E501
     return response, response_code
 
 
+def get_placement_queue_stats():
+    """
+    Get the depth of the placement queue, and how long placements
+    waited in it, in seconds.
+
+    :rtype: object
+    """
+    return get_placement_queue().stats()
+
+
 def get_archived_connections_by_id(service_id):
     """
     List archived connection by ID.
@@ -3,6 +3,11 @@ from sdx_datamodel.constants import Constants, MongoCollections
 from sdx_pce.topology.grenmlconverter import GrenmlConverter
 
 from sdx_controller.utils.db_utils import DbUtils
+from sdx_controller.utils.json_stream import json_stream_response
+from sdx_controller.utils.parse_helper import ParseHelper
+from sdx_controller.utils.te_lock import get_te_lock
+from sdx_controller.utils.topology_history import TopologyHistory
+from sdx_controller.utils.topology_store import get_topology_store
 
 # Get DB connection and tables set up.
 db_instance = DbUtils()
@@ -17,16 +22,15 @@ def get_topology():  # noqa: E501
 
     :rtype: str
     """
-    topo_val = db_instance.get_value_from_db(
-        MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY
-    )
+    topology = get_topology_store(db_instance).stream_latest_topology()
 
     # TODO: this is a workaround because of the way we read values
     # from MongoDB; refactor and test this more.
-    if not topo_val:
+    if topology is None:
         return None
 
-    return topo_val
+    # Send the topology as it is read, rather than all at once.
+    return json_stream_response(topology)
 
 
 def get_topologyby_grenml():  # noqa: E501
@@ -41,10 +45,11 @@ def get_topologyby_grenml():  # noqa: E501
 
     :rtype: Topology
     """
-    topology = current_app.te_manager.get_topology()
-    converter = GrenmlConverter(topology)
-    converter.read_topology()
-    return converter.get_xml_str()
+    with get_te_lock():
+        topology = current_app.te_manager.get_topology()
+        converter = GrenmlConverter(topology)
+        converter.read_topology()
+        return converter.get_xml_str()
 
 
 def topology_version(topology_id):  # noqa: E501
@@ -52,12 +57,31 @@ def topology_version(topology_id):  # noqa: E501
 
     Topology version # noqa: E501
 
-    :param topology_id: topology id
+    :param topology_id: topology id, or domain name
     :type topology_id: str
 
+    :rtype: List[int]
+    """
+    domain = ParseHelper().find_domain_name(topology_id, ":")
+    return TopologyHistory(db_instance).get_versions(domain)
+
+
+def get_topology_history(domain, version):  # noqa: E501
+    """Get a domain's topology at a version
+
+    Returns a past version of a domain's topology # noqa: E501
+
+    :param domain: domain name
+    :type domain: str
+    :param version: version of topology to return
+    :type version: int
+
     :rtype: Topology
     """
-    return "do some magic!"
+    topology = TopologyHistory(db_instance).get_version(domain, version)
+    if topology is None:
+        return "Topology version not found", 404
+    return topology
 
 
 def get_topology_domains():
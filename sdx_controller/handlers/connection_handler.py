@@ -1,13 +1,17 @@
 import json
 import logging
 import os
+import re
 import sys
 import time
 import traceback
+from itertools import groupby, islice
+from operator import itemgetter
 from typing import Tuple
 
 from sdx_datamodel.connection_sm import ConnectionStateMachine
-from sdx_datamodel.constants import Constants, MessageQueueNames, MongoCollections
+from sdx_datamodel.constants import MessageQueueNames, MongoCollections
+from sdx_datamodel.models.topology import SDX_TOPOLOGY_ID_prefix
 from sdx_datamodel.parsing.exceptions import (
     AttributeNotSupportedException,
     ServiceNotSupportedException,
@@ -20,9 +24,12 @@ from sdx_pce.utils.exceptions import (
     TEError,
 )
 
-from sdx_controller.messaging.topic_queue_producer import TopicQueueProducer
+from sdx_controller.messaging.topic_queue_producer import get_publisher
 from sdx_controller.models.simple_link import SimpleLink
+from sdx_controller.utils.connection_events import get_connection_events
 from sdx_controller.utils.parse_helper import ParseHelper
+from sdx_controller.utils.te_lock import get_te_lock
+from sdx_controller.utils.topology_store import get_topology_store
 
 logger = logging.getLogger(__name__)
 logging.getLogger("pika").setLevel(logging.WARNING)
@@ -38,9 +45,6 @@ DELETE_PROPAGATION_WAIT_SECONDS = int(os.getenv("DELETE_PROPAGATION_WAIT_SECONDS
 UNDER_PROVISIONING_DELETE_SETTLE_TIMEOUT_SECONDS = int(
     os.getenv("UNDER_PROVISIONING_DELETE_SETTLE_TIMEOUT_SECONDS", "5")
 )
-UNDER_PROVISIONING_DELETE_SETTLE_POLL_SECONDS = int(
-    os.getenv("UNDER_PROVISIONING_DELETE_SETTLE_POLL_SECONDS", "1")
-)
 
 # Retry endpoint validation when the latest topology has arrived but the TE
 # graph has not caught up yet, avoiding transient "node not found" failures.
@@ -50,36 +54,48 @@ TOPOLOGY_SETTLE_RETRY_POLL_SECONDS = int(
 )
 
 
+# Status of connections in API responses, by connection state.  Other
+# states have the "error" status.
+CONNECTION_STATE_STATUS = {
+    "UP": "up",
+    "UNDER_PROVISIONING": "under provisioning",
+    "RECOVERING": "down",
+    "DOWN": "down",
+    "ERROR": "down",
+    "MODIFYING": "under provisioning",
+    "REQUESTED": "under provisioning",
+}
+
+# Fields of a connection status that do not need its breakdown.
+BASIC_STATUS_FIELDS = ("service_id", "name", "description", "status")
+
+
 class ConnectionHandler:
     def __init__(self, db_instance):
         self.db_instance = db_instance
         self.parse_helper = ParseHelper()
 
     def _wait_for_provisioning_to_settle(self, service_id, expected_domains):
-        deadline = time.time() + UNDER_PROVISIONING_DELETE_SETTLE_TIMEOUT_SECONDS
-        latest_connection = self.db_instance.get_value_from_db(
-            MongoCollections.CONNECTIONS, service_id
-        )
-
-        while time.time() < deadline:
-            latest_connection = self.db_instance.get_value_from_db(
+        # The connection is read again only when an OXP response (or
+        # anything else) changes it.
+        def settled(connection):
+            if not connection:
+                return True
+            if connection.get("status") != str(
+                ConnectionStateMachine.State.UNDER_PROVISIONING
+            ):
+                return True
+            oxp_response = connection.get("oxp_response") or {}
+            return bool(expected_domains) and len(oxp_response) >= expected_domains
+
+        return get_connection_events().wait_for(
+            service_id,
+            lambda: self.db_instance.get_value_from_db(
                 MongoCollections.CONNECTIONS, service_id
-            )
-            if not latest_connection:
-                return None
-
-            latest_status = latest_connection.get("status")
-            oxp_response = latest_connection.get("oxp_response") or {}
-
-            if latest_status != str(ConnectionStateMachine.State.UNDER_PROVISIONING):
-                return latest_connection
-
-            if expected_domains and len(oxp_response) >= expected_domains:
-                return latest_connection
-
-            time.sleep(UNDER_PROVISIONING_DELETE_SETTLE_POLL_SECONDS)
-
-        return latest_connection
+            ),
+            settled,
+            UNDER_PROVISIONING_DELETE_SETTLE_TIMEOUT_SECONDS,
+        )
 
     def _get_oxp_service_id(self, oxp_response, domain_name):
         if not isinstance(oxp_response, dict):
@@ -104,19 +120,21 @@ class ConnectionHandler:
         domain_name = self.parse_helper.find_domain_name(domain, ":") or f"{domain}"
         return domain_name.split("__", 1)[0]
 
-    def _generate_graph_and_traffic_matrix(self, te_manager, connection_request):
+    def _find_path(self, te_manager, connection_request):
+        """
+        Find a path for a connection request, and reserve VLANs and
+        bandwidth on it, retrying while the topology has not caught up
+        with the request's endpoints yet.
+
+        Return `(breakdown, links, error)`, where `error` is a
+        `(reason, code)` tuple if no path was found.
+        """
         deadline = time.time() + TOPOLOGY_SETTLE_RETRY_SECONDS
 
         while True:
-            graph = te_manager.generate_graph_te()
-            if graph is None:
-                return None, None
-
             try:
-                traffic_matrix = te_manager.generate_traffic_matrix(
-                    connection_request=connection_request
-                )
-                return graph, traffic_matrix
+                with get_te_lock():
+                    return self._reserve_path(te_manager, connection_request)
             except RequestValidationError as request_err:
                 if "not found in the graph" not in str(request_err):
                     raise
@@ -126,81 +144,98 @@ class ConnectionHandler:
                     f"Topology graph does not yet contain request endpoint for "
                     f"{connection_request.get('id')}; retrying."
                 )
+                # Wait without the TE lock, which the topology update
+                # that we wait for needs.
                 time.sleep(TOPOLOGY_SETTLE_RETRY_POLL_SECONDS)
 
-    def _process_port(self, connection_service_id, port_id, operation):
-        port_connections_dict_json = self.db_instance.get_value_from_db(
-            MongoCollections.PORTS, Constants.PORT_CONNECTIONS_DICT
-        )
-        port_connections_dict = (
-            json.loads(port_connections_dict_json) if port_connections_dict_json else {}
+    def _reserve_path(self, te_manager, connection_request):
+        # Called with the TE lock held: the graph, the traffic matrix
+        # and the solution refer to each other's node indexes, and must
+        # all come from the same state of the TE manager.
+        graph = te_manager.generate_graph_te()
+        if graph is None:
+            return None, None, ("No SDX topology found", 424)
+
+        traffic_matrix = te_manager.generate_traffic_matrix(
+            connection_request=connection_request
         )
+        if traffic_matrix is None:
+            return (
+                None,
+                None,
+                (
+                    "Request does not have a valid JSON or body is incomplete/incorrect",
+                    400,
+                ),
+            )
 
-        if port_id not in port_connections_dict:
-            port_connections_dict[port_id] = []
+        logger.info(f"Generated graph: '{graph}', traffic matrix: '{traffic_matrix}'")
+        conn = te_manager.requests_connectivity(traffic_matrix)
+        if conn is False:
+            logger.error(f"Graph connectivity: {conn}")
+            raise TEError("No path is available, the graph is not connected", 412)
 
-        if (
-            operation == "post"
-            and connection_service_id
-            and connection_service_id not in port_connections_dict[port_id]
-        ):
-            port_connections_dict[port_id].append(connection_service_id)
+        solver = TESolver(graph, traffic_matrix)
+        solution = solver.solve()
+        logger.debug(f"TESolver result: {solution}")
 
-        if (
-            operation == "delete"
-            and connection_service_id
-            and connection_service_id in port_connections_dict[port_id]
-        ):
-            port_connections_dict[port_id].remove(connection_service_id)
+        if solution is None or solution.connection_map is None:
+            return None, None, ("Could not solve the request", 410)
 
-        self.db_instance.add_key_value_pair_to_db(
-            MongoCollections.PORTS,
-            Constants.PORT_CONNECTIONS_DICT,
-            json.dumps(port_connections_dict),
-        )
+        _, links = te_manager.get_links_on_path(solution)
+
+        try:
+            breakdown = te_manager.generate_connection_breakdown(
+                solution, connection_request
+            )
+        except TEError:
+            raise
+        except Exception as e:
+            err = traceback.format_exc().replace("\n", ", ")
+            logger.error(f"Error when generating breakdown: {e} - {err}")
+            return None, None, (f"Error: {e}", 410)
+
+        return breakdown, links, None
+
+    def _process_port(self, connection_service_id, port_id, operation):
+        if not connection_service_id or not port_id:
+            return
+
+        if operation == "post":
+            self.db_instance.add_to_set_in_db(
+                MongoCollections.PORT_CONNECTIONS, port_id, connection_service_id
+            )
+
+        if operation == "delete":
+            self.db_instance.remove_from_set_in_db(
+                MongoCollections.PORT_CONNECTIONS, port_id, connection_service_id
+            )
 
-    def _process_link_connection_dict(
+    def _process_link(
         self,
         temanager,
-        link_connections_dict,
         simple_link,
         connection_service_id,
         operation,
     ):
-        if simple_link not in link_connections_dict:
-            link_connections_dict[simple_link] = []
-
         temanager._logger.info(
-            f"DB links in {operation}: {simple_link} {connection_service_id} {link_connections_dict}"
+            f"DB links in {operation}: {simple_link} {connection_service_id}"
         )
-        if (
-            operation == "post"
-            and connection_service_id
-            and connection_service_id not in link_connections_dict[simple_link]
-        ):
-            link_connections_dict[simple_link].append(connection_service_id)
-            temanager._logger.info(f"Save to DB links: {link_connections_dict}")
+        if not connection_service_id:
+            return
 
-        if (
-            operation == "delete"
-            and connection_service_id
-            and connection_service_id in link_connections_dict[simple_link]
-        ):
-            link_connections_dict[simple_link].remove(connection_service_id)
+        if operation == "post":
+            self.db_instance.add_to_set_in_db(
+                MongoCollections.LINK_CONNECTIONS, simple_link, connection_service_id
+            )
+            temanager._logger.info(f"Save to DB links: {simple_link}")
 
-        self.db_instance.add_key_value_pair_to_db(
-            MongoCollections.LINKS,
-            Constants.LINK_CONNECTIONS_DICT,
-            json.dumps(link_connections_dict),
-        )
+        if operation == "delete":
+            self.db_instance.remove_from_set_in_db(
+                MongoCollections.LINK_CONNECTIONS, simple_link, connection_service_id
+            )
 
     def _process_path_to_db(self, temanager, operation, connection_request):
-        link_connections_dict_json = self.db_instance.get_value_from_db(
-            MongoCollections.LINKS, Constants.LINK_CONNECTIONS_DICT
-        )
-        link_connections_dict = (
-            json.loads(link_connections_dict_json) if link_connections_dict_json else {}
-        )
         connection_service_id = connection_request.get("id")
         links = self.db_instance.get_value_from_db(
             MongoCollections.SOLUTIONS, connection_service_id
@@ -225,9 +260,10 @@ class ConnectionHandler:
         for ports in links or []:
             s_port = ports["source"]
             d_port = ports["destination"]
-            link = temanager.topology_manager._topology.get_link_by_port_id(
-                s_port, d_port
-            )
+            with get_te_lock():
+                link = temanager.topology_manager._topology.get_link_by_port_id(
+                    s_port, d_port
+                )
             simple_link = SimpleLink([s_port, d_port]).to_string()
             if link is None:
                 temanager._logger.warning(
@@ -235,9 +271,8 @@ class ConnectionHandler:
                 )
             else:
                 temanager._logger.info(f"Links on path: {link.id} {s_port} {d_port}")
-            self._process_link_connection_dict(
+            self._process_link(
                 temanager,
-                link_connections_dict,
                 simple_link,
                 connection_service_id,
                 operation,
@@ -251,7 +286,9 @@ class ConnectionHandler:
 
         connection_service_id = connection_request.get("id")
 
-        sent_domains = 0
+        # (domain_name, message) pairs, published once all of them
+        # have been prepared.
+        mq_messages = []
 
         for domain, link in breakdown.items():
             port_list = []
@@ -328,19 +365,37 @@ class ConnectionHandler:
                     continue
                 mq_link["evc_id"] = evc_id
 
-            producer = TopicQueueProducer(
-                timeout=5, exchange_name=exchange_name, routing_key=domain_name
-            )
-            producer.call(json.dumps(mq_link))
-            producer.stop_keep_alive()
-            sent_domains += 1
+            mq_messages.append((domain_name, mq_link))
 
-        if operation == "delete" and sent_domains == 0:
+        if operation == "delete" and not mq_messages:
             return (
                 "No provisioned OXP breakdowns found; connection removed locally",
                 200,
             )
 
+        # Publish to all the domains at the same time.
+        publisher = get_publisher()
+        errors = publisher.publish_concurrently(
+            MessageQueueNames.CONNECTIONS, mq_messages
+        )
+        failed_domains = [
+            f"{domain_name} ({error})"
+            for (domain_name, _), error in zip(mq_messages, errors)
+            if error is not None
+        ]
+        if failed_domains:
+            logger.error(
+                f"Could not publish '{operation}' for {connection_service_id} "
+                f"to: {failed_domains}"
+            )
+            return (
+                f"Could not publish breakdown to domains: {', '.join(failed_domains)}",
+                503,
+            )
+
+        # A broker confirm only means that the delete requests were
+        # queued, not that the OXPs have torn the connection down, so
+        # give them time to propagate either way.
         if operation == "delete" and DELETE_PROPAGATION_WAIT_SECONDS > 0:
             logger.info(
                 f"Waiting {DELETE_PROPAGATION_WAIT_SECONDS}s for delete propagation."
@@ -357,7 +412,8 @@ class ConnectionHandler:
         self, te_manager, service_id, connection_request
     ) -> Tuple[str, int]:
         try:
-            te_manager.delete_connection(service_id)
+            with get_te_lock():
+                te_manager.delete_connection(service_id)
         except Exception as e:
             logger.info(
                 f"Failed to release local connection resources for {service_id}: {e}"
@@ -374,7 +430,9 @@ class ConnectionHandler:
         )
         try:
             self._process_path_to_db(
-                te_manager, operation="delete", connection_request=connection_request
+                te_manager,
+                operation="delete",
+                connection_request=connection_request,
             )
             topology_db_update(self.db_instance, te_manager)
         except Exception as e:
@@ -419,16 +477,16 @@ class ConnectionHandler:
 
         Note that we can return early if things fail.  Return value is
         a tuple of the form (reason, HTTP code).
+
+        The TE lock is held only while the path is found and its VLANs
+        and bandwidth are reserved.  The breakdown is saved and sent to
+        the OXPs after the lock is released.
         """
         # for num, val in enumerate(te_manager.get_topology_map().values()):
         #     logger.debug(f"TE topology #{num}: {val}")
 
         try:
-            graph, traffic_matrix = self._generate_graph_and_traffic_matrix(
-                te_manager, connection_request
-            )
-            if graph is None:
-                return "No SDX topology found", 424
+            breakdown, links, error = self._find_path(te_manager, connection_request)
         except RequestValidationError as request_err:
             err = traceback.format_exc().replace("\n", ", ")
             logger.error(
@@ -452,14 +510,15 @@ class ConnectionHandler:
                 f"{str(ctx)},{ctx.request_id},{ctx.domain_id},{ctx.ingress_port},{ctx.egress_port}, {ctx.ingress_user_port_tag}, {ctx.egress_user_port_tag}"
             )
             try:
-                breakdown = te_manager.generate_connection_breakdown_same_switch(
-                    ctx.request_id,
-                    ctx.domain_id,
-                    ctx.ingress_port,
-                    ctx.egress_port,
-                    ctx.ingress_user_port_tag,
-                    ctx.egress_user_port_tag,
-                )
+                with get_te_lock():
+                    breakdown = te_manager.generate_connection_breakdown_same_switch(
+                        ctx.request_id,
+                        ctx.domain_id,
+                        ctx.ingress_port,
+                        ctx.egress_port,
+                        ctx.ingress_user_port_tag,
+                        ctx.egress_user_port_tag,
+                    )
                 self.db_instance.add_key_value_pair_to_db(
                     MongoCollections.BREAKDOWNS, connection_request["id"], breakdown
                 )
@@ -491,39 +550,16 @@ class ConnectionHandler:
                 err = traceback.format_exc().replace("\n", ", ")
                 logger.error(f"Error when generating/publishing breakdown: {e} - {err}")
                 return f"Error: {e}", 410
-
-        # General case: traffic_matrix is not None
-        if traffic_matrix is None:
-            return (
-                "Request does not have a valid JSON or body is incomplete/incorrect",
-                400,
-            )
-
-        logger.info(f"Generated graph: '{graph}', traffic matrix: '{traffic_matrix}'")
-        try:
-            conn = te_manager.requests_connectivity(traffic_matrix)
-            if conn is False:
-                logger.error(f"Graph connectivity: {conn}")
-                raise TEError("No path is available, the graph is not connected", 412)
         except TEError as te_err:
             return f"PCE error: {te_err}", te_err.te_code
 
-        solver = TESolver(graph, traffic_matrix)
-        solution = solver.solve()
-        logger.debug(f"TESolver result: {solution}")
-
-        if solution is None or solution.connection_map is None:
-            return "Could not solve the request", 410
-
-        _, links = te_manager.get_links_on_path(solution)
+        if error is not None:
+            return error
 
         try:
             self.db_instance.add_key_value_pair_to_db(
                 MongoCollections.SOLUTIONS, connection_request["id"], links
             )
-            breakdown = te_manager.generate_connection_breakdown(
-                solution, connection_request
-            )
             self.db_instance.add_key_value_pair_to_db(
                 MongoCollections.BREAKDOWNS, connection_request["id"], breakdown
             )
@@ -549,11 +585,6 @@ class ConnectionHandler:
             # update topology in DB with updated states (bandwidth and available vlan pool)
             topology_db_update(self.db_instance, te_manager)
             return status, code
-        except TEError as te_err:
-            # We could probably return te_err.te_code instead of 400,
-            # but I don't think PCE should use HTTP error codes,
-            # because that violates abstraction boundaries.
-            return f"PCE error: {te_err}", te_err.te_code
         except Exception as e:
             err = traceback.format_exc().replace("\n", ", ")
             logger.error(f"Error when generating/publishing breakdown: {e} - {err}")
@@ -568,27 +599,15 @@ class ConnectionHandler:
 
         self.db_instance.delete_one_entry(MongoCollections.CONNECTIONS, service_id)
 
-        historical_connections_list = self.db_instance.get_value_from_db(
-            MongoCollections.HISTORICAL_CONNECTIONS, service_id
-        )
         # Current timestamp in seconds
-        timestamp = str(int(time.time()))
+        timestamp = int(time.time())
 
-        if historical_connections_list:
-            historical_connections_list.append(
-                {timestamp: {"connection": connection_request, "reason": reason}}
-            )
-            self.db_instance.add_key_value_pair_to_db(
-                MongoCollections.HISTORICAL_CONNECTIONS,
-                service_id,
-                historical_connections_list,
-            )
-        else:
-            self.db_instance.add_key_value_pair_to_db(
-                MongoCollections.HISTORICAL_CONNECTIONS,
-                service_id,
-                [{timestamp: {"connection": connection_request, "reason": reason}}],
-            )
+        self.db_instance.add_event_to_db(
+            MongoCollections.CONNECTION_HISTORY,
+            service_id,
+            timestamp,
+            {"connection": connection_request, "reason": reason},
+        )
         logger.debug(f"Archived connection: {service_id}")
 
     def remove_connection(
@@ -642,7 +661,8 @@ class ConnectionHandler:
             connection_status = connection_request.get("status")
 
         try:
-            te_manager.delete_connection(service_id)
+            with get_te_lock():
+                te_manager.delete_connection(service_id)
         except Exception as e:
             logger.info(
                 f"Failed to release local connection resources for {service_id}: {e}"
@@ -680,7 +700,9 @@ class ConnectionHandler:
 
         try:
             self._process_path_to_db(
-                te_manager, operation="delete", connection_request=connection_request
+                te_manager,
+                operation="delete",
+                connection_request=connection_request,
             )
         except Exception as e:
             logger.info(f"Failed to release path state for {service_id}: {e}")
@@ -706,19 +728,8 @@ class ConnectionHandler:
 
     def handle_link_failure(self, te_manager, failed_links):
         logger.debug("Handling connections that contain failed links.")
-        link_connections_dict = self.db_instance.get_value_from_db(
-            MongoCollections.LINKS, Constants.LINK_CONNECTIONS_DICT
-        )
-
-        if not link_connections_dict:
-            logger.debug("No connection has been placed yet.")
-            return
-
-        link_connections_dict = json.loads(link_connections_dict)
-        processed_service_ids = set()
-
+        simple_links = {}
         for link in failed_links:
-            logger.info(f"Handling link failure on {link['id']}")
             port_list = []
             if "ports" not in link:
                 continue
@@ -728,7 +739,22 @@ class ConnectionHandler:
                     continue
                 port_list.append(port_id)
 
-            simple_link = SimpleLink(port_list).to_string()
+            simple_links[link["id"]] = SimpleLink(port_list).to_string()
+
+        # Only fetch the index entries of the failed links.
+        link_connections_dict = self.db_instance.get_values_from_db(
+            MongoCollections.LINK_CONNECTIONS, simple_links.values()
+        )
+
+        if not link_connections_dict:
+            logger.debug("No connection has been placed on the failed links.")
+            return
+
+        processed_service_ids = set()
+
+        for link in failed_links:
+            logger.info(f"Handling link failure on {link['id']}")
+            simple_link = simple_links.get(link["id"])
 
             if simple_link in link_connections_dict:
                 logger.debug("Found failed link record!")
@@ -845,11 +871,9 @@ class ConnectionHandler:
         Returns:
             None
         """
-        port_connections_dict_json = self.db_instance.get_value_from_db(
-            MongoCollections.PORTS, Constants.PORT_CONNECTIONS_DICT
-        )
-        port_connections_dict = (
-            json.loads(port_connections_dict_json) if port_connections_dict_json else {}
+        port_connections_dict = self.db_instance.get_values_from_db(
+            MongoCollections.PORT_CONNECTIONS,
+            [port.id for port in uni_ports_up_to_down],
         )
 
         for port in uni_ports_up_to_down:
@@ -874,9 +898,7 @@ class ConnectionHandler:
                     )
                     logger.debug(f"Connection status updated for {service_id}")
             else:
-                logger.warning(
-                    f"Port not found in db {port.id} in {port_connections_dict}"
-                )
+                logger.warning(f"Port not found in db {port.id}")
 
     def handle_uni_ports_down_to_up(self, uni_ports_down_to_up):
         """
@@ -890,11 +912,9 @@ class ConnectionHandler:
         Returns:
             None
         """
-        port_connections_dict_json = self.db_instance.get_value_from_db(
-            MongoCollections.PORTS, Constants.PORT_CONNECTIONS_DICT
-        )
-        port_connections_dict = (
-            json.loads(port_connections_dict_json) if port_connections_dict_json else {}
+        port_connections_dict = self.db_instance.get_values_from_db(
+            MongoCollections.PORT_CONNECTIONS,
+            [port.id for port in uni_ports_down_to_up],
         )
         for port in uni_ports_down_to_up:
             if port.id in port_connections_dict:
@@ -920,28 +940,56 @@ class ConnectionHandler:
                     logger.debug(f"Connection status updated for {service_id}")
 
     def get_archived_connections(self, service_id: str):
-        historical_connections = self.db_instance.get_value_from_db(
-            MongoCollections.HISTORICAL_CONNECTIONS, service_id
+        archived_events = self.db_instance.get_events_from_db(
+            MongoCollections.CONNECTION_HISTORY, service_id
         )
+        historical_connections = [
+            {str(timestamp): event} for _, timestamp, event in archived_events
+        ]
         if not historical_connections:
             return None
         return historical_connections
 
+    def get_all_archived_connections(
+        self, limit=None, cursor=None, since=None, until=None
+    ):
+        """
+        Get archived connections of services, as `(service_id,
+        archived)` pairs in service_id order, and the cursor to get the
+        next page with (None if this is the last page).
+
+        With `limit`, at most that many services are returned, starting
+        after the service_id `cursor`.  With `since` and `until`, only
+        connections archived in that time are returned.  Without
+        `limit`, archived connections are read from the DB only as the
+        pairs are needed.
+        """
+        archived_events = self.db_instance.get_events_from_db(
+            MongoCollections.CONNECTION_HISTORY,
+            after_key=cursor,
+            since=since,
+            until=until,
+        )
+        archived = (
+            (service_id, [{str(timestamp): event} for _, timestamp, event in events])
+            for service_id, events in groupby(archived_events, key=itemgetter(0))
+        )
+        if not limit:
+            return archived, None
+
+        page = list(islice(archived, limit + 1))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = page[-1][0]
+        return iter(page), next_cursor
+
 
 def topology_db_update(db_instance, te_manager):
-    # update OXP topology in DB:
-    oxp_topology_map = te_manager.topology_manager.get_topology_map()
-    for domain_name, topology in oxp_topology_map.items():
-        msg_json = topology.to_dict()
-        db_instance.add_key_value_pair_to_db(
-            MongoCollections.TOPOLOGIES, domain_name, msg_json
-        )
-    # use 'latest_topo' as PK to save latest full topo to db
-    latest_topo = te_manager.topology_manager.get_topology().to_dict()
-    db_instance.add_key_value_pair_to_db(
-        MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY, latest_topo
-    )
-    logger.info("Save to database complete.")
+    # Update OXP topologies and the merged topology in DB.  This is
+    # done in the background, so that a burst of placements or
+    # removals is written once.
+    get_topology_store(db_instance).schedule_save(te_manager)
 
 
 def get_connection_status(db, service_id: str):
@@ -951,6 +999,173 @@ def get_connection_status(db, service_id: str):
     assert db is not None
     assert service_id is not None
 
+    request = db.read_from_db(MongoCollections.CONNECTIONS, service_id)
+    if not request:
+        logger.error(f"Can't find a connection request for {service_id}")
+        return {}
+    breakdown = db.read_from_db(MongoCollections.BREAKDOWNS, service_id)
+    return connection_status(
+        service_id,
+        request.get(service_id),
+        breakdown.get(service_id) if breakdown else None,
+    )
+
+
+def breakdown_domain_query(domain):
+    """
+    Return a query for breakdowns that have a segment in a domain,
+    given by its topology ID or by its name.
+
+    Domains are keys of a breakdown, which contain dots, so they are
+    matched with an expression rather than by field name.  No index
+    can serve such a query: the DB reads every breakdown to answer it,
+    and its cost grows with the number of connections rather than with
+    the number that match.
+    """
+    pattern = f"^({re.escape(SDX_TOPOLOGY_ID_prefix)})?{re.escape(domain)}(__|$)"
+    return {
+        "$expr": {
+            "$anyElementTrue": [
+                {
+                    "$map": {
+                        "input": {"$objectToArray": {"$ifNull": ["$value", {}]}},
+                        "as": "segment",
+                        "in": {
+                            "$regexMatch": {"input": "$$segment.k", "regex": pattern}
+                        },
+                    }
+                }
+            ]
+        }
+    }
+
+
+def get_connection_statuses(
+    db, limit=None, cursor=None, status=None, port_id=None, domain=None, fields=None
+):
+    """
+    Form a response to `GET /l2vpn/1.0`, as `(service_id, status)`
+    pairs of connections in service ID order, and the cursor to get
+    the next page with (None if this is the last page).
+
+    Connections can be filtered by `status`, by the `port_id` of an
+    endpoint, and by a `domain` in their breakdown; the filters are
+    done by the DB queries.  The domain filter scans all breakdowns
+    (see `breakdown_domain_query()`), and the IDs it finds are passed
+    to the connection query as one list.  With `fields`, only those
+    fields of each status are returned.  Connections and breakdowns
+    are each read with one query, and joined by service ID as both are
+    read, so that the pairs can be sent without holding all of them in
+    memory.
+    """
+    assert db is not None
+
+    rejected = str(ConnectionStateMachine.State.REJECTED)
+    query = {"value.status": {"$ne": rejected}}
+    if status == "error":
+        query["value.status"] = {"$nin": [*CONNECTION_STATE_STATUS, rejected]}
+    elif status is not None:
+        states = [
+            state
+            for state, state_status in CONNECTION_STATE_STATUS.items()
+            if state_status == status
+        ]
+        query["value.status"] = {"$in": states}
+    if port_id is not None:
+        query["$or"] = [
+            {"value.endpoints.port_id": port_id},
+            {"value.endpoints.id": port_id},
+            {"value.ingress_port.id": port_id},
+            {"value.egress_port.id": port_id},
+        ]
+    if domain is not None:
+        query["_id"] = {
+            "$in": [
+                next(iter(entry))
+                for entry in db.find_entries_in_collection(
+                    MongoCollections.BREAKDOWNS,
+                    query=breakdown_domain_query(domain),
+                    fields=(),
+                )
+            ]
+        }
+
+    # Breakdowns are needed only for endpoints and the path.
+    request_fields = None
+    read_breakdowns = True
+    if fields is not None and set(fields) <= set(BASIC_STATUS_FIELDS):
+        request_fields = ("name", "description", "status")
+        read_breakdowns = False
+
+    connections = db.find_entries_in_collection(
+        MongoCollections.CONNECTIONS,
+        query=query,
+        fields=request_fields,
+        after_key=cursor,
+        limit=limit + 1 if limit else None,
+    )
+
+    next_cursor = None
+    breakdown_query = None
+    if limit or domain is not None:
+        connections = list(connections)
+        if limit and len(connections) > limit:
+            connections = connections[:limit]
+            next_cursor = next(iter(connections[-1]))
+        # Read only the breakdowns of these connections.
+        breakdown_query = {"_id": {"$in": [next(iter(entry)) for entry in connections]}}
+
+    breakdowns = ()
+    if read_breakdowns:
+        breakdowns = db.find_entries_in_collection(
+            MongoCollections.BREAKDOWNS,
+            query=breakdown_query,
+            after_key=None if breakdown_query else cursor,
+        )
+
+    return (
+        _connection_statuses(join_by_key(connections, breakdowns), fields),
+        next_cursor,
+    )
+
+
+def _connection_statuses(joined, fields):
+    for service_id, request_dict, domains in joined:
+        response = connection_status(service_id, request_dict, domains)
+        if response:
+            value = response[service_id]
+            if fields is not None:
+                value = {key: value[key] for key in fields if key in value}
+            yield service_id, value
+
+
+def join_by_key(entries, others):
+    """
+    Join two sequences of `{key: value}` entries, both in key order, as
+    `(key, value, other_value)` tuples for each entry, where
+    `other_value` is None if `others` has no entry with that key.
+    Both are read only as they are needed.
+    """
+    others = iter(others)
+    other = next(others, None)
+    for entry in entries:
+        for key, value in entry.items():
+            while other is not None and next(iter(other)) < key:
+                other = next(others, None)
+            if other is not None and key in other:
+                yield key, value, other[key]
+            else:
+                yield key, value, None
+
+
+def connection_status(service_id, request_dict, domains):
+    """
+    Form the status of a connection from its request, and from its
+    breakdown by domain (None if it has no breakdown), as a
+    `{service_id: status}` dict.  The dict is empty for rejected
+    connections, but for those placed in the background, whose status
+    gives the reason they were rejected.
+    """
     # Find the name and description from the original connection
     # request for this service_id.
     name = "unknown"
@@ -968,42 +1183,42 @@ def get_connection_status(db, service_id: str):
 
     response = {}
 
-    request = db.read_from_db(MongoCollections.CONNECTIONS, service_id)
-    if not request:
-        logger.error(f"Can't find a connection request for {service_id}")
+    logger.debug(f"Found request for {service_id}: {request_dict}")
+    name = request_dict.get("name")
+    description = request_dict.get("description")
+    status = request_dict.get("status")
+    if status == str(ConnectionStateMachine.State.REJECTED):
+        if "placement_reason" in request_dict:
+            response[service_id] = {
+                "service_id": service_id,
+                "name": name,
+                "description": description,
+                "status": "error",
+                "reason": request_dict["placement_reason"],
+            }
         return response
-    else:
-        logger.info(f"Found request for {service_id}: {request}")
-        # We seem to have saved the original request in the form of a
-        # string into the DB, not a record.
-        request_dict = request.get(service_id)
-        name = request_dict.get("name")
-        description = request_dict.get("description")
-        status = request_dict.get("status")
-        if status == str(ConnectionStateMachine.State.REJECTED):
-            return response
-        qos_metrics = request_dict.get("qos_metrics")
-        scheduling = request_dict.get("scheduling")
-        notifications = request_dict.get("notifications")
-        oxp_response = request_dict.get("oxp_response")
-        status = parse_conn_status(status)
-        request_endpoints = request_dict.get("endpoints")  # spec version 2.0.0
-        if request_endpoints and len(request_endpoints) > 1:
-            request_uni_a = request_endpoints[0]
-            request_uni_z = request_endpoints[1]
-            request_uni_a_id = request_uni_a.get("port_id")
-            if request_uni_a_id is None:
-                request_uni_a_id = request_uni_a.get("id")
-            request_uni_z_id = request_uni_z.get("port_id")
-            if request_uni_z_id is None:
-                request_uni_z_id = request_uni_z.get("id")
-        else:  # spec version 1.0.0
-            request_uni_a = request_dict.get("ingress_port")
-            if request_uni_a_id:
-                request_uni_a_id = request_uni_a.get("id")
-            request_uni_z = request_dict.get("egress_port")
-            if request_uni_z_id:
-                request_uni_z_id = request_uni_z.get("id")
+    qos_metrics = request_dict.get("qos_metrics")
+    scheduling = request_dict.get("scheduling")
+    notifications = request_dict.get("notifications")
+    oxp_response = request_dict.get("oxp_response")
+    status = parse_conn_status(status)
+    request_endpoints = request_dict.get("endpoints")  # spec version 2.0.0
+    if request_endpoints and len(request_endpoints) > 1:
+        request_uni_a = request_endpoints[0]
+        request_uni_z = request_endpoints[1]
+        request_uni_a_id = request_uni_a.get("port_id")
+        if request_uni_a_id is None:
+            request_uni_a_id = request_uni_a.get("id")
+        request_uni_z_id = request_uni_z.get("port_id")
+        if request_uni_z_id is None:
+            request_uni_z_id = request_uni_z.get("id")
+    else:  # spec version 1.0.0
+        request_uni_a = request_dict.get("ingress_port")
+        if request_uni_a_id:
+            request_uni_a_id = request_uni_a.get("id")
+        request_uni_z = request_dict.get("egress_port")
+        if request_uni_z_id:
+            request_uni_z_id = request_uni_z.get("id")
 
     response[service_id] = {
         "service_id": service_id,
@@ -1012,12 +1227,11 @@ def get_connection_status(db, service_id: str):
         "status": status,
     }
 
-    breakdown = db.read_from_db(MongoCollections.BREAKDOWNS, service_id)
-    if not breakdown:
-        logger.info(f"Could not find breakdown for {service_id}")
+    if not domains:
+        logger.debug(f"Could not find breakdown for {service_id}")
         return response
 
-    logger.info(f"breakdown for {service_id}: {breakdown}")
+    logger.debug(f"breakdown for {service_id}: {domains}")
 
     # The breakdown we read from DB is in this shape:
     #
@@ -1060,9 +1274,6 @@ def get_connection_status(db, service_id: str):
     # See https://sdx-docs.readthedocs.io/en/latest/specs/provisioning-api-1.0.html#request-format-2
     #
 
-    domains = breakdown.get(service_id)
-    logger.info(f"domains for {service_id}: {domains.keys()}")
-
     for domain, breakdown in domains.items():
         uni_a_port = breakdown.get("uni_a").get("port_id")
         uni_a_vlan = breakdown.get("uni_a").get("tag").get("value")
@@ -1109,7 +1320,7 @@ def get_connection_status(db, service_id: str):
                 if endpoint_z not in response_endpoints
                 else None
             )
-        print(
+        logger.debug(
             f"endpoints info: {request_uni_a_id}, {request_uni_z_id}, {uni_a_port}, {uni_z_port}"
         )
 
@@ -1141,7 +1352,7 @@ def get_connection_status(db, service_id: str):
     if oxp_response:
         response[service_id]["oxp_response"] = oxp_response
 
-    logger.info(f"Formed a response: {response}")
+    logger.debug(f"Formed a response: {response}")
 
     return response
 
@@ -1165,12 +1376,4 @@ def parse_conn_status(conn_state):
     - under provisioning: when the L2VPN is still being provisioned by the OXPs
     - maintenance: when the L2VPN is being affected by a network maintenance
     """
-    state2status = {
-        "UP": "up",
-        "UNDER_PROVISIONING": "under provisioning",
-        "RECOVERING": "down",
-        "DOWN": "down",
-        "ERROR": "down",
-        "MODIFYING": "under provisioning",
-    }
-    return state2status.get(conn_state, "error")
+    return CONNECTION_STATE_STATUS.get(conn_state, "error")
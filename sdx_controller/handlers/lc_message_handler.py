@@ -1,19 +1,30 @@
-import json
 import logging
+import threading
 import time
 from copy import deepcopy
 
 from sdx_datamodel.connection_sm import ConnectionStateMachine
-from sdx_datamodel.constants import Constants, DomainStatus, MongoCollections
+from sdx_datamodel.constants import Constants, DomainStatus
 
 from sdx_controller.handlers.connection_handler import (
     ConnectionHandler,
     connection_state_machine,
 )
-from sdx_controller.utils.parse_helper import ParseHelper
+from sdx_controller.utils.connection_events import get_connection_events
+
+# MongoCollections.TOPOLOGY_HASHES is set up by db_utils.
+from sdx_controller.utils.db_utils import MongoCollections
+from sdx_controller.utils.parse_helper import LcMessage, ParseHelper, content_hash
+from sdx_controller.utils.te_lock import get_te_lock
+from sdx_controller.utils.topology_history import TopologyHistory
+from sdx_controller.utils.topology_store import get_topology_store
 
 logger = logging.getLogger(__name__)
 
+# Top-level topology fields that change when an OXP re-sends the same
+# topology, and so are left out of its content hash.
+TOPOLOGY_VOLATILE_KEYS = ("timestamp", "sent_time")
+
 
 class LcMessageHandler:
     def __init__(self, db_instance, te_manager):
@@ -21,6 +32,18 @@ class LcMessageHandler:
         self.te_manager = te_manager
         self.parse_helper = ParseHelper()
         self.connection_handler = ConnectionHandler(db_instance)
+        self.connection_events = get_connection_events()
+        self.topology_store = get_topology_store(db_instance)
+        self.topology_history = TopologyHistory(db_instance)
+        # Topology updates from different domains can be processed at
+        # the same time, but must not change the TE manager (or the
+        # domain list) at the same time, nor while placements and
+        # removals on other threads change it.
+        self.te_lock = get_te_lock()
+        # Content hash of the last topology applied, by domain.
+        self.topology_hashes = {}
+        self.stats_lock = threading.Lock()
+        self.topology_stats = {"updates": 0, "unchanged": 0}
 
     def _failed_patch_cleanup_is_complete(self, connection, breakdown):
         if not connection.get("rollback_on_failure"):
@@ -165,14 +188,50 @@ class LcMessageHandler:
                         )
                         service["vlan_range"] = [[1, 4095]]
 
+    def _get_topology_hash(self, domain_name):
+        topology_hash = self.topology_hashes.get(domain_name)
+        if topology_hash is None:
+            topology_hash = self.db_instance.get_value_from_db(
+                MongoCollections.TOPOLOGY_HASHES, domain_name
+            )
+            if topology_hash:
+                self.topology_hashes[domain_name] = topology_hash
+        return topology_hash
+
+    def _set_topology_hash(self, domain_name, topology_hash):
+        self.topology_hashes[domain_name] = topology_hash
+        self.db_instance.add_key_value_pair_to_db(
+            MongoCollections.TOPOLOGY_HASHES, domain_name, topology_hash
+        )
+
+    def _count_topology_update(self, name):
+        with self.stats_lock:
+            self.topology_stats[name] += 1
+
+    def get_topology_stats(self):
+        """
+        Return the number of topology updates applied, and of those
+        skipped because the topology had not changed.
+        """
+        with self.stats_lock:
+            return dict(self.topology_stats)
+
     def process_lc_json_msg(
         self,
         msg,
         latest_topo,
         domain_dict,
     ):
-        logger.info("MQ received message:" + str(msg))
-        msg_json = json.loads(msg)
+        if isinstance(msg, LcMessage):
+            message = msg
+        else:
+            message = self.parse_helper.parse_lc_message(msg)
+            if message is None:
+                logger.info(f"Ignoring message that is not a JSON object: {msg}")
+                return
+        logger.info(f"MQ received message: {message}")
+        msg_json = message.payload
+        logger.debug("MQ message payload: %s", msg_json)
 
         if (
             msg_json.get("msg_type")
@@ -208,14 +267,13 @@ class LcMessageHandler:
             )
 
             # Directly reflect LC/OXP status into controller DB
-            connection["status"] = new_status
-
-            self.db_instance.add_key_value_pair_to_db(
+            self.db_instance.update_fields_in_json(
                 MongoCollections.CONNECTIONS,
                 service_id,
-                connection,
+                {"status": new_status},
             )
             logger.info(f"Connection {service_id} status updated.")
+            self.connection_events.notify(service_id)
             return
         elif msg_json.get("msg_type") and msg_json["msg_type"] == "oxp_conn_response":
             logger.info("Received OXP connection response.")
@@ -326,57 +384,82 @@ class LcMessageHandler:
             # ToDo: eg: if 3 oxps in the breakdowns: (1) all up: up (2) parital down: remove_connection()
             # release successful oxp circuits if some are down: remove_connection() (3) count the responses
             # to finalize the status of the connection.
-            for field_name in (
-                "status",
-                "oxp_response",
-                "oxp_success_count",
-                "partial_cleanup_requested",
-                "late_cleanup_domains",
-                "rollback_on_failure",
-                "rollback_request",
-                "rollback_in_progress",
-            ):
-                if field_name in connection:
-                    self.db_instance.update_field_in_json(
-                        MongoCollections.CONNECTIONS,
-                        service_id,
-                        field_name,
-                        connection.get(field_name),
+            self.db_instance.update_fields_in_json(
+                MongoCollections.CONNECTIONS,
+                service_id,
+                {
+                    field_name: connection.get(field_name)
+                    for field_name in (
+                        "status",
+                        "oxp_response",
+                        "oxp_success_count",
+                        "partial_cleanup_requested",
+                        "late_cleanup_domains",
+                        "rollback_on_failure",
+                        "rollback_request",
+                        "rollback_in_progress",
                     )
+                    if field_name in connection
+                },
+            )
             logger.info("Connection updated: " + str(connection))
             if self._failed_patch_cleanup_is_complete(connection, breakdown):
                 self._rollback_failed_patch(service_id, connection)
+            # Wake requests waiting for this connection to settle.
+            self.connection_events.notify(service_id)
             return
 
         # topology message RPC from OXP: no exchange name is defined.
         msg_id = msg_json["id"]
         msg_version = msg_json["version"]
 
-        domain_name = self.parse_helper.find_domain_name(msg_id, ":")
+        domain_name = message.domain
+
+        # An OXP may send the same topology again; skip it before it
+        # reaches the TE manager or the database.
+        topology_hash = content_hash(msg_json, TOPOLOGY_VOLATILE_KEYS)
+        if domain_name in domain_dict and topology_hash == self._get_topology_hash(
+            domain_name
+        ):
+            self._count_topology_update("unchanged")
+            logger.info(f"Topology of {domain_name} is unchanged, skipping update.")
+            return
+
         msg_json["domain_name"] = domain_name
         self._sanitize_vlan_ranges(msg_json, latest_topo)
 
-        db_msg_id = str(msg_id) + "-" + str(msg_version)
-        # add message to db
-        self.db_instance.add_key_value_pair_to_db(
-            MongoCollections.TOPOLOGIES, db_msg_id, msg_json
-        )
+        # add message to topology history
+        self.topology_history.add_version(domain_name, msg_version, msg_json)
         logger.info("Save to database complete.")
-        logger.info("message ID:" + str(db_msg_id))
+        logger.info(f"Topology {domain_name} version: {msg_version}")
 
         # Update existing topology
-        if domain_name in domain_dict:
-            logger.info("Updating topo")
-            logger.debug(msg_json)
-            (
-                removed_nodes,
-                added_nodes,
-                removed_links,
-                added_links,
-                uni_ports_up_to_down,
-                uni_ports_down_to_up,
-            ) = self.te_manager.update_topology(msg_json)
-            logger.info("Updating topology in TE manager")
+        with self.te_lock:
+            existing_domain = domain_name in domain_dict
+            if existing_domain:
+                logger.info("Updating topo")
+                logger.debug(msg_json)
+                (
+                    removed_nodes,
+                    added_nodes,
+                    removed_links,
+                    added_links,
+                    uni_ports_up_to_down,
+                    uni_ports_down_to_up,
+                ) = self.te_manager.update_topology(msg_json)
+                logger.info("Updating topology in TE manager")
+            # Add new topology
+            else:
+                domain_dict[domain_name] = DomainStatus.UP
+                self.db_instance.add_key_value_pair_to_db(
+                    MongoCollections.DOMAINS, Constants.DOMAIN_DICT, domain_dict
+                )
+                logger.info("Adding topology to TE manager")
+                self.te_manager.add_topology(msg_json)
+            domain_sequence = self.topology_store.next_sequence()
+
+        if existing_domain:
+            # Removing and placing connections again take the TE lock.
             if removed_links and len(removed_links) > 0:
                 logger.info("Processing removed link.")
                 self.connection_handler.handle_link_removal(
@@ -399,25 +482,18 @@ class LcMessageHandler:
                     uni_ports_down_to_up
                 )
 
-        # Add new topology
-        else:
-            domain_dict[domain_name] = DomainStatus.UP
-            self.db_instance.add_key_value_pair_to_db(
-                MongoCollections.DOMAINS, Constants.DOMAIN_DICT, domain_dict
-            )
-            logger.info("Adding topology to TE manager")
-            self.te_manager.add_topology(msg_json)
-
         # Save to database
-        # ToDo: check if there is any change in topology update, if not, do not re-save to db.
         logger.info(f"Adding topology {domain_name} to db.")
-        self.db_instance.add_key_value_pair_to_db(
-            MongoCollections.TOPOLOGIES, msg_id, msg_json
-        )
-
-        latest_topo = self.te_manager.topology_manager.get_topology().to_dict()
+        self.topology_store.save_domain_topology(msg_id, msg_json, domain_sequence)
+
+        # The topology is copied with the TE lock held, and written once
+        # it is released.  Its sequence number keeps a copy taken earlier
+        # by the background writer from being written over it.
+        with self.te_lock:
+            latest_topo = self.te_manager.topology_manager.get_topology().to_dict()
+            latest_sequence = self.topology_store.next_sequence()
         # use 'latest_topo' as PK to save latest topo to db
-        self.db_instance.add_key_value_pair_to_db(
-            MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY, latest_topo
-        )
+        self.topology_store.save_latest_topology(latest_topo, latest_sequence)
+        self._set_topology_hash(domain_name, topology_hash)
+        self._count_topology_update("updates")
         logger.info("Save to database complete.")
@@ -0,0 +1,154 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Place connections in the background for every POST, rather than only
+# for requests with a "Prefer: respond-async" header.
+PLACEMENT_ASYNC = os.getenv("PLACEMENT_ASYNC", "false").lower() == "true"
+# Number of threads that place connections in the background.  They
+# take turns finding paths and reserving VLANs and bandwidth, which
+# hold the TE lock, while their DB writes and messages to OXPs overlap.
+PLACEMENT_WORKERS = int(os.getenv("PLACEMENT_WORKERS", 2))
+# Number of background placements that can be queued or running before
+# more are refused.
+PLACEMENT_QUEUE_SIZE = int(os.getenv("PLACEMENT_QUEUE_SIZE", 100))
+
+
+class PlacementQueueFull(Exception):
+    """
+    Raised when a placement is submitted while the queue is full.
+    """
+
+
+class PlacementQueue(object):
+    """
+    Place connections on a fixed number of worker threads.
+
+    At most `max_pending` placements can be queued or running at once;
+    submitting more raises PlacementQueueFull, so that a burst of
+    requests is refused rather than piling up.
+    """
+
+    def __init__(self, workers=PLACEMENT_WORKERS, max_pending=PLACEMENT_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.pending = threading.BoundedSemaphore(max(1, max_pending))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="placement"
+        )
+        self.lock = threading.Lock()
+        # Notified when the last queued or running placement is done.
+        self.idle = threading.Condition(self.lock)
+        self.tokens = itertools.count()
+        # token -> time queued, of placements not started yet.
+        self.queued = OrderedDict()
+        self.counters = {"running": 0, "completed": 0, "failed": 0}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, func, *args):
+        """
+        Queue `func(*args)`, and return a future for its result.
+        """
+        if not self.pending.acquire(blocking=False):
+            raise PlacementQueueFull("Placement queue is full")
+
+        token = next(self.tokens)
+        with self.lock:
+            self.queued[token] = time.monotonic()
+        try:
+            return self.executor.submit(self._run, token, func, args)
+        except Exception:
+            with self.lock:
+                self.queued.pop(token, None)
+                if not self.queued and not self.counters["running"]:
+                    self.idle.notify_all()
+            self.pending.release()
+            raise
+
+    def _run(self, token, func, args):
+        with self.lock:
+            wait = time.monotonic() - self.queued.pop(token)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.counters["running"] += 1
+
+        try:
+            return func(*args)
+        except Exception as exc:
+            with self.lock:
+                self.counters["failed"] += 1
+            logger.exception(f"Placement failed: {exc}")
+            raise
+        finally:
+            with self.lock:
+                self.counters["running"] -= 1
+                self.counters["completed"] += 1
+                if not self.queued and not self.counters["running"]:
+                    self.idle.notify_all()
+            self.pending.release()
+
+    def stats(self):
+        """
+        Return queue depth and time spent waiting in the queue, in
+        seconds.
+        """
+        now = time.monotonic()
+        with self.lock:
+            started = self.counters["completed"] + self.counters["running"]
+            return {
+                "workers": self.workers,
+                "queue_depth": len(self.queued),
+                "oldest_wait": (
+                    now - next(iter(self.queued.values())) if self.queued else 0.0
+                ),
+                "average_wait": self.total_wait / started if started else 0.0,
+                "max_wait": self.max_wait,
+                **self.counters,
+            }
+
+    def join(self, timeout=None):
+        """
+        Wait until no placement is queued or running.  Return False if
+        there still is one after `timeout` seconds.
+        """
+        with self.idle:
+            return self.idle.wait_for(
+                lambda: not self.queued and not self.counters["running"], timeout
+            )
+
+    def close(self):
+        """
+        Wait for queued placements to be done, and stop the workers.
+        """
+        self.executor.shutdown(wait=True)
+
+
+_placement_queue = None
+_placement_queue_lock = threading.Lock()
+
+
+def get_placement_queue():
+    """
+    Return the placement queue shared by this process.
+    """
+    global _placement_queue
+    with _placement_queue_lock:
+        if _placement_queue is None:
+            _placement_queue = PlacementQueue()
+        return _placement_queue
+
+
+def close_placement_queue():
+    """
+    Finish the placements of the shared placement queue, if there is
+    one.
+    """
+    with _placement_queue_lock:
+        if _placement_queue is not None:
+            _placement_queue.close()
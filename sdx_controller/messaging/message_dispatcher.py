@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+import logging
+import os
+import threading
+import time
+import zlib
+from queue import Queue
+
+logger = logging.getLogger(__name__)
+
+# Number of threads that process messages received from OXPs.
+MQ_CONSUMER_WORKERS = int(os.getenv("MQ_CONSUMER_WORKERS", 4))
+
+
+class _Worker(object):
+    def __init__(self, index):
+        self.index = index
+        self.queue = Queue()
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.busy_since = None
+        self.thread = threading.Thread(
+            target=self.run, name=f"mq-worker-{index}", daemon=True
+        )
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            func, args = item
+            start = time.monotonic()
+            self.busy_since = start
+            try:
+                func(*args)
+                self.processed += 1
+            except Exception as exc:
+                self.failed += 1
+                logger.exception(f"[MQ] worker {self.index} failed: {exc}")
+            finally:
+                self.busy_since = None
+                self.busy_time += time.monotonic() - start
+                self.queue.task_done()
+
+
+class MessageDispatcher(object):
+    """
+    Run message handlers on a pool of worker threads.
+
+    Each message is dispatched with a key, and all messages with the
+    same key go to the same worker.  Messages with the same key are
+    thus handled one at a time, in the order they were dispatched,
+    while messages with different keys can be handled in parallel.
+    """
+
+    def __init__(self, workers=MQ_CONSUMER_WORKERS):
+        self.started_at = time.monotonic()
+        self.workers = [_Worker(index) for index in range(max(1, workers))]
+        for worker in self.workers:
+            worker.thread.start()
+
+    def _worker_for(self, key):
+        # Not hash(), which is randomized for strings in each process.
+        index = zlib.crc32(str(key).encode()) % len(self.workers)
+        return self.workers[index]
+
+    def dispatch(self, key, func, *args):
+        """
+        Queue `func(*args)` on the worker that handles `key`.
+        """
+        self._worker_for(key).queue.put((func, args))
+
+    def join(self):
+        """
+        Wait until all queued messages have been handled.
+        """
+        for worker in self.workers:
+            worker.queue.join()
+
+    def stop(self):
+        """
+        Stop the workers once they have handled the queued messages.
+        """
+        for worker in self.workers:
+            worker.queue.put(None)
+        for worker in self.workers:
+            worker.thread.join()
+
+    def stats(self):
+        """
+        Return queue depth and utilization of the workers.
+
+        Utilization is the fraction of time since the dispatcher was
+        created that a worker has spent handling messages.
+        """
+        now = time.monotonic()
+        elapsed = max(now - self.started_at, 1e-9)
+        workers = []
+        for worker in self.workers:
+            busy_since = worker.busy_since
+            busy_time = worker.busy_time
+            if busy_since is not None:
+                busy_time += now - busy_since
+            workers.append(
+                {
+                    "queue_depth": worker.queue.qsize(),
+                    "busy": busy_since is not None,
+                    "processed": worker.processed,
+                    "failed": worker.failed,
+                    "utilization": min(1.0, busy_time / elapsed),
+                }
+            )
+        return {
+            "workers": len(workers),
+            "queue_depth": sum(worker["queue_depth"] for worker in workers),
+            "busy_workers": sum(1 for worker in workers if worker["busy"]),
+            "processed": sum(worker["processed"] for worker in workers),
+            "failed": sum(worker["failed"] for worker in workers),
+            "utilization": sum(worker["utilization"] for worker in workers)
+            / len(workers),
+            "per_worker": workers,
+        }
@@ -1,5 +1,4 @@
 #!/usr/bin/env python
-import json
 import logging
 import os
 import threading
@@ -8,6 +7,7 @@ import traceback
 from queue import Queue
 
 import pika
+from sdx_datamodel.connection_sm import ConnectionStateMachine
 from sdx_datamodel.constants import (
     Constants,
     DomainStatus,
@@ -21,12 +21,21 @@ from sdx_pce.topology.manager import TopologyManager
 from sdx_controller.handlers.connection_handler import (
     ConnectionHandler,
     connection_state_machine,
-    get_connection_status,
     parse_conn_status,
 )
 from sdx_controller.handlers.lc_message_handler import LcMessageHandler
+from sdx_controller.messaging.message_dispatcher import (
+    MQ_CONSUMER_WORKERS,
+    MessageDispatcher,
+)
 from sdx_controller.models import connection
-from sdx_controller.utils.parse_helper import ParseHelper
+from sdx_controller.utils.parse_helper import (
+    HEARTBEAT_MSG_TYPE,
+    ParseHelper,
+    loads_json,
+)
+from sdx_controller.utils.te_lock import get_te_lock
+from sdx_controller.utils.topology_store import get_topology_store
 
 MQ_HOST = os.getenv("MQ_HOST")
 MQ_PORT = os.getenv("MQ_PORT") or 5672
@@ -36,6 +45,11 @@ HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", 30))  # seconds
 HEARTBEAT_TOLERANCE = int(
     os.getenv("HEARTBEAT_TOLERANCE", 3)
 )  # consecutive missed heartbeats allowed
+# Number of unacknowledged messages the broker may deliver to us at once.
+MQ_PREFETCH_COUNT = int(os.getenv("MQ_PREFETCH_COUNT", 10))
+
+# Heartbeats are small; larger messages are never checked for being one.
+HEARTBEAT_MAX_SIZE = 1024
 
 
 # subscribe to the corresponding queue
@@ -47,12 +61,15 @@ MongoCollections.SOLUTIONS = "solutions"
 
 
 class HeartbeatMonitor:
-    def __init__(self, db_instance):
+    def __init__(self, db_instance, dispatcher=None):
         self.last_heartbeat = {}  # domain -> last heartbeat timestamp
         self.domain_status = {}  # domain -> current status (UP / UNKNOWN)
         self.lock = threading.Lock()
         self.monitoring = False
         self.db_instance = db_instance  # store DB instance
+        # Status changes are saved to the DB on the dispatcher, if there
+        # is one, so that recording a heartbeat never waits for the DB.
+        self.dispatcher = dispatcher
 
     def record_heartbeat(self, domain):
         """Record heartbeat from a domain and mark it as UP if previously UNKNOWN."""
@@ -62,27 +79,19 @@ class HeartbeatMonitor:
             previous_status = self.domain_status.get(domain)
             self.domain_status[domain] = DomainStatus.UP
 
-            # Update DB if status changed from UNKNOWN -> UP
-            if previous_status == DomainStatus.UNKNOWN:
-                logger.info(
-                    f"[HeartbeatMonitor] Domain {domain} is BACK UP after missed heartbeats."
-                )
-                domain_dict_from_db = self.db_instance.get_value_from_db(
-                    MongoCollections.DOMAINS, Constants.DOMAIN_DICT
-                )
-                if domain in domain_dict_from_db:
-                    domain_dict_from_db[domain] = DomainStatus.UP
-                    self.db_instance.add_key_value_pair_to_db(
-                        MongoCollections.DOMAINS,
-                        Constants.DOMAIN_DICT,
-                        domain_dict_from_db,
-                    )
+        # Update DB if status changed from UNKNOWN -> UP
+        if previous_status == DomainStatus.UNKNOWN:
+            logger.info(
+                f"[HeartbeatMonitor] Domain {domain} is BACK UP after missed heartbeats."
+            )
+            self._save_status(domain)
 
-            logger.debug(f"[HeartbeatMonitor] Heartbeat recorded for {domain}")
+        logger.debug(f"[HeartbeatMonitor] Heartbeat recorded for {domain}")
 
     def check_status(self):
         """Mark domains as UNKNOWN if heartbeats are missing."""
         now = time.time()
+        missing = []
         with self.lock:
             for domain, last_time in self.last_heartbeat.items():
                 if now - last_time > HEARTBEAT_TOLERANCE * HEARTBEAT_INTERVAL:
@@ -91,17 +100,33 @@ class HeartbeatMonitor:
                             f"[HeartbeatMonitor] Domain {domain} marked UNKNOWN (missed {HEARTBEAT_TOLERANCE} heartbeats)"
                         )
                         self.domain_status[domain] = DomainStatus.UNKNOWN
-
-                        domain_dict_from_db = self.db_instance.get_value_from_db(
-                            MongoCollections.DOMAINS, Constants.DOMAIN_DICT
-                        )
-                        if domain_dict_from_db and domain in domain_dict_from_db:
-                            domain_dict_from_db[domain] = DomainStatus.UNKNOWN
-                            self.db_instance.add_key_value_pair_to_db(
-                                MongoCollections.DOMAINS,
-                                Constants.DOMAIN_DICT,
-                                domain_dict_from_db,
-                            )
+                        missing.append(domain)
+
+        for domain in missing:
+            self._save_status(domain)
+
+    def _save_status(self, domain):
+        if self.dispatcher is None:
+            self._write_status(domain)
+        else:
+            # All on one key, so that writes of the domain dict do not
+            # overwrite each other.
+            self.dispatcher.dispatch("heartbeat", self._write_status, domain)
+
+    def _write_status(self, domain):
+        # The status is read when it is written, so that the latest one
+        # is saved even if the writes were queued out of order.
+        status = self.get_status(domain)
+        domain_dict_from_db = self.db_instance.get_value_from_db(
+            MongoCollections.DOMAINS, Constants.DOMAIN_DICT
+        )
+        if domain_dict_from_db and domain in domain_dict_from_db:
+            domain_dict_from_db[domain] = status
+            self.db_instance.add_key_value_pair_to_db(
+                MongoCollections.DOMAINS,
+                Constants.DOMAIN_DICT,
+                domain_dict_from_db,
+            )
 
     def get_status(self, domain):
         """Return the current status of a domain."""
@@ -124,8 +149,87 @@ class HeartbeatMonitor:
         t.start()
 
 
+def heartbeat_domain(props, message_body):
+    """
+    Return the domain that sent a heartbeat message, or None if the
+    message is not a heartbeat.
+
+    Heartbeats are recognized by a "type" message header when the
+    sender sets one.  Otherwise, only small messages that mention the
+    heartbeat type are parsed, so that topology updates and connection
+    responses are not parsed here.
+    """
+    headers = getattr(props, "headers", None)
+    if isinstance(headers, dict) and headers.get("type") == HEARTBEAT_MSG_TYPE:
+        if headers.get("domain"):
+            return headers.get("domain")
+
+    if isinstance(message_body, str):
+        message_body = message_body.encode()
+    if (
+        len(message_body) > HEARTBEAT_MAX_SIZE
+        or HEARTBEAT_MSG_TYPE.encode() not in message_body
+    ):
+        return None
+
+    try:
+        msg_json = loads_json(message_body)
+    except ValueError:
+        return None
+    if isinstance(msg_json, dict) and msg_json.get("type") == HEARTBEAT_MSG_TYPE:
+        return msg_json.get("domain")
+    return None
+
+
+def graph_node_indexes(graph):
+    """
+    Map the "id" of each node of a TE graph to the node's index in the
+    graph.
+    """
+    node_indexes = {}
+    for index, data in graph.nodes(data=True):
+        node_indexes.setdefault(data["id"], index)
+    return node_indexes
+
+
+def port_node_ids(topology):
+    """
+    Map the ID of each port of a topology to the ID of its node.
+    """
+    port_nodes = {}
+    for node in topology.nodes:
+        for port in node.ports:
+            port_nodes.setdefault(port.id, node.id)
+    return port_nodes
+
+
+def load_collection(db_instance, collection):
+    """
+    Read all entries of a collection into a `{key: value}` dict.
+    """
+    values = {}
+    for entry in db_instance.get_all_entries_in_collection(collection):
+        values.update(entry)
+    return values
+
+
+def message_key(message):
+    """
+    Return the key that orders the processing of an LcMessage.
+
+    Connection responses and status changes are keyed by service ID,
+    and topology updates by domain, so that messages about the same
+    connection or domain are processed in the order they arrived.
+    """
+    if message.msg_type in ("oxp_conn_response", "oxp_conn_status_change"):
+        return f"service:{message.payload.get('service_id')}"
+    if message.domain is not None:
+        return f"domain:{message.domain}"
+    return None
+
+
 class RpcConsumer(object):
-    def __init__(self, thread_queue, exchange_name, te_manager):
+    def __init__(self, thread_queue, exchange_name, te_manager, heartbeat_monitor=None):
         self.logger = logging.getLogger(__name__)
 
         self.logger.info(f"[MQ] Using amqp://{MQ_USER}@{MQ_HOST}:{MQ_PORT}")
@@ -148,51 +252,80 @@ class RpcConsumer(object):
         self._thread_queue = thread_queue
 
         self.te_manager = te_manager
+        self.heartbeat_monitor = heartbeat_monitor
+
+        self.dispatcher = None
+        self.lc_message_handler = None
+        self.recovery_timings = None
+        self.recovery_report = None
+
+        # While connections are being recovered on restart, messages
+        # that need state not yet recovered are held, keyed like in
+        # message_key().
+        self._recovery_lock = threading.Lock()
+        self._recovering = False
+        self._pending_services = None
+        self._held_messages = {}
 
         self._exit_event = threading.Event()
 
     def on_request(self, ch, method, props, message_body):
         response = message_body
-        self._thread_queue.put(message_body)
 
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=MQ_HOST,
-                port=MQ_PORT,
-                credentials=pika.PlainCredentials(username=MQ_USER, password=MQ_PASS),
-            )
-        )
-        self.channel = self.connection.channel()
+        # Record heartbeats right away, so that they are not delayed
+        # behind other messages waiting in the queue.
+        domain = None
+        if self.heartbeat_monitor is not None:
+            domain = heartbeat_domain(props, message_body)
+        if domain is not None:
+            self.heartbeat_monitor.record_heartbeat(domain)
+            self.logger.debug(f"Heart beat received from {domain}")
+        else:
+            self._thread_queue.put(message_body)
+
+        # Reply and acknowledge on the channel the message came in on.
+        try:
+            if props.reply_to:
+                ch.basic_publish(
+                    exchange=self.exchange_name,
+                    routing_key=props.reply_to,
+                    properties=pika.BasicProperties(
+                        correlation_id=props.correlation_id
+                    ),
+                    body=str(response),
+                )
+        except Exception as err:
+            self.logger.info(f"[MQ] encountered error when publishing: {err}")
 
         try:
-            ch.basic_publish(
-                exchange=self.exchange_name,
-                routing_key=props.reply_to,
-                properties=pika.BasicProperties(correlation_id=props.correlation_id),
-                body=str(response),
-            )
             ch.basic_ack(delivery_tag=method.delivery_tag)
         except Exception as err:
-            self.logger.info(f"[MQ] encountered error when publishing: {err}")
+            self.logger.info(f"[MQ] encountered error when acknowledging: {err}")
 
-    def start_consumer(self):
-        self.channel.basic_qos(prefetch_count=1)
+    def start_consumer(self, prefetch_count=MQ_PREFETCH_COUNT):
+        self.channel.basic_qos(prefetch_count=prefetch_count)
         self.channel.basic_consume(queue=SUB_QUEUE, on_message_callback=self.on_request)
 
         self.logger.info(" [MQ] Awaiting requests from queue: " + SUB_QUEUE)
         self.channel.start_consuming()
 
-    def start_sdx_consumer(self, thread_queue, db_instance):
-        rpc = RpcConsumer(thread_queue, "", self.te_manager)
+    def start_sdx_consumer(
+        self, thread_queue, db_instance, workers=MQ_CONSUMER_WORKERS
+    ):
+        self.dispatcher = MessageDispatcher(workers)
+        heartbeat_monitor = HeartbeatMonitor(db_instance, dispatcher=self.dispatcher)
+        heartbeat_monitor.start_monitoring()
+
+        rpc = RpcConsumer(
+            thread_queue, "", self.te_manager, heartbeat_monitor=heartbeat_monitor
+        )
         t1 = threading.Thread(target=rpc.start_consumer, args=(), daemon=True)
         t1.start()
 
         lc_message_handler = LcMessageHandler(db_instance, self.te_manager)
+        self.lc_message_handler = lc_message_handler
         parse_helper = ParseHelper()
 
-        heartbeat_monitor = HeartbeatMonitor(db_instance)
-        heartbeat_monitor.start_monitoring()
-
         latest_topo = {}
         domain_dict = {}
 
@@ -202,9 +335,7 @@ class RpcConsumer(object):
         domain_dict_from_db = db_instance.get_value_from_db(
             MongoCollections.DOMAINS, Constants.DOMAIN_DICT
         )
-        latest_topo_from_db = db_instance.get_value_from_db(
-            MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY
-        )
+        latest_topo_from_db = get_topology_store(db_instance).get_latest_topology()
 
         if domain_dict_from_db:
             domain_dict = domain_dict_from_db
@@ -221,164 +352,325 @@ class RpcConsumer(object):
             residul_bw = update_topology_manager.get_residul_bandwidth()
             logger.debug(residul_bw)
 
-        # If topologies already saved in db, use them to initialize te_manager
+        # If topologies already saved in db, use them to initialize
+        # te_manager.  This is done in the background, while messages
+        # for connections already recovered are processed.
         if domain_dict:
-            for domain in domain_dict.keys():
-                topology = db_instance.get_value_from_db(
-                    MongoCollections.TOPOLOGIES, SDX_TOPOLOGY_ID_prefix + domain
-                )
+            with self._recovery_lock:
+                self._recovering = True
+            threading.Thread(
+                target=self._recover,
+                args=(db_instance, domain_dict, residul_bw),
+                name="restart-recovery",
+                daemon=True,
+            ).start()
 
-                if not topology:
-                    continue
+        while not self._exit_event.is_set():
+            msg = thread_queue.get()
+            logger.debug("MQ received message: %s", msg)
 
-                # Get the actual thing minus the Mongo ObjectID.
-                self.te_manager.add_topology(topology)
-                logger.debug(f"Read {domain}: {topology}")
-            # update topology/pce state in TE Manager
+            # Parse each message once; handlers get the parsed message.
+            message = parse_helper.parse_lc_message(msg)
+            if message is None:
+                logger.debug("Non JSON message, ignored")
+                continue
 
-            graph = self.te_manager.generate_graph_te()
-            logger.debug(f"restart graph = {graph.nodes};{graph.edges}")
-            connections = db_instance.get_all_entries_in_collection(
-                MongoCollections.CONNECTIONS
-            )
-            if not connections:
-                logger.info("No connection was found")
-            else:
-                for connection in connections:
-                    service_id = next(iter(connection))
-                    status = get_connection_status(db_instance, service_id)
-                    logger.info(
-                        f"Restart: service_id: {service_id}, status: {status.get(service_id)}"
-                    )
-                    # 1. update the vlan tables in pce
-                    domain_breakdown = db_instance.get_value_from_db(
-                        MongoCollections.BREAKDOWNS, service_id
-                    )
-                    if not domain_breakdown:
-                        logger.warning(f"Could not find breakdown for {service_id}")
-                        continue
-                    try:
-                        vlan_tags_table = self.te_manager.vlan_tags_table
-                        for domain, segment in domain_breakdown.items():
-                            logger.debug(f"domain:{domain};segment:{segment}")
-                            domain_table = vlan_tags_table.get(domain.split("__", 1)[0])
-                            uni_a = segment.get("uni_a")
-                            vlan_table = domain_table.get(uni_a.get("port_id"))
-                            vlan_table[uni_a.get("tag").get("value")] = service_id
-                            uni_z = segment.get("uni_z")
-                            vlan_table = domain_table.get(uni_z.get("port_id"))
-                            vlan_table[uni_z.get("tag").get("value")] = service_id
-                    except Exception as e:
-                        err = traceback.format_exc().replace("\n", ", ")
-                        logger.error(
-                            f"Error when recovering breakdown vlan assignment: {e} - {err}"
-                        )
-                        return f"Error: {e}", 410
-            logger.debug(f"Restart: solutions for {connections}")
-            connectionSolution_list = self.te_manager.connectionSolution_list
-            connections = db_instance.get_all_entries_in_collection(
-                MongoCollections.CONNECTIONS
+            if message.msg_type == HEARTBEAT_MSG_TYPE:
+                heartbeat_monitor.record_heartbeat(message.domain)
+                logger.debug(f"Heart beat received from {message.domain}")
+                continue
+
+            self._dispatch_lc_message(
+                message, lc_message_handler, message, latest_topo, domain_dict
             )
-            if not connections:
-                logger.info("No connection was found")
-            else:
-                for connection in connections:
+
+    def _dispatch_lc_message(self, message, *args):
+        """
+        Dispatch an LC message, or hold it until the state it needs has
+        been recovered.
+        """
+        key = message_key(message)
+        with self._recovery_lock:
+            if self._recovering and self._waits_for_recovery(message):
+                self._held_messages.setdefault(key, []).append(args)
+                return
+            self.dispatcher.dispatch(key, self._process_lc_message, *args)
+
+    def _waits_for_recovery(self, message):
+        # Messages about a connection wait until that connection has
+        # been recovered.  Topology updates change the TE manager's
+        # topology, so they wait until recovery is over.
+        if not (message_key(message) or "").startswith("service:"):
+            return True
+        service_id = message.payload.get("service_id")
+        return self._pending_services is None or service_id in self._pending_services
+
+    def _release_held_messages(self, key):
+        for args in self._held_messages.pop(key, []):
+            self.dispatcher.dispatch(key, self._process_lc_message, *args)
+
+    def _service_recovered(self, service_id):
+        with self._recovery_lock:
+            if self._pending_services is not None:
+                self._pending_services.discard(service_id)
+            self._release_held_messages(f"service:{service_id}")
+
+    def _recovery_done(self):
+        with self._recovery_lock:
+            self._recovering = False
+            # Held messages are released in the order they arrived in.
+            for key in list(self._held_messages):
+                self._release_held_messages(key)
+
+    def _recover(self, db_instance, domain_dict, residul_bw):
+        """
+        Recover the state of the TE manager from the DB on restart.
+
+        Records that cannot be recovered are quarantined and reported,
+        rather than stopping the recovery of the others.
+        """
+        report = {
+            "completed": False,
+            "recovered": 0,
+            "skipped": 0,
+            "quarantined": [],
+            "timings": {},
+        }
+        self.recovery_report = report
+        timings = report["timings"]
+        try:
+            phase_start = time.monotonic()
+            with get_te_lock():
+                for domain in domain_dict.keys():
                     try:
-                        service_id = next(iter(connection))
-                        response = get_connection_status(db_instance, service_id)
-                        if not response:
-                            continue
-                        qos_metrics = response[service_id].get("qos_metrics")
-                        if not qos_metrics:
-                            continue
-                        min_bw = qos_metrics.get("min_bw", {"value": 0.0}).get(
-                            "value", 0
-                        )
-                        logger.debug(f"service_id:{service_id}, {response}")
-                        solution_links = db_instance.get_value_from_db(
-                            MongoCollections.SOLUTIONS, service_id
-                        )
-                        logger.debug(
-                            f"service_id:{service_id};solution:{solution_links}"
+                        topology = db_instance.get_value_from_db(
+                            MongoCollections.TOPOLOGIES, SDX_TOPOLOGY_ID_prefix + domain
                         )
-                        if not solution_links:
-                            logger.warning(
-                                f"Could not find solution in DB for {service_id}"
-                            )
+
+                        if not topology:
                             continue
-                        links = []
-                        for link in solution_links:
-                            source_node = self.te_manager.topology_manager.get_topology().get_node_by_port(
-                                link.get("source")
-                            )
-                            destination_node = self.te_manager.topology_manager.get_topology().get_node_by_port(
-                                link.get("destination")
-                            )
-                            source = [
-                                x
-                                for x, y in graph.nodes(data=True)
-                                if y["id"] == source_node.id
-                            ]
-
-                            destination = [
-                                x
-                                for x, y in graph.nodes(data=True)
-                                if y["id"] == destination_node.id
-                            ]
-                            links.append(
-                                {"source": source[0], "destination": destination[0]}
-                            )
-                        # rebuild solution object
-                        request = ConnectionRequest(
-                            source=0,
-                            destination=0,
-                            required_bandwidth=min_bw,
-                            required_latency=float("inf"),
-                        )
-                        link_map = [
-                            ConnectionPath(link.get("source"), link.get("destination"))
-                            for link in links
-                        ]
-                        solution = ConnectionSolution(
-                            connection_map={request: link_map},
-                            cost=0,
-                            request_id=service_id,
-                        )
-                        connectionSolution_list.append(solution)
+
+                        # Get the actual thing minus the Mongo ObjectID.
+                        self.te_manager.add_topology(topology)
+                        logger.debug(f"Read {domain}: {topology}")
                     except Exception as e:
-                        err = traceback.format_exc().replace("\n", ", ")
-                        logger.error(
-                            f"Error when recovering solution list: {e} - {err}"
-                        )
-                        return f"Error: {e}", 410
+                        self._quarantine(report, "load_topology", e, domain=domain)
+                # update topology/pce state in TE Manager
+
+                graph = self.te_manager.generate_graph_te()
+                logger.debug(f"restart graph = {graph.nodes};{graph.edges}")
+            timings["load_topologies"] = time.monotonic() - phase_start
+
+            self._recover_connections(db_instance, graph, report)
+
+            phase_start = time.monotonic()
             logger.debug(f"Restart: residul_bw")
             if residul_bw:
-                self.te_manager.update_available_bw_in_topology(residul_bw)
+                with get_te_lock():
+                    self.te_manager.update_available_bw_in_topology(residul_bw)
+            timings["residual_bandwidth"] = time.monotonic() - phase_start
+            report["completed"] = True
+        except Exception as e:
+            err = traceback.format_exc().replace("\n", ", ")
+            logger.error(f"Restart: recovery stopped: {e} - {err}")
+        finally:
+            self.recovery_timings = timings
+            self._recovery_done()
+
+        logger.info(
+            f"Restart: recovered {report['recovered']} connections, "
+            f"skipped {report['skipped']}, "
+            f"quarantined {len(report['quarantined'])}; "
+            + ", ".join(f"{phase}: {took:.3f}s" for phase, took in timings.items())
+        )
+        for entry in report["quarantined"]:
+            logger.warning(f"Restart: quarantined {entry}")
+        return report
 
-        while not self._exit_event.is_set():
-            msg = thread_queue.get()
-            logger.debug("MQ received message:" + str(msg))
+    def _quarantine(self, report, phase, error, **record):
+        err = traceback.format_exc().replace("\n", ", ")
+        logger.error(f"Restart: {phase} failed for {record}: {error} - {err}")
+        record.update({"phase": phase, "error": str(error)})
+        report["quarantined"].append(record)
 
-            if not parse_helper.is_json(msg):
-                logger.debug("Non JSON message, ignored")
-                continue
+    def _recover_connections(self, db_instance, graph, report):
+        """
+        Restore the VLAN tables and the solution list of the TE manager
+        from the connections, breakdowns and solutions in the DB.
 
-            msg_json = json.loads(msg)
-            if "type" in msg_json and msg_json.get("type") == "Heart Beat":
-                domain = msg_json.get("domain")
-                heartbeat_monitor.record_heartbeat(domain)
-                logger.debug(f"Heart beat received from {domain}")
-                continue
+        The three collections are each read once, and joined in memory
+        by service ID.  A connection that cannot be restored is added
+        to the quarantine list of `report`, and the others are still
+        restored.  Time spent in each phase is added to the report.
+        """
+        timings = report["timings"]
+        phase_start = time.monotonic()
+        connections = load_collection(db_instance, MongoCollections.CONNECTIONS)
+        breakdowns = load_collection(db_instance, MongoCollections.BREAKDOWNS)
+        solutions = load_collection(db_instance, MongoCollections.SOLUTIONS)
+        timings["load_connections"] = time.monotonic() - phase_start
+
+        with self._recovery_lock:
+            self._pending_services = set(connections)
+
+        if not connections:
+            logger.info("No connection was found")
+            return
+
+        phase_start = time.monotonic()
+        vlan_tags_table = self.te_manager.vlan_tags_table
+        connectionSolution_list = self.te_manager.connectionSolution_list
+        # Look up nodes of solution links in maps built once, rather
+        # than by searching the topology and the graph for each link.
+        node_indexes = graph_node_indexes(graph)
+        with get_te_lock():
+            port_nodes = port_node_ids(self.te_manager.topology_manager.get_topology())
 
+        for service_id, connection in connections.items():
             try:
-                lc_message_handler.process_lc_json_msg(
-                    msg,
-                    latest_topo,
-                    domain_dict,
+                # The lock is taken for one connection at a time, so
+                # that messages of recovered services are not held up
+                # until the whole recovery is done.
+                with get_te_lock():
+                    recovered = self._recover_connection(
+                        service_id,
+                        connection,
+                        breakdowns.get(service_id),
+                        solutions.get(service_id),
+                        vlan_tags_table,
+                        connectionSolution_list,
+                        node_indexes,
+                        port_nodes,
+                        report,
+                    )
+                report["recovered" if recovered else "skipped"] += 1
+            finally:
+                self._service_recovered(service_id)
+
+        timings["rebuild_connections"] = time.monotonic() - phase_start
+
+    def _recover_connection(
+        self,
+        service_id,
+        connection,
+        domain_breakdown,
+        solution_links,
+        vlan_tags_table,
+        connectionSolution_list,
+        node_indexes,
+        port_nodes,
+        report,
+    ):
+        """
+        Restore the VLAN tags and the solution of one connection.
+
+        Returns True if the connection was restored, and False if it
+        was skipped or quarantined.
+        """
+        if not isinstance(connection, dict):
+            return False
+        status = connection.get("status")
+        logger.info(f"Restart: service_id: {service_id}, status: {status}")
+
+        # 1. update the vlan tables in pce
+        if not domain_breakdown:
+            logger.warning(f"Could not find breakdown for {service_id}")
+            return False
+        try:
+            # Find all the tags before taking any, so that a bad
+            # breakdown does not leave some of its tags taken.
+            tags = []
+            for domain, segment in domain_breakdown.items():
+                logger.debug(f"domain:{domain};segment:{segment}")
+                domain_table = vlan_tags_table[domain.split("__", 1)[0]]
+                for uni in (segment["uni_a"], segment["uni_z"]):
+                    tags.append((domain_table[uni["port_id"]], uni["tag"]["value"]))
+        except Exception as e:
+            self._quarantine(report, "breakdown", e, service_id=service_id)
+            return False
+        for vlan_table, tag in tags:
+            vlan_table[tag] = service_id
+
+        # 2. rebuild the solution of the connection
+        if status == str(ConnectionStateMachine.State.REJECTED):
+            return False
+        qos_metrics = connection.get("qos_metrics")
+        if not qos_metrics:
+            return False
+        logger.debug(f"service_id:{service_id};solution:{solution_links}")
+        if not solution_links:
+            logger.warning(f"Could not find solution in DB for {service_id}")
+            return False
+        try:
+            min_bw = qos_metrics.get("min_bw", {"value": 0.0}).get("value", 0)
+            links = []
+            for link in solution_links:
+                source_node_id = port_nodes[link.get("source")]
+                destination_node_id = port_nodes[link.get("destination")]
+                links.append(
+                    {
+                        "source": node_indexes[source_node_id],
+                        "destination": node_indexes[destination_node_id],
+                    }
                 )
-            except Exception as exc:
-                err = traceback.format_exc().replace("\n", ", ")
-                logger.error(f"Failed to process LC message: {exc} -- {err}")
+            # rebuild solution object
+            request = ConnectionRequest(
+                source=0,
+                destination=0,
+                required_bandwidth=min_bw,
+                required_latency=float("inf"),
+            )
+            link_map = [
+                ConnectionPath(link.get("source"), link.get("destination"))
+                for link in links
+            ]
+            solution = ConnectionSolution(
+                connection_map={request: link_map},
+                cost=0,
+                request_id=service_id,
+            )
+        except Exception as e:
+            self._quarantine(report, "solution", e, service_id=service_id)
+            return False
+        connectionSolution_list.append(solution)
+        return True
+
+    def _process_lc_message(
+        self, lc_message_handler, message, latest_topo, domain_dict
+    ):
+        # Errors are left to the dispatcher worker, which logs them and
+        # counts them as failed messages.
+        lc_message_handler.process_lc_json_msg(
+            message,
+            latest_topo,
+            domain_dict,
+        )
+
+    def get_dispatcher_stats(self):
+        """
+        Return queue depth and worker utilization of the dispatcher
+        that processes LC messages, or None if it is not running.
+        """
+        if self.dispatcher is None:
+            return None
+        return self.dispatcher.stats()
+
+    def get_recovery_report(self):
+        """
+        Return counts of connections recovered on restart, the records
+        that were quarantined, and time spent in each phase, or None if
+        there was nothing to recover.
+        """
+        return self.recovery_report
+
+    def get_topology_stats(self):
+        """
+        Return counts of topology updates applied and skipped as
+        unchanged, or None if the consumer is not running.
+        """
+        if self.lc_message_handler is None:
+            return None
+        return self.lc_message_handler.get_topology_stats()
 
     def stop_threads(self):
         """
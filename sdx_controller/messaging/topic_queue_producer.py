@@ -5,8 +5,11 @@ import os
 import threading
 import time
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
 
 import pika
+from pika.exceptions import AMQPError, NackError, UnroutableError
 from sdx_datamodel.constants import MessageQueueNames
 
 MQ_HOST = os.getenv("MQ_HOST")
@@ -14,22 +17,65 @@ MQ_PORT = os.getenv("MQ_PORT") or 5672
 MQ_USER = os.getenv("MQ_USER") or "guest"
 MQ_PASS = os.getenv("MQ_PASS") or "guest"
 
+# Number of connections used to publish messages concurrently.
+MQ_PUBLISHER_POOL_SIZE = int(os.getenv("MQ_PUBLISHER_POOL_SIZE", "4"))
+# Wait for the broker to confirm each published message, and report
+# messages that it rejects or cannot route to any queue as failed.
+MQ_PUBLISHER_CONFIRMS = os.getenv("MQ_PUBLISHER_CONFIRMS", "true").lower() == "true"
+# Number of messages that can be waiting to be published (or confirmed)
+# before publish_many() makes its caller wait.
+MQ_PUBLISHER_MAX_PENDING = int(os.getenv("MQ_PUBLISHER_MAX_PENDING", "1000"))
+# Most messages that publish_many() gives one publisher at a time.
+MQ_PUBLISHER_BATCH_SIZE = int(os.getenv("MQ_PUBLISHER_BATCH_SIZE", "100"))
+
+
+def _connection_parameters():
+    return pika.ConnectionParameters(
+        host=MQ_HOST,
+        port=MQ_PORT,
+        credentials=pika.PlainCredentials(username=MQ_USER, password=MQ_PASS),
+    )
+
+
+def _add_sent_time(body):
+    """
+    Stamp a message with the time it is sent, if it is a JSON object.
+    """
+    current_time = int(time.time())
+
+    if isinstance(body, dict):
+        body["sent_time"] = current_time
+        return json.dumps(body)
+    elif isinstance(body, str):
+        try:
+            parsed = json.loads(body)
+            if isinstance(parsed, dict):
+                parsed["sent_time"] = current_time
+                return json.dumps(parsed)
+        except json.JSONDecodeError:
+            # Not a valid JSON string, leave as is
+            pass
+
+    return str(body)
+
 
 class TopicQueueProducer(object):
-    """Publish messages on a message queue."""
+    """
+    Publish messages on a message queue.
+
+    With `confirm` set, the channel is put in confirm mode, and
+    `call()` tells whether the broker accepted the message.
+    """
 
-    def __init__(self, timeout, exchange_name, routing_key):
+    def __init__(self, timeout, exchange_name, routing_key, confirm=False):
         self.logger = logging.getLogger(__name__)
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=MQ_HOST,
-                port=MQ_PORT,
-                credentials=pika.PlainCredentials(username=MQ_USER, password=MQ_PASS),
-            )
-        )
+        self.connection = pika.BlockingConnection(_connection_parameters())
 
         self.channel = self.connection.channel()
         self.timeout = timeout
+        self.confirm = confirm
+        if self.confirm:
+            self.channel.confirm_delivery()
 
         self.exchange_name = exchange_name
         self.routing_key = routing_key
@@ -80,25 +126,309 @@ class TopicQueueProducer(object):
             f"routing_key: {self.routing_key}"
         )
 
-        current_time = int(time.time())
+        body = _add_sent_time(body)
 
-        if isinstance(body, dict):
-            body["sent_time"] = current_time
-        elif isinstance(body, str):
-            try:
-                parsed = json.loads(body)
-                if isinstance(parsed, dict):
-                    parsed["sent_time"] = current_time
-                    body = json.dumps(parsed)
-            except json.JSONDecodeError:
-                # Not a valid JSON string, leave as is
-                pass
-
-        self.channel.basic_publish(
-            exchange=self.exchange_name, routing_key=self.routing_key, body=str(body)
+        try:
+            # With `mandatory`, a message that no queue is bound to
+            # receive is returned, rather than dropped.
+            self.channel.basic_publish(
+                exchange=self.exchange_name,
+                routing_key=self.routing_key,
+                body=body,
+                mandatory=self.confirm,
+            )
+        except (NackError, UnroutableError) as err:
+            # Raised only in confirm mode, when the broker did not
+            # accept or could not route the message.
+            self.logger.error(f"Message was not confirmed by the broker: {err}")
+            return "Failure"
+        return "Success"
+
+
+class TopicQueuePublisher(object):
+    """
+    Publish messages on topic exchanges over one long-lived connection.
+
+    Unlike TopicQueueProducer, this keeps its connection and channel
+    open between messages, declares each exchange only once, and
+    reconnects when the connection has been lost.  Methods can be
+    called from several threads.
+
+    With `confirm` set, the channel is put in confirm mode, and
+    messages are published as mandatory, so that a message the broker
+    rejected (NackError) or could not route to any queue
+    (UnroutableError) is reported as failed.
+    """
+
+    def __init__(self, connection_parameters=None, confirm=False):
+        self.logger = logging.getLogger(__name__)
+        self.connection_parameters = connection_parameters or _connection_parameters()
+        self.confirm = confirm
+        self.connection = None
+        self.channel = None
+        self.declared_exchanges = set()
+        self.lock = threading.RLock()
+
+    def _connect(self):
+        self.logger.info(
+            f"Connecting publisher to MQ_HOST: {MQ_HOST}, MQ_PORT: {MQ_PORT}"
         )
+        self.connection = pika.BlockingConnection(self.connection_parameters)
+        self.channel = self.connection.channel()
+        if self.confirm:
+            # basic_publish() then waits for the broker to confirm each
+            # message, and raises if it was not accepted.
+            self.channel.confirm_delivery()
+        # Exchanges need to be declared again on a new channel.
+        self.declared_exchanges = set()
+
+    def _ensure_channel(self):
+        if self.connection is not None and self.connection.is_open:
+            try:
+                # Service heartbeats, and notice if the broker has
+                # closed the connection while we were idle.
+                self.connection.process_data_events(time_limit=0)
+            except AMQPError as err:
+                self.logger.info(f"Publisher connection lost: {err}")
+                self._close_quietly()
+
+        if (
+            self.connection is None
+            or not self.connection.is_open
+            or self.channel is None
+            or not self.channel.is_open
+        ):
+            self._close_quietly()
+            self._connect()
+
+    def _ensure_exchange(self, exchange_name):
+        if exchange_name not in self.declared_exchanges:
+            self.channel.exchange_declare(exchange=exchange_name, exchange_type="topic")
+            self.declared_exchanges.add(exchange_name)
+
+    def _close_quietly(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except AMQPError as err:
+            self.logger.debug(f"Error when closing publisher connection: {err}")
+        self.connection = None
+        self.channel = None
+
+    def _publish_messages(self, exchange_name, messages):
+        errors = []
+        for routing_key, body in messages:
+            try:
+                # With `mandatory`, a message that no queue is bound to
+                # receive is returned, rather than dropped.
+                self.channel.basic_publish(
+                    exchange=exchange_name,
+                    routing_key=routing_key,
+                    body=body,
+                    mandatory=self.confirm,
+                )
+                errors.append(None)
+            except (NackError, UnroutableError) as err:
+                # Raised only in confirm mode, for this message alone;
+                # the channel can still be used for the next ones.
+                errors.append(err)
+        return errors
+
+    def publish_batch(self, exchange_name, messages, max_retries=2):
+        """
+        Publish `(routing_key, body)` messages, reconnecting to the
+        broker if needed.
+
+        Returns a list with, for each message in order, None if it was
+        published (and confirmed, in confirm mode), or the error it
+        failed with.  Errors of the connection are raised instead, once
+        the retries are used up.
+        """
+        messages = [
+            (routing_key, _add_sent_time(body)) for routing_key, body in messages
+        ]
+        for routing_key, body in messages:
+            self.logger.info(
+                f"Publishing link: {body}, "
+                f"exchange_name: {exchange_name}, "
+                f"routing_key: {routing_key}"
+            )
+
+        with self.lock:
+            for attempt in range(1, max_retries + 1):
+                try:
+                    self._ensure_channel()
+                    self._ensure_exchange(exchange_name)
+                    return self._publish_messages(exchange_name, messages)
+                except AMQPError as err:
+                    self.logger.warning(
+                        f"Publish attempt {attempt}/{max_retries} failed: {err}"
+                    )
+                    self._close_quietly()
+                    if attempt == max_retries:
+                        raise
+
+    def publish(self, exchange_name, routing_key, body, max_retries=2):
+        """
+        Publish a message, reconnecting to the broker if needed.
+        """
+        error = self.publish_batch(
+            exchange_name, [(routing_key, body)], max_retries=max_retries
+        )[0]
+        if error is not None:
+            raise error
         return "Success"
 
+    def close(self):
+        with self.lock:
+            self._close_quietly()
+
+
+class TopicQueuePublisherPool(object):
+    """
+    A fixed number of publishers, each with its own connection, so
+    that several messages can be published at the same time.
+    """
+
+    def __init__(
+        self,
+        size,
+        confirm=False,
+        connection_parameters=None,
+        max_pending=MQ_PUBLISHER_MAX_PENDING,
+    ):
+        self.size = max(1, size)
+        self.confirm = confirm
+        self.pending = threading.BoundedSemaphore(max(1, max_pending))
+        self.publishers = Queue()
+        for _ in range(self.size):
+            self.publishers.put(
+                TopicQueuePublisher(
+                    connection_parameters=connection_parameters, confirm=confirm
+                )
+            )
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.size, thread_name_prefix="mq-publisher"
+        )
+
+    def publish(self, exchange_name, routing_key, body):
+        """
+        Publish a message on the next available publisher.
+        """
+        publisher = self.publishers.get()
+        try:
+            return publisher.publish(exchange_name, routing_key, body)
+        finally:
+            self.publishers.put(publisher)
+
+    def publish_many(self, exchange_name, messages):
+        """
+        Publish `(routing_key, body)` messages concurrently, and return
+        a future for each of them.
+
+        Messages are split into batches, at most one per publisher,
+        that the publishers send at the same time.  A future completes
+        when its message has been published (and confirmed, in confirm
+        mode), or fails with the error it failed with.  When too many
+        messages are pending, this waits for some of them to complete
+        before queueing more.
+        """
+        messages = list(messages)
+        batch_size = min(MQ_PUBLISHER_BATCH_SIZE, -(-len(messages) // self.size))
+        futures = []
+        batch = []
+        for routing_key, body in messages:
+            if not self.pending.acquire(blocking=False):
+                # Send what we have, which may be what we wait for.
+                if batch:
+                    self._submit_batch(exchange_name, batch)
+                    batch = []
+                self.pending.acquire()
+            future = Future()
+            future.add_done_callback(lambda _: self.pending.release())
+            futures.append(future)
+            batch.append((routing_key, body, future))
+            if len(batch) >= batch_size:
+                self._submit_batch(exchange_name, batch)
+                batch = []
+        if batch:
+            self._submit_batch(exchange_name, batch)
+        return futures
+
+    def _submit_batch(self, exchange_name, batch):
+        try:
+            self.executor.submit(self._publish_batch, exchange_name, batch)
+        except Exception as err:
+            for _, _, future in batch:
+                future.set_exception(err)
+            raise
+
+    def _publish_batch(self, exchange_name, batch):
+        publisher = self.publishers.get()
+        try:
+            errors = publisher.publish_batch(
+                exchange_name, [(routing_key, body) for routing_key, body, _ in batch]
+            )
+        except Exception as err:
+            errors = [err] * len(batch)
+        finally:
+            self.publishers.put(publisher)
+
+        for (_, _, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result("Success")
+            else:
+                future.set_exception(error)
+
+    def publish_concurrently(self, exchange_name, messages):
+        """
+        Publish `(routing_key, body)` messages concurrently.
+
+        Returns a list with, for each message in order, None if it was
+        published, or the exception that publishing it raised.
+        """
+        futures = self.publish_many(exchange_name, messages)
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+                errors.append(None)
+            except Exception as err:
+                errors.append(err)
+        return errors
+
+    def close(self):
+        for _ in range(self.size):
+            publisher = self.publishers.get()
+            publisher.close()
+            self.publishers.put(publisher)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """
+    Return the publisher pool shared by this process.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = TopicQueuePublisherPool(
+                MQ_PUBLISHER_POOL_SIZE, confirm=MQ_PUBLISHER_CONFIRMS
+            )
+        return _publisher
+
+
+def close_publisher():
+    """
+    Close the connections of the shared publisher pool, if there is one.
+    """
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.close()
+
 
 if __name__ == "__main__":
     producer = TopicQueueProducer(5, MessageQueueNames.CONNECTIONS, "lc1_q1")
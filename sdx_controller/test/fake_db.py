@@ -0,0 +1,65 @@
+import re
+from copy import deepcopy
+
+
+class FakeDb(object):
+    """
+    Just enough of DbUtils to keep values and versions in memory, and
+    count writes, for tests that do not need MongoDB.
+
+    Values are kept in `collections`, by collection and key, and
+    versions in `versions`, by (key, version).
+    """
+
+    def __init__(self):
+        self.collections = {}
+        self.versions = {}
+        self.writes = 0
+
+    def add_key_value_pair_to_db(self, collection, key, value):
+        self.writes += 1
+        self.collections.setdefault(collection, {})[key] = deepcopy(value)
+
+    def get_value_from_db(self, collection, key):
+        return deepcopy(self.collections.get(collection, {}).get(key))
+
+    def get_all_entries_in_collection(self, collection, key_pattern=None):
+        return (
+            {key: deepcopy(value)}
+            for key, value in self.collections.get(collection, {}).items()
+            if key_pattern is None or re.search(key_pattern, key)
+        )
+
+    def find_entries_in_collection(self, collection, query=None):
+        # Only queries for a list of keys are needed.
+        values = self.collections.get(collection, {})
+        return (
+            {key: deepcopy(values[key])}
+            for key in sorted(query["_id"]["$in"])
+            if key in values
+        )
+
+    def delete_one_entry(self, collection, key):
+        self.collections.get(collection, {}).pop(key, None)
+
+    def add_version_to_db(self, collection, key, version, document):
+        self.writes += 1
+        self.versions[(key, version)] = deepcopy(
+            {**document, "key": key, "version": version}
+        )
+
+    def get_version_from_db(self, collection, key, version):
+        return deepcopy(self.versions.get((key, version)))
+
+    def get_versions_from_db(self, collection, key, fields=None):
+        return [
+            deepcopy(document)
+            for (document_key, _), document in sorted(self.versions.items())
+            if document_key == key
+        ]
+
+    def delete_versions_from_db(self, collection, key, before_version):
+        old = [k for k in self.versions if k[0] == key and k[1] < before_version]
+        for k in old:
+            del self.versions[k]
+        return len(old)
@@ -0,0 +1,70 @@
+import threading
+import time
+import unittest
+
+from sdx_controller.utils.connection_events import ConnectionEvents
+
+
+class ConnectionEventsTests(unittest.TestCase):
+    def setUp(self):
+        self.events = ConnectionEvents()
+        self.status = {"s1": "UNDER_PROVISIONING"}
+        self.reads = 0
+
+    def read(self):
+        self.reads += 1
+        return self.status["s1"]
+
+    def test_settled_without_waiting(self):
+        self.status["s1"] = "UP"
+        value = self.events.wait_for("s1", self.read, lambda s: s == "UP", 5)
+        self.assertEqual(value, "UP")
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(self.events.waiting, {})
+
+    def test_wakes_on_notify(self):
+        def change():
+            time.sleep(0.05)
+            self.events.notify("s2")
+            self.status["s1"] = "UP"
+            self.events.notify("s1")
+
+        thread = threading.Thread(target=change)
+        start = time.monotonic()
+        thread.start()
+        value = self.events.wait_for("s1", self.read, lambda s: s == "UP", 5)
+        thread.join()
+
+        self.assertEqual(value, "UP")
+        self.assertLess(time.monotonic() - start, 1)
+        # Read once before the change, and once after it; a change of
+        # another connection does not wake the wait.
+        self.assertEqual(self.reads, 2)
+        self.assertEqual(self.events.waiting, {})
+
+    def test_timeout(self):
+        value = self.events.wait_for("s1", self.read, lambda s: s == "UP", 0.05)
+        self.assertEqual(value, "UNDER_PROVISIONING")
+        self.assertEqual(self.events.waiting, {})
+
+    def test_reads_again_without_notify(self):
+        events = ConnectionEvents(poll_interval=0.05)
+
+        def change():
+            time.sleep(0.1)
+            # Changed without a notification.
+            self.status["s1"] = "UP"
+
+        thread = threading.Thread(target=change)
+        start = time.monotonic()
+        thread.start()
+        value = events.wait_for("s1", self.read, lambda s: s == "UP", 5)
+        thread.join()
+
+        self.assertEqual(value, "UP")
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(events.waiting, {})
+
+    def test_notify_without_waiters(self):
+        self.events.notify("s1")
+        self.assertEqual(self.events.waiting, {})
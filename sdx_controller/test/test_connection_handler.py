@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sdx_pce.utils.exceptions import RequestValidationError
+
+from sdx_controller.handlers.connection_handler import ConnectionHandler
+from sdx_controller.utils.te_lock import get_te_lock
+
+
+@patch("sdx_controller.handlers.connection_handler.topology_db_update")
+class PlaceConnectionLockTests(unittest.TestCase):
+    def setUp(self):
+        self.handler = ConnectionHandler(MagicMock())
+        self.request = {"id": "s1", "status": "REQUESTED", "endpoints": []}
+        self.held = {}
+
+    def reserve(self, te_manager, connection_request):
+        self.held["reserve"] = get_te_lock()._is_owned()
+        return {"ampath.net": {}}, [], None
+
+    def send(self, breakdown, operation, connection_request):
+        self.held["send"] = get_te_lock()._is_owned()
+        return "Connection published", 201
+
+    def test_lock_not_held_while_sending(self, _):
+        with (
+            patch.object(self.handler, "_reserve_path", side_effect=self.reserve),
+            patch.object(self.handler, "_send_breakdown_to_lc", side_effect=self.send),
+        ):
+            result = self.handler.place_connection(MagicMock(), self.request)
+
+        self.assertEqual(result, ("Connection published", 201))
+        self.assertEqual(self.held, {"reserve": True, "send": False})
+
+    @patch("sdx_controller.handlers.connection_handler.time.sleep")
+    def test_settle_wait_without_lock(self, mock_sleep, _):
+        mock_sleep.side_effect = lambda seconds: self.held.setdefault(
+            "sleep", get_te_lock()._is_owned()
+        )
+        not_found = RequestValidationError("Node x not found in the graph", 400)
+        with (
+            patch.object(
+                self.handler,
+                "_reserve_path",
+                side_effect=[not_found, self.reserve(None, None)],
+            ),
+            patch.object(self.handler, "_send_breakdown_to_lc", side_effect=self.send),
+        ):
+            result = self.handler.place_connection(MagicMock(), self.request)
+
+        self.assertEqual(result, ("Connection published", 201))
+        self.assertFalse(self.held["sleep"])
+        self.assertFalse(self.held["send"])
+
+
+if __name__ == "__main__":
+    unittest.main()
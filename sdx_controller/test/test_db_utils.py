@@ -4,7 +4,7 @@ import unittest
 import pymongo
 from sdx_datamodel.constants import MongoCollections
 
-from sdx_controller.utils.db_utils import DbUtils
+from sdx_controller.utils.db_utils import DbUtils, LruCache
 
 
 class DbUtilsTests(unittest.TestCase):
@@ -65,7 +65,7 @@ class DbUtilsTests(unittest.TestCase):
         res = dbutils.read_from_db(self.env.get("DB_CONFIG_TABLE_NAME"), key)
         self.assertEqual(res.get(key), val)
 
-        res = dbutils.sdxdb[self.env.get("DB_CONFIG_TABLE_NAME")].delete_one({key: val})
+        dbutils.delete_one_entry(self.env.get("DB_CONFIG_TABLE_NAME"), key)
 
         # Try inserting non-empty strings as key:value
         key = "test-key"
@@ -82,6 +82,359 @@ class DbUtilsTests(unittest.TestCase):
         res = dbutils.read_from_db(self.env.get("DB_CONFIG_TABLE_NAME"), key)
         self.assertEqual(res.get(key), val)
 
-        res = dbutils.sdxdb[self.env.get("DB_CONFIG_TABLE_NAME")].delete_one({key: val})
+        # Writing the same value again is reported as unchanged,
+        # rather than as a failure.
+        res = dbutils.add_key_value_pair_to_db(
+            self.env.get("DB_CONFIG_TABLE_NAME"), key, val
+        )
+        self.assertIsInstance(res, pymongo.results.UpdateResult)
+        self.assertIsNone(res.upserted_id)
+        self.assertEqual(res.modified_count, 0)
+
+        dbutils.delete_one_entry(self.env.get("DB_CONFIG_TABLE_NAME"), key)
 
         res = dbutils.sdxdb[self.env.get("DB_CONFIG_TABLE_NAME")].drop()
+
+    def test_migrate_legacy_documents(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        collection = self.env.get("DB_CONFIG_TABLE_NAME")
+        dbutils.sdxdb[collection].drop()
+
+        # Documents in the old `{key: value}` shape, including a
+        # deleted entry that shares its key with a live one, and a
+        # malformed one.
+        dbutils.sdxdb[collection].insert_many(
+            [
+                {"live-key": "live-val"},
+                {"shared-key": "old-val", "deleted": True},
+                {"shared-key": "new-val"},
+                {"deleted-key": "deleted-val", "deleted": True},
+                {"key-1": "val-1", "key-2": "val-2"},
+            ]
+        )
+
+        self.assertEqual(dbutils.migrate_legacy_documents(collection), 4)
+
+        self.assertEqual(dbutils.get_value_from_db(collection, "live-key"), "live-val")
+        self.assertEqual(dbutils.get_value_from_db(collection, "shared-key"), "new-val")
+        self.assertIsNone(dbutils.get_value_from_db(collection, "deleted-key"))
+        self.assertEqual(dbutils.sdxdb[collection].count_documents({}), 4)
+        # The malformed document is kept, rather than lost.
+        self.assertEqual(
+            dbutils.sdxdb[collection].count_documents({"key-1": "val-1"}), 1
+        )
+
+        # Migrating again should be a no-op.
+        self.assertEqual(dbutils.migrate_legacy_documents(collection), 0)
+
+        dbutils.sdxdb[collection].drop()
+
+    def test_migrate_historical_connections(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        history = MongoCollections.CONNECTION_HISTORY
+        dbutils.sdxdb[history].delete_many({"key": "test-service"})
+
+        archived = [
+            {"100": {"status": "UP"}},
+            {"200": {"status": "DOWN"}},
+            # Archived with a date and time, by older versions.
+            {"2025-01-01 00:00:00": {"status": "UP"}},
+        ]
+        dbutils.add_key_value_pair_to_db(
+            MongoCollections.HISTORICAL_CONNECTIONS, "test-service", archived
+        )
+        # An earlier migration that stopped after archiving one event.
+        dbutils.add_event_to_db(history, "test-service", 100, {"status": "UP"})
+
+        dbutils.migrate_historical_connections()
+        # Running again, as another process would, does nothing.
+        dbutils.migrate_historical_connections()
+
+        self.assertEqual(
+            list(dbutils.get_events_from_db(history, "test-service")),
+            [
+                ("test-service", 100, {"status": "UP"}),
+                ("test-service", 200, {"status": "DOWN"}),
+                ("test-service", 1735689600, {"status": "UP"}),
+            ],
+        )
+        self.assertIsNone(
+            dbutils.get_value_from_db(
+                MongoCollections.HISTORICAL_CONNECTIONS, "test-service"
+            )
+        )
+
+        dbutils.sdxdb[history].delete_many({"key": "test-service"})
+
+    def test_migrate_unknown_archive_timestamp(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        history = MongoCollections.CONNECTION_HISTORY
+        dbutils.sdxdb[history].delete_many({"key": "test-service"})
+
+        archived = [{"100": {"status": "UP"}}, {"yesterday": {"status": "DOWN"}}]
+        dbutils.add_key_value_pair_to_db(
+            MongoCollections.HISTORICAL_CONNECTIONS, "test-service", archived
+        )
+
+        dbutils.migrate_historical_connections()
+
+        self.assertEqual(
+            list(dbutils.get_events_from_db(history, "test-service")),
+            [("test-service", 100, {"status": "UP"})],
+        )
+        # The entry is kept, with the event that was not migrated.
+        self.assertEqual(
+            dbutils.get_value_from_db(
+                MongoCollections.HISTORICAL_CONNECTIONS, "test-service"
+            ),
+            archived,
+        )
+
+        dbutils.delete_one_entry(
+            MongoCollections.HISTORICAL_CONNECTIONS, "test-service"
+        )
+        dbutils.sdxdb[history].delete_many({"key": "test-service"})
+
+    def test_migrate_topology_versions(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        history = MongoCollections.TOPOLOGY_HISTORY
+        dbutils.sdxdb[history].delete_many({"key": "test.net"})
+
+        topology = {"id": "urn:sdx:topology:test.net", "version": 3}
+        dbutils.add_key_value_pair_to_db(
+            MongoCollections.TOPOLOGIES, f"{topology['id']}-3", topology
+        )
+        dbutils.add_key_value_pair_to_db(
+            MongoCollections.TOPOLOGIES, topology["id"], topology
+        )
+
+        dbutils.migrate_topology_versions()
+
+        self.assertEqual(
+            dbutils.get_version_from_db(history, "test.net", 3)["topology"], topology
+        )
+        self.assertIsNone(
+            dbutils.get_value_from_db(
+                MongoCollections.TOPOLOGIES, f"{topology['id']}-3"
+            )
+        )
+        # The current topology of the domain is not a version.
+        self.assertEqual(
+            dbutils.get_value_from_db(MongoCollections.TOPOLOGIES, topology["id"]),
+            topology,
+        )
+
+        dbutils.delete_one_entry(MongoCollections.TOPOLOGIES, topology["id"])
+        dbutils.sdxdb[history].delete_many({"key": "test.net"})
+
+    def test_update_fields_in_json(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        collection = self.env.get("DB_CONFIG_TABLE_NAME")
+        key = "test-connection"
+        dbutils.add_key_value_pair_to_db(
+            collection, key, {"status": "UNDER_PROVISIONING", "oxp_success_count": 0}
+        )
+
+        res = dbutils.update_fields_in_json(
+            collection,
+            key,
+            {"status": "UP", "oxp_response": {"ampath": [200, "OK"]}},
+            increments={"oxp_success_count": 1},
+        )
+        self.assertIsInstance(res, pymongo.results.UpdateResult)
+        self.assertEqual(
+            dbutils.get_value_from_db(collection, key),
+            {
+                "status": "UP",
+                "oxp_success_count": 1,
+                "oxp_response": {"ampath": [200, "OK"]},
+            },
+        )
+
+        # Updating a missing entry fails.
+        self.assertIsNone(
+            dbutils.update_fields_in_json(collection, "no-such-key", {"status": "UP"})
+        )
+
+        dbutils.sdxdb[collection].drop()
+
+    def test_versions(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        collection = MongoCollections.TOPOLOGY_HISTORY
+        key = "test-domain.net"
+        for version in (3, 1, 2):
+            dbutils.add_version_to_db(
+                collection, key, version, {"topology": {"version": version}}
+            )
+        # Adding a version again replaces it.
+        dbutils.add_version_to_db(collection, key, 2, {"topology": {"v": 2}})
+
+        self.assertEqual(
+            dbutils.get_version_from_db(collection, key, 2),
+            {"key": key, "version": 2, "topology": {"v": 2}},
+        )
+        self.assertIsNone(dbutils.get_version_from_db(collection, key, 4))
+        self.assertEqual(
+            [
+                document["version"]
+                for document in dbutils.get_versions_from_db(
+                    collection, key, min_version=2, fields=()
+                )
+            ],
+            [2, 3],
+        )
+
+        self.assertEqual(dbutils.delete_versions_from_db(collection, key, 3), 2)
+        self.assertEqual(
+            [d["version"] for d in dbutils.get_versions_from_db(collection, key)],
+            [3],
+        )
+
+        dbutils.delete_versions_from_db(collection, key, 4)
+
+    def test_find_entries(self):
+        # Set up the necessary environment variables.
+        os.environ["DB_NAME"] = self.env.get("DB_NAME")
+
+        os.environ["MONGO_HOST"] = self.env.get("MONGO_HOST")
+        os.environ["MONGO_PORT"] = self.env.get("MONGO_PORT")
+        os.environ["MONGO_USER"] = self.env.get("MONGO_USER")
+        os.environ["MONGO_PASS"] = self.env.get("MONGO_PASS")
+
+        dbutils = DbUtils()
+        dbutils.initialize_db()
+
+        collection = "test_find_entries"
+        for key, status in (("c", "UP"), ("a", "UP"), ("b", "DOWN"), ("d", "UP")):
+            dbutils.add_key_value_pair_to_db(
+                collection, key, {"status": status, "name": key}
+            )
+        dbutils.mark_deleted(collection, "d")
+
+        query = {"value.status": "UP"}
+        self.assertEqual(
+            list(dbutils.find_entries_in_collection(collection, query=query)),
+            [
+                {"a": {"status": "UP", "name": "a"}},
+                {"c": {"status": "UP", "name": "c"}},
+            ],
+        )
+        self.assertEqual(
+            list(
+                dbutils.find_entries_in_collection(
+                    collection, fields=("status",), after_key="a", limit=1
+                )
+            ),
+            [{"b": {"status": "DOWN"}}],
+        )
+
+        dbutils.sdxdb.drop_collection(collection)
+
+
+class LruCacheTests(unittest.TestCase):
+    def test_eviction_and_counters(self):
+        cache = LruCache(2)
+        cache.put("a", {"status": "UP"})
+        cache.put("b", 2)
+
+        # Reading "a" makes "b" the least recently used entry.
+        self.assertEqual(cache.get("a"), (True, {"status": "UP"}))
+        cache.put("c", 3)
+        self.assertEqual(cache.get("b"), (False, None))
+
+        stats = cache.stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_values_are_copied(self):
+        cache = LruCache(2)
+        value = {"status": "UP"}
+        cache.put("a", value)
+        value["status"] = "DOWN"
+
+        _, cached = cache.get("a")
+        cached["status"] = "ERROR"
+        self.assertEqual(cache.get("a"), (True, {"status": "UP"}))
+
+    def test_update_fields_and_invalidate(self):
+        cache = LruCache(2)
+        cache.put("a", {"status": "UP"})
+        cache.update_fields("a", {"status": "DOWN"})
+        self.assertEqual(cache.get("a"), (True, {"status": "DOWN"}))
+
+        cache.invalidate("a")
+        self.assertEqual(cache.get("a"), (False, None))
+
+    def test_stale_fill_is_dropped(self):
+        cache = LruCache(2)
+        token = cache.fill_token()
+        cache.invalidate("a")
+        cache.fill("a", "stale", token)
+        self.assertEqual(cache.get("a"), (False, None))
+
+    def test_disabled_cache(self):
+        cache = LruCache(0)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), (False, None))
@@ -0,0 +1,54 @@
+import json
+import unittest
+import uuid
+
+from sdx_controller.models.location import Location
+from sdx_controller.utils.json_stream import (
+    chunked,
+    iter_json,
+    iter_json_array,
+    iter_json_object,
+)
+
+
+class JsonStreamTests(unittest.TestCase):
+    def test_object(self):
+        items = [("a", {"b": [1, 2]}), (3, "c")]
+        text = "".join(iter_json_object(iter(items)))
+        self.assertEqual(json.loads(text), {"a": {"b": [1, 2]}, "3": "c"})
+        self.assertEqual("".join(iter_json_object([])), "{}")
+
+    def test_array(self):
+        text = "".join(iter_json_array(iter([{"a": 1}, None, "b"])))
+        self.assertEqual(json.loads(text), [{"a": 1}, None, "b"])
+        self.assertEqual("".join(iter_json_array([])), "[]")
+
+    def test_app_encoder(self):
+        service_id = uuid.uuid4()
+        location = Location(address="Miami", latitude=25.75)
+        text = "".join(iter_json_object([("a", location), ("b", service_id)]))
+        self.assertEqual(
+            json.loads(text),
+            {"a": {"address": "Miami", "latitude": 25.75}, "b": str(service_id)},
+        )
+
+    def test_items_read_as_needed(self):
+        read = []
+
+        def items():
+            for key in ("a", "b"):
+                read.append(key)
+                yield key, 1
+
+        pieces = iter_json_object(items())
+        next(pieces)
+        self.assertEqual(read, [])
+        next(pieces)
+        self.assertEqual(read, ["a"])
+
+    def test_chunked(self):
+        pieces = list(iter_json({"key": list(range(100))}))
+        chunks = list(chunked(pieces, chunk_size=50))
+        self.assertEqual("".join(chunks), "".join(pieces))
+        self.assertTrue(all(len(chunk) >= 50 for chunk in chunks[:-1]))
+        self.assertEqual(list(chunked([])), [])
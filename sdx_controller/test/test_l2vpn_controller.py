@@ -9,6 +9,7 @@ from unittest.mock import patch
 from flask import json
 from sdx_datamodel.constants import Constants, MongoCollections
 
+from sdx_controller.handlers.placement_queue import get_placement_queue
 from sdx_controller.models.connection import Connection
 from sdx_controller.models.connection_v2 import ConnectionV2
 from sdx_controller.test import BaseTestCase, TestData
@@ -577,10 +578,67 @@ class TestL2vpnController(BaseTestCase):
 
         assert get_response.status_code // 100 == 2
 
-    @patch("sdx_controller.utils.db_utils.DbUtils.get_all_entries_in_collection")
-    def test_z105_getconnections_fail(self, mock_get_all_entries):
+    def test_z101_place_connection_async(self):
+        """
+        Place a connection in the background, and follow its status.
+        """
+        self.__add_the_three_topologies()
+
+        post_response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0",
+            method="POST",
+            data=TestData.CONNECTION_REQ.read_text(),
+            content_type="application/json",
+            headers={"Prefer": "respond-async"},
+        )
+
+        print(f"Response body: {post_response.data.decode('utf-8')}")
+
+        self.assertEqual(post_response.status_code, 202)
+        service_id = post_response.get_json().get("service_id")
+        self.assertEqual(post_response.get_json().get("status"), "under provisioning")
+        self.assertTrue(post_response.headers["Location"].endswith(service_id))
+
+        get_response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0/{service_id}",
+            method="GET",
+        )
+        assert get_response.status_code // 100 == 2
+        self.assertIn(service_id, get_response.get_json())
+
+        stats_response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0/placement_queue",
+            method="GET",
+        )
+        assert stats_response.status_code // 100 == 2
+        self.assertIn("queue_depth", stats_response.get_json())
+        self.assertIn("average_wait", stats_response.get_json())
+
+        # Let the placement finish before the tests that follow.
+        self.assertTrue(get_placement_queue().join(timeout=60))
+
+    def test_z101_place_connection_async_invalid(self):
+        """
+        Invalid requests are refused before they are queued.
+        """
+        self.__add_the_three_topologies()
+
+        post_response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0",
+            method="POST",
+            data=json.dumps(Connection()),
+            content_type="application/json",
+            headers={"Prefer": "respond-async"},
+        )
+
+        print(f"Response body: {post_response.data.decode('utf-8')}")
+
+        assert post_response.status_code // 100 == 4
+
+    @patch("sdx_controller.utils.db_utils.DbUtils.find_entries_in_collection")
+    def test_z105_getconnections_fail(self, mock_find_entries):
         """Test case for getconnections."""
-        mock_get_all_entries.return_value = {}
+        mock_find_entries.return_value = iter([])
         response = self.client.open(
             f"{BASE_PATH}/l2vpn/1.0",
             method="GET",
@@ -599,10 +657,50 @@ class TestL2vpnController(BaseTestCase):
 
         assert len(response.get_json()) != 0
 
-    @patch("sdx_controller.utils.db_utils.DbUtils.get_all_entries_in_collection")
-    def test_z106_get_archived_connections_fail(self, mock_get_all_entries):
+    def test_z105_getconnections_same_as_by_id(self):
+        """Listing connections gives each connection as GET by ID does."""
+        response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0",
+            method="GET",
+        )
+        assert response.status_code // 100 == 2
+
+        for service_id, connection in response.get_json().items():
+            get_response = self.client.open(
+                f"{BASE_PATH}/l2vpn/1.0/{service_id}",
+                method="GET",
+            )
+            self.assertEqual(get_response.get_json(), {service_id: connection})
+
+    def test_z105_getconnections_pages(self):
+        """Listing connections a page at a time gives them all."""
+        response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0?fields=service_id,status",
+            method="GET",
+        )
+        assert response.status_code // 100 == 2
+        connections = response.get_json()
+        for connection in connections.values():
+            self.assertEqual(set(connection), {"service_id", "status"})
+
+        pages = {}
+        cursor = ""
+        while cursor is not None:
+            response = self.client.open(
+                f"{BASE_PATH}/l2vpn/1.0?fields=service_id,status&limit=1{cursor}",
+                method="GET",
+            )
+            assert response.status_code // 100 == 2
+            self.assertEqual(len(response.get_json()), 1)
+            pages.update(response.get_json())
+            next_cursor = response.headers.get("X-Next-Cursor")
+            cursor = f"&cursor={next_cursor}" if next_cursor else None
+        self.assertEqual(pages, connections)
+
+    @patch("sdx_controller.utils.db_utils.DbUtils.get_events_from_db")
+    def test_z106_get_archived_connections_fail(self, mock_get_events):
         """Test case for listing all archived connections."""
-        mock_get_all_entries.return_value = {}
+        mock_get_events.return_value = iter([])
         response = self.client.open(
             f"{BASE_PATH}/l2vpn/1.0/archived",
             method="GET",
@@ -612,6 +710,29 @@ class TestL2vpnController(BaseTestCase):
     def test_z106_get_archived_connections_success(self):
         """Test case for listing all archived connections."""
         service_id = str(uuid.uuid4())
+        archived_payload = [
+            {"1735689600": {"connection": {"id": service_id}, "reason": "API"}}
+        ]
+        self.db_instance.add_event_to_db(
+            MongoCollections.CONNECTION_HISTORY,
+            service_id,
+            1735689600,
+            {"connection": {"id": service_id}, "reason": "API"},
+        )
+
+        response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0/archived",
+            method="GET",
+        )
+
+        self.assertStatus(response, 200)
+        response_data = response.get_json()
+        self.assertIn(service_id, response_data)
+        self.assertEqual(response_data[service_id], archived_payload)
+
+    def test_z106_get_archived_connections_legacy_success(self):
+        """Archived connections saved by older versions are listed."""
+        service_id = str(uuid.uuid4())
         archived_payload = [
             {"2025-01-01 00:00:00": {"connection": {"id": service_id}, "reason": "API"}}
         ]
@@ -620,6 +741,8 @@ class TestL2vpnController(BaseTestCase):
             service_id,
             archived_payload,
         )
+        # As done when the controller starts.
+        self.db_instance.migrate_historical_connections()
 
         response = self.client.open(
             f"{BASE_PATH}/l2vpn/1.0/archived",
@@ -629,7 +752,10 @@ class TestL2vpnController(BaseTestCase):
         self.assertStatus(response, 200)
         response_data = response.get_json()
         self.assertIn(service_id, response_data)
-        self.assertEqual(response_data[service_id], archived_payload)
+        self.assertEqual(
+            response_data[service_id],
+            [{"1735689600": {"connection": {"id": service_id}, "reason": "API"}}],
+        )
 
     def test_z107_get_archived_connections_by_id_not_found(self):
         """Test case for archived history by unknown service ID."""
@@ -644,6 +770,27 @@ class TestL2vpnController(BaseTestCase):
     def test_z107_get_archived_connections_by_id_success(self):
         """Test case for archived history by service ID."""
         service_id = str(uuid.uuid4())
+        archived_payload = [
+            {"1735689600": {"connection": {"id": service_id}, "reason": "API"}}
+        ]
+        self.db_instance.add_event_to_db(
+            MongoCollections.CONNECTION_HISTORY,
+            service_id,
+            1735689600,
+            {"connection": {"id": service_id}, "reason": "API"},
+        )
+
+        response = self.client.open(
+            f"{BASE_PATH}/l2vpn/1.0/{service_id}/archived",
+            method="GET",
+        )
+
+        self.assertStatus(response, 200)
+        self.assertEqual(response.get_json(), {service_id: archived_payload})
+
+    def test_z107_get_archived_connections_by_id_legacy_success(self):
+        """Archived history saved by older versions, by service ID."""
+        service_id = str(uuid.uuid4())
         archived_payload = [
             {"2025-01-01 00:00:00": {"connection": {"id": service_id}, "reason": "API"}}
         ]
@@ -652,6 +799,8 @@ class TestL2vpnController(BaseTestCase):
             service_id,
             archived_payload,
         )
+        # As done when the controller starts.
+        self.db_instance.migrate_historical_connections()
 
         response = self.client.open(
             f"{BASE_PATH}/l2vpn/1.0/{service_id}/archived",
@@ -659,7 +808,14 @@ class TestL2vpnController(BaseTestCase):
         )
 
         self.assertStatus(response, 200)
-        self.assertEqual(response.get_json(), {service_id: archived_payload})
+        self.assertEqual(
+            response.get_json(),
+            {
+                service_id: [
+                    {"1735689600": {"connection": {"id": service_id}, "reason": "API"}}
+                ]
+            },
+        )
 
     def test_place_connection_with_three_topologies_v2(self):
         """
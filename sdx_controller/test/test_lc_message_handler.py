@@ -0,0 +1,55 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sdx_controller.handlers.lc_message_handler import LcMessageHandler
+
+
+def topology_message(version, timestamp):
+    return json.dumps(
+        {
+            "id": "urn:sdx:topology:ampath.net",
+            "name": "AMPATH-OXP",
+            "version": version,
+            "timestamp": timestamp,
+            "nodes": [],
+            "links": [],
+        }
+    )
+
+
+@patch("sdx_controller.handlers.lc_message_handler.get_topology_store")
+@patch("sdx_controller.handlers.lc_message_handler.ConnectionHandler")
+class LcMessageHandlerTests(unittest.TestCase):
+    def test_unchanged_topology_is_skipped(self, _, mock_get_topology_store):
+        db_instance = MagicMock()
+        db_instance.get_value_from_db.return_value = None
+        te_manager = MagicMock()
+        te_manager.update_topology.return_value = ([], [], [], [], [], [])
+        handler = LcMessageHandler(db_instance, te_manager)
+        domain_dict = {"ampath.net": "up"}
+
+        handler.process_lc_json_msg(
+            topology_message(1, "2025-01-01T00:00:00Z"), {}, domain_dict
+        )
+        writes = db_instance.add_key_value_pair_to_db.call_count
+
+        # Same topology, sent again at a later time.
+        handler.process_lc_json_msg(
+            topology_message(1, "2025-01-01T00:05:00Z"), {}, domain_dict
+        )
+        te_manager.update_topology.assert_called_once()
+        self.assertEqual(db_instance.add_key_value_pair_to_db.call_count, writes)
+        topology_store = mock_get_topology_store.return_value
+        topology_store.save_latest_topology.assert_called_once()
+
+        # A new version is applied.
+        handler.process_lc_json_msg(
+            topology_message(2, "2025-01-01T00:10:00Z"), {}, domain_dict
+        )
+        self.assertEqual(te_manager.update_topology.call_count, 2)
+        self.assertEqual(handler.get_topology_stats(), {"updates": 2, "unchanged": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
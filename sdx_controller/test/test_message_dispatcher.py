@@ -0,0 +1,69 @@
+import threading
+import unittest
+
+from sdx_controller.messaging.message_dispatcher import MessageDispatcher
+
+
+class MessageDispatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = MessageDispatcher(workers=4)
+
+    def tearDown(self):
+        self.dispatcher.stop()
+
+    def test_same_key_keeps_order(self):
+        handled = []
+        for number in range(100):
+            self.dispatcher.dispatch("service:1", handled.append, number)
+        self.dispatcher.join()
+
+        self.assertEqual(handled, list(range(100)))
+
+    def test_keys_run_in_parallel(self):
+        release = threading.Event()
+        handled = threading.Event()
+
+        # Find a key that is not handled by the blocked worker.
+        blocked_worker = self.dispatcher._worker_for("slow")
+        other_key = next(
+            key
+            for key in (f"key-{number}" for number in range(100))
+            if self.dispatcher._worker_for(key) is not blocked_worker
+        )
+
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        self.dispatcher.dispatch("slow", slow)
+        self.assertTrue(started.wait(5))
+        self.dispatcher.dispatch(other_key, handled.set)
+
+        self.assertTrue(handled.wait(5))
+        # The other worker is done with its message once its queue is.
+        self.dispatcher._worker_for(other_key).queue.join()
+        self.assertEqual(self.dispatcher.stats()["busy_workers"], 1)
+        release.set()
+        self.dispatcher.join()
+
+    def test_failures_are_counted(self):
+        def fail():
+            raise ValueError("bad message")
+
+        self.dispatcher.dispatch("domain:ampath.net", fail)
+        self.dispatcher.dispatch("domain:ampath.net", lambda: None)
+        self.dispatcher.join()
+
+        stats = self.dispatcher.stats()
+        self.assertEqual(stats["workers"], 4)
+        self.assertEqual(stats["processed"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreaterEqual(stats["utilization"], 0.0)
+        self.assertLessEqual(stats["utilization"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from sdx_controller.utils.parse_helper import (
+    HEARTBEAT_MSG_TYPE,
+    TOPOLOGY_MSG_TYPE,
+    ParseHelper,
+    content_hash,
+)
+
+
+class ParseHelperTests(unittest.TestCase):
+    def setUp(self):
+        self.parse_helper = ParseHelper()
+
+    def test_is_json(self):
+        self.assertTrue(self.parse_helper.is_json('{"a": 1}'))
+        self.assertFalse(self.parse_helper.is_json("test body"))
+
+    def test_parse_heartbeat(self):
+        message = self.parse_helper.parse_lc_message(
+            b'{"type": "Heart Beat", "domain": "ampath.net"}'
+        )
+        self.assertEqual(message.msg_type, HEARTBEAT_MSG_TYPE)
+        self.assertEqual(message.domain, "ampath.net")
+
+    def test_parse_connection_response(self):
+        message = self.parse_helper.parse_lc_message(
+            '{"msg_type": "oxp_conn_response", "service_id": "abc", '
+            '"lc_domain": "sax.net"}'
+        )
+        self.assertEqual(message.msg_type, "oxp_conn_response")
+        self.assertEqual(message.domain, "sax.net")
+        self.assertEqual(message.payload["service_id"], "abc")
+
+    def test_parse_topology(self):
+        message = self.parse_helper.parse_lc_message(
+            b'{"id": "urn:sdx:topology:ampath.net", "version": 1}'
+        )
+        self.assertEqual(message.msg_type, TOPOLOGY_MSG_TYPE)
+        self.assertEqual(message.domain, "ampath.net")
+        self.assertEqual(message.payload["version"], 1)
+
+    def test_parse_invalid(self):
+        self.assertIsNone(self.parse_helper.parse_lc_message("test body"))
+        self.assertIsNone(self.parse_helper.parse_lc_message("[1, 2]"))
+
+    def test_content_hash(self):
+        self.assertEqual(
+            content_hash({"a": 1, "b": [1, 2]}), content_hash({"b": [1, 2], "a": 1})
+        )
+        self.assertNotEqual(content_hash({"a": 1}), content_hash({"a": 2}))
+        self.assertEqual(
+            content_hash({"a": 1, "timestamp": 1}, ("timestamp",)),
+            content_hash({"a": 1, "timestamp": 2}, ("timestamp",)),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+from sdx_controller.handlers.placement_queue import PlacementQueue, PlacementQueueFull
+
+
+class PlacementQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.queue = PlacementQueue(workers=1, max_pending=2)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def test_runs_placements(self):
+        future = self.queue.submit(lambda a, b: a + b, 1, 2)
+        self.assertEqual(future.result(timeout=5), 3)
+
+        stats = self.queue.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["running"], 0)
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["failed"], 0)
+
+    def test_full_queue(self):
+        release = threading.Event()
+        running = self.queue.submit(release.wait, 5)
+        queued = self.queue.submit(lambda: None)
+
+        with self.assertRaises(PlacementQueueFull):
+            self.queue.submit(lambda: None)
+
+        stats = self.queue.stats()
+        self.assertEqual(stats["queue_depth"], 1)
+        self.assertEqual(stats["running"], 1)
+        self.assertGreaterEqual(stats["oldest_wait"], 0)
+
+        release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+
+        # There is room again once placements are done.
+        self.queue.submit(lambda: None).result(timeout=5)
+        stats = self.queue.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["completed"], 3)
+        self.assertGreater(stats["max_wait"], 0)
+
+    def test_join(self):
+        release = threading.Event()
+        done = []
+        self.queue.submit(release.wait, 5)
+        self.queue.submit(done.append, 1)
+
+        self.assertFalse(self.queue.join(timeout=0.05))
+        release.set()
+        self.assertTrue(self.queue.join(timeout=5))
+        self.assertEqual(done, [1])
+
+    def test_failed_placement(self):
+        def fail():
+            raise ValueError("no path")
+
+        future = self.queue.submit(fail)
+        with self.assertRaises(ValueError):
+            future.result(timeout=5)
+
+        stats = self.queue.stats()
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["failed"], 1)
+        # The failure gave back its slot.
+        self.queue.submit(lambda: None).result(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,337 @@
+import json
+import unittest
+from queue import Queue
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from sdx_datamodel.constants import MongoCollections
+
+from sdx_controller.messaging.message_dispatcher import MessageDispatcher
+from sdx_controller.messaging.rpc_queue_consumer import (
+    DomainStatus,
+    HeartbeatMonitor,
+    RpcConsumer,
+    graph_node_indexes,
+    heartbeat_domain,
+    message_key,
+    port_node_ids,
+)
+from sdx_controller.utils.parse_helper import ParseHelper
+
+
+@patch("sdx_controller.messaging.rpc_queue_consumer.pika.BlockingConnection")
+class RpcConsumerTests(unittest.TestCase):
+    def test_on_request_reuses_channel(self, mock_connection_class):
+        thread_queue = Queue()
+        consumer = RpcConsumer(thread_queue, "", None)
+
+        ch = MagicMock()
+        method = MagicMock(delivery_tag=7)
+        props = MagicMock(reply_to="reply-queue", correlation_id="abc")
+        for _ in range(3):
+            consumer.on_request(ch, method, props, b'{"type": "Heart Beat"}')
+
+        # No new connection per message: only the one made by __init__.
+        mock_connection_class.assert_called_once()
+        self.assertEqual(ch.basic_publish.call_count, 3)
+        self.assertEqual(ch.basic_ack.call_count, 3)
+        self.assertEqual(thread_queue.qsize(), 3)
+
+    def test_on_request_without_reply_to(self, mock_connection_class):
+        consumer = RpcConsumer(Queue(), "", None)
+
+        ch = MagicMock()
+        props = MagicMock(reply_to=None)
+        consumer.on_request(ch, MagicMock(delivery_tag=1), props, b"{}")
+
+        ch.basic_publish.assert_not_called()
+        ch.basic_ack.assert_called_once_with(delivery_tag=1)
+
+    def test_prefetch_count(self, mock_connection_class):
+        consumer = RpcConsumer(Queue(), "", None)
+        consumer.start_consumer(prefetch_count=25)
+
+        channel = mock_connection_class.return_value.channel.return_value
+        channel.basic_qos.assert_called_once_with(prefetch_count=25)
+        channel.start_consuming.assert_called_once()
+
+    def test_failed_message_is_counted(self, mock_connection_class):
+        consumer = RpcConsumer(Queue(), "", None)
+        dispatcher = MessageDispatcher(1)
+        handler = MagicMock()
+        handler.process_lc_json_msg.side_effect = ValueError("bad message")
+
+        dispatcher.dispatch(
+            "domain:sax.net", consumer._process_lc_message, handler, {}, None, {}
+        )
+        dispatcher.join()
+
+        self.assertEqual(dispatcher.stats()["failed"], 1)
+        dispatcher.stop()
+
+    def test_heartbeat_fast_path(self, mock_connection_class):
+        thread_queue = Queue()
+        heartbeat_monitor = MagicMock()
+        consumer = RpcConsumer(
+            thread_queue, "", None, heartbeat_monitor=heartbeat_monitor
+        )
+
+        ch = MagicMock()
+        props = MagicMock(reply_to=None, headers=None)
+        consumer.on_request(
+            ch, MagicMock(), props, b'{"type": "Heart Beat", "domain": "ampath.net"}'
+        )
+        consumer.on_request(ch, MagicMock(), props, b'{"id": "topology"}')
+
+        # Heartbeats are recorded directly, everything else is queued.
+        heartbeat_monitor.record_heartbeat.assert_called_once_with("ampath.net")
+        self.assertEqual(thread_queue.qsize(), 1)
+        self.assertEqual(thread_queue.get(), b'{"id": "topology"}')
+        self.assertEqual(ch.basic_ack.call_count, 2)
+
+
+class HeartbeatDomainTests(unittest.TestCase):
+    def test_heartbeat_header(self):
+        props = MagicMock(headers={"type": "Heart Beat", "domain": "sax.net"})
+        self.assertEqual(heartbeat_domain(props, b"not json"), "sax.net")
+
+    def test_heartbeat_body(self):
+        props = MagicMock(headers=None)
+        body = b'{"type": "Heart Beat", "domain": "tenet.ac.za"}'
+        self.assertEqual(heartbeat_domain(props, body), "tenet.ac.za")
+
+    def test_not_heartbeat(self):
+        props = MagicMock(headers=None)
+        self.assertIsNone(heartbeat_domain(props, b'{"msg_type": "oxp_conn_response"}'))
+        self.assertIsNone(heartbeat_domain(props, b"Heart Beat, not JSON"))
+
+        # Large messages are not parsed, even if they mention heartbeats.
+        body = b'{"type": "Heart Beat", "padding": "' + b"x" * 2048 + b'"}'
+        self.assertIsNone(heartbeat_domain(props, body))
+
+
+class HeartbeatMonitorTests(unittest.TestCase):
+    def test_status_is_saved_on_dispatcher(self):
+        db = MagicMock()
+        db.get_value_from_db.return_value = {"sax.net": DomainStatus.UNKNOWN}
+        dispatcher = MagicMock()
+        monitor = HeartbeatMonitor(db, dispatcher=dispatcher)
+        monitor.domain_status["sax.net"] = DomainStatus.UNKNOWN
+
+        monitor.record_heartbeat("sax.net")
+
+        # Nothing is read or written on the thread that got the heartbeat.
+        db.get_value_from_db.assert_not_called()
+        key, func, *args = dispatcher.dispatch.call_args.args
+        func(*args)
+        db.add_key_value_pair_to_db.assert_called_once()
+        self.assertEqual(
+            db.add_key_value_pair_to_db.call_args.args[2],
+            {"sax.net": DomainStatus.UP},
+        )
+
+    def test_missing_domain_dict(self):
+        db = MagicMock()
+        db.get_value_from_db.return_value = None
+        monitor = HeartbeatMonitor(db)
+        monitor.domain_status["sax.net"] = DomainStatus.UNKNOWN
+
+        monitor.record_heartbeat("sax.net")
+
+        self.assertEqual(monitor.get_status("sax.net"), DomainStatus.UP)
+        db.add_key_value_pair_to_db.assert_not_called()
+
+
+class MessageKeyTests(unittest.TestCase):
+    def setUp(self):
+        self.parse_helper = ParseHelper()
+
+    def test_connection_messages_keyed_by_service(self):
+        for msg_type in ("oxp_conn_response", "oxp_conn_status_change"):
+            message = self.parse_helper.parse_lc_message(
+                json.dumps({"msg_type": msg_type, "service_id": "abc"})
+            )
+            self.assertEqual(message_key(message), "service:abc")
+
+    def test_topology_keyed_by_domain(self):
+        message = self.parse_helper.parse_lc_message(
+            b'{"id": "urn:sdx:topology:ampath.net", "version": 2}'
+        )
+        self.assertEqual(message_key(message), "domain:ampath.net")
+
+    def test_unknown_message(self):
+        message = self.parse_helper.parse_lc_message(b'{"foo": "bar"}')
+        self.assertIsNone(message_key(message))
+
+
+class RestartMapsTests(unittest.TestCase):
+    def test_graph_node_indexes(self):
+        graph = MagicMock()
+        graph.nodes.return_value = [(0, {"id": "n0"}), (1, {"id": "n1"})]
+        self.assertEqual(graph_node_indexes(graph), {"n0": 0, "n1": 1})
+        graph.nodes.assert_called_once_with(data=True)
+
+    def test_port_node_ids(self):
+        topology = SimpleNamespace(
+            nodes=[
+                SimpleNamespace(
+                    id="n0", ports=[SimpleNamespace(id="p1"), SimpleNamespace(id="p2")]
+                ),
+                SimpleNamespace(id="n1", ports=[SimpleNamespace(id="p3")]),
+            ]
+        )
+        self.assertEqual(port_node_ids(topology), {"p1": "n0", "p2": "n0", "p3": "n1"})
+
+
+@patch("sdx_controller.messaging.rpc_queue_consumer.pika.BlockingConnection")
+class RecoverConnectionsTests(unittest.TestCase):
+    def make_te_manager(self):
+        te_manager = MagicMock()
+        te_manager.vlan_tags_table = {"ampath.net": {"p1": {}, "p2": {}}}
+        te_manager.connectionSolution_list = []
+        te_manager.topology_manager.get_topology.return_value = SimpleNamespace(
+            nodes=[
+                SimpleNamespace(id="n0", ports=[SimpleNamespace(id="p1")]),
+                SimpleNamespace(id="n1", ports=[SimpleNamespace(id="p2")]),
+            ]
+        )
+        return te_manager
+
+    def make_db(self, connections, breakdowns, solutions):
+        entries = {
+            MongoCollections.CONNECTIONS: connections,
+            MongoCollections.BREAKDOWNS: breakdowns,
+            MongoCollections.SOLUTIONS: solutions,
+        }
+        db_instance = MagicMock()
+        db_instance.get_all_entries_in_collection.side_effect = lambda c: (
+            {key: value} for key, value in entries[c].items()
+        )
+        return db_instance
+
+    def test_recover_connections(self, _):
+        te_manager = self.make_te_manager()
+        consumer = RpcConsumer(Queue(), "", te_manager)
+        segment = {
+            "uni_a": {"port_id": "p1", "tag": {"value": 100}},
+            "uni_z": {"port_id": "p2", "tag": {"value": 200}},
+        }
+        db_instance = self.make_db(
+            {
+                "s1": {"status": "UP", "qos_metrics": {"min_bw": {"value": 5}}},
+                "s2": {"status": "UP"},
+            },
+            {"s1": {"ampath.net": segment}, "s2": {"ampath.net": segment}},
+            {"s1": [{"source": "p1", "destination": "p2"}]},
+        )
+        graph = MagicMock()
+        graph.nodes.return_value = [(0, {"id": "n0"}), (1, {"id": "n1"})]
+
+        report = {"recovered": 0, "skipped": 0, "quarantined": [], "timings": {}}
+        consumer._recover_connections(db_instance, graph, report)
+
+        # Each collection is read once.
+        self.assertEqual(db_instance.get_all_entries_in_collection.call_count, 3)
+        db_instance.get_value_from_db.assert_not_called()
+        self.assertEqual(te_manager.vlan_tags_table["ampath.net"]["p1"][100], "s2")
+        # Only s1 has QoS metrics and a solution.
+        self.assertEqual(len(te_manager.connectionSolution_list), 1)
+        self.assertEqual((report["recovered"], report["skipped"]), (1, 1))
+        self.assertEqual(report["quarantined"], [])
+        self.assertEqual(
+            set(report["timings"]), {"load_connections", "rebuild_connections"}
+        )
+
+    def test_bad_records_are_quarantined(self, _):
+        te_manager = self.make_te_manager()
+        consumer = RpcConsumer(Queue(), "", te_manager)
+        good = {
+            "uni_a": {"port_id": "p1", "tag": {"value": 100}},
+            "uni_z": {"port_id": "p2", "tag": {"value": 200}},
+        }
+        bad = {
+            "uni_a": {"port_id": "p1", "tag": {"value": 101}},
+            "uni_z": {"port_id": "unknown", "tag": {"value": 201}},
+        }
+        qos_metrics = {"min_bw": {"value": 5}}
+        db_instance = self.make_db(
+            {
+                "s1": {"status": "UP", "qos_metrics": qos_metrics},
+                "s2": {"status": "UP", "qos_metrics": qos_metrics},
+                "s3": {"status": "UP", "qos_metrics": qos_metrics},
+            },
+            {
+                "s1": {"ampath.net": bad},
+                "s2": {"ampath.net": good},
+                "s3": {"ampath.net": good},
+            },
+            {
+                "s2": [{"source": "p1", "destination": "unknown"}],
+                "s3": [{"source": "p1", "destination": "p2"}],
+            },
+        )
+        graph = MagicMock()
+        graph.nodes.return_value = [(0, {"id": "n0"}), (1, {"id": "n1"})]
+
+        report = {"recovered": 0, "skipped": 0, "quarantined": [], "timings": {}}
+        consumer._recover_connections(db_instance, graph, report)
+
+        self.assertEqual(
+            [(entry["service_id"], entry["phase"]) for entry in report["quarantined"]],
+            [("s1", "breakdown"), ("s2", "solution")],
+        )
+        self.assertEqual(report["recovered"], 1)
+        # No tag of the bad breakdown is taken.
+        self.assertNotIn(101, te_manager.vlan_tags_table["ampath.net"]["p1"])
+        self.assertEqual(len(te_manager.connectionSolution_list), 1)
+
+
+@patch("sdx_controller.messaging.rpc_queue_consumer.pika.BlockingConnection")
+class RecoveryHoldTests(unittest.TestCase):
+    def setUp(self):
+        self.parse_helper = ParseHelper()
+
+    def make_consumer(self):
+        consumer = RpcConsumer(Queue(), "", MagicMock())
+        consumer.dispatcher = MagicMock()
+        consumer._recovering = True
+        return consumer
+
+    def connection_message(self, service_id):
+        return self.parse_helper.parse_lc_message(
+            json.dumps({"msg_type": "oxp_conn_response", "service_id": service_id})
+        )
+
+    def dispatched(self, consumer):
+        return [call.args[0] for call in consumer.dispatcher.dispatch.call_args_list]
+
+    def test_messages_held_until_recovered(self, _):
+        consumer = self.make_consumer()
+        topology = self.parse_helper.parse_lc_message(
+            b'{"id": "urn:sdx:topology:ampath.net", "version": 2}'
+        )
+        consumer._pending_services = {"s1", "s2"}
+
+        consumer._dispatch_lc_message(self.connection_message("s1"), "m1")
+        consumer._dispatch_lc_message(topology, "m2")
+        # Connections that need no recovery are not held.
+        consumer._dispatch_lc_message(self.connection_message("s3"), "m3")
+        self.assertEqual(self.dispatched(consumer), ["service:s3"])
+
+        consumer._service_recovered("s1")
+        self.assertEqual(self.dispatched(consumer), ["service:s3", "service:s1"])
+
+        consumer._recovery_done()
+        consumer._dispatch_lc_message(self.connection_message("s2"), "m4")
+        self.assertEqual(
+            self.dispatched(consumer),
+            ["service:s3", "service:s1", "domain:ampath.net", "service:s2"],
+        )
+
+    def test_all_held_until_connections_loaded(self, _):
+        consumer = self.make_consumer()
+        consumer._dispatch_lc_message(self.connection_message("s3"), "m1")
+        consumer.dispatcher.dispatch.assert_not_called()
+
+        consumer._recovery_done()
+        self.assertEqual(self.dispatched(consumer), ["service:s3"])
@@ -0,0 +1,12 @@
+import unittest
+
+from sdx_controller.utils.te_lock import get_te_lock
+
+
+class TeLockTests(unittest.TestCase):
+    def test_lock_is_shared_and_reentrant(self):
+        lock = get_te_lock()
+        self.assertIs(lock, get_te_lock())
+        with lock:
+            with get_te_lock():
+                pass
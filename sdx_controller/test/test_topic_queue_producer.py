@@ -0,0 +1,203 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pika.exceptions import AMQPConnectionError, NackError, UnroutableError
+
+from sdx_controller.messaging.topic_queue_producer import (
+    TopicQueueProducer,
+    TopicQueuePublisher,
+    TopicQueuePublisherPool,
+)
+
+
+def confirm_messages(mock_connection_class, bound=None, nacked=()):
+    """
+    Make each mocked channel in confirm mode fail published messages
+    as a broker would: messages with a routing key in `nacked` are
+    rejected, and mandatory messages with a routing key not in `bound`
+    are returned as unroutable.
+
+    Returns the list of connections made.
+    """
+    connections = []
+
+    def connect(*args, **kwargs):
+        connection = MagicMock()
+        channel = connection.channel.return_value
+
+        def basic_publish(exchange, routing_key, body, mandatory=False):
+            if not channel.confirm_delivery.called:
+                return
+            if routing_key in nacked:
+                raise NackError([body])
+            if mandatory and bound is not None and routing_key not in bound:
+                raise UnroutableError([body])
+
+        channel.basic_publish.side_effect = basic_publish
+        connections.append(connection)
+        return connection
+
+    mock_connection_class.side_effect = connect
+    return connections
+
+
+@patch("sdx_controller.messaging.topic_queue_producer.pika.BlockingConnection")
+class TopicQueueProducerTests(unittest.TestCase):
+    def test_call_in_confirm_mode(self, mock_connection_class):
+        producer = TopicQueueProducer(
+            timeout=5, exchange_name="connections", routing_key="ampath", confirm=True
+        )
+        self.addCleanup(producer.stop_keep_alive)
+
+        channel = mock_connection_class.return_value.channel.return_value
+        channel.confirm_delivery.assert_called_once()
+        self.assertEqual(producer.call("{}"), "Success")
+
+        # A message that the broker rejects is reported as such.
+        channel.basic_publish.side_effect = NackError([])
+        self.assertEqual(producer.call("{}"), "Failure")
+
+
+@patch("sdx_controller.messaging.topic_queue_producer.pika.BlockingConnection")
+class TopicQueuePublisherTests(unittest.TestCase):
+    def test_connection_is_reused(self, mock_connection_class):
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock())
+
+        publisher.publish("connections", "ampath", {"operation": "post"})
+        publisher.publish("connections", "sax", {"operation": "post"})
+
+        # One connection, and one exchange declaration, for both messages.
+        mock_connection_class.assert_called_once()
+        channel = mock_connection_class.return_value.channel.return_value
+        channel.exchange_declare.assert_called_once_with(
+            exchange="connections", exchange_type="topic"
+        )
+        self.assertEqual(channel.basic_publish.call_count, 2)
+
+        body = json.loads(channel.basic_publish.call_args.kwargs["body"])
+        self.assertEqual(body["operation"], "post")
+        self.assertIn("sent_time", body)
+
+    def test_reconnect_on_failure(self, mock_connection_class):
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock())
+        channel = mock_connection_class.return_value.channel.return_value
+        channel.basic_publish.side_effect = [AMQPConnectionError(), None]
+
+        self.assertEqual(publisher.publish("connections", "ampath", "{}"), "Success")
+
+        # The exchange is declared again on the new channel.
+        self.assertEqual(mock_connection_class.call_count, 2)
+        self.assertEqual(channel.exchange_declare.call_count, 2)
+
+    def test_failure_is_raised_after_retries(self, mock_connection_class):
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock())
+        channel = mock_connection_class.return_value.channel.return_value
+        channel.basic_publish.side_effect = AMQPConnectionError()
+
+        with self.assertRaises(AMQPConnectionError):
+            publisher.publish("connections", "ampath", "{}")
+
+    def test_confirm_mode(self, mock_connection_class):
+        connections = confirm_messages(mock_connection_class)
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock(), confirm=True)
+        self.assertEqual(publisher.publish("connections", "ampath", "{}"), "Success")
+
+        channel = connections[0].channel.return_value
+        channel.confirm_delivery.assert_called_once()
+        self.assertTrue(channel.basic_publish.call_args.kwargs["mandatory"])
+
+    def test_unroutable_message_fails(self, mock_connection_class):
+        confirm_messages(mock_connection_class, bound={"ampath"})
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock(), confirm=True)
+
+        errors = publisher.publish_batch(
+            "connections", [("ampath", "{}"), ("no-such-domain", "{}")]
+        )
+
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], UnroutableError)
+        with self.assertRaises(UnroutableError):
+            publisher.publish("connections", "no-such-domain", "{}")
+
+    def test_nacked_message_fails(self, mock_connection_class):
+        confirm_messages(mock_connection_class, nacked={"sax"})
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock(), confirm=True)
+
+        errors = publisher.publish_batch(
+            "connections", [("sax", "{}"), ("ampath", "{}")]
+        )
+
+        self.assertIsInstance(errors[0], NackError)
+        self.assertIsNone(errors[1])
+
+    def test_failed_message_does_not_stop_batch(self, mock_connection_class):
+        connections = confirm_messages(mock_connection_class, nacked={"domain-1"})
+        publisher = TopicQueuePublisher(connection_parameters=MagicMock(), confirm=True)
+
+        errors = publisher.publish_batch(
+            "connections", [(f"domain-{i}", "{}") for i in range(3)]
+        )
+
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], NackError)
+        self.assertIsNone(errors[2])
+        # The rest of the batch went out on the same channel.
+        self.assertEqual(len(connections), 1)
+        channel = connections[0].channel.return_value
+        self.assertEqual(channel.basic_publish.call_count, 3)
+
+
+@patch("sdx_controller.messaging.topic_queue_producer.pika.BlockingConnection")
+class TopicQueuePublisherPoolTests(unittest.TestCase):
+    def test_publish_concurrently(self, mock_connection_class):
+        channel = mock_connection_class.return_value.channel.return_value
+
+        def basic_publish(exchange, routing_key, body, mandatory=False):
+            if routing_key == "sax":
+                raise AMQPConnectionError()
+
+        channel.basic_publish.side_effect = basic_publish
+
+        pool = TopicQueuePublisherPool(2, connection_parameters=MagicMock())
+        errors = pool.publish_concurrently(
+            "connections",
+            [("ampath", {"operation": "post"}), ("sax", {"operation": "post"})],
+        )
+
+        # Each domain's result is reported separately.
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], AMQPConnectionError)
+
+    def test_publish_many(self, mock_connection_class):
+        connections = confirm_messages(mock_connection_class)
+        pool = TopicQueuePublisherPool(
+            2, confirm=True, connection_parameters=MagicMock(), max_pending=1
+        )
+        futures = pool.publish_many(
+            "connections", [(f"domain-{i}", {"index": i}) for i in range(5)]
+        )
+
+        self.assertEqual(len(futures), 5)
+        self.assertEqual([future.result() for future in futures], ["Success"] * 5)
+        self.assertEqual(
+            sum(
+                connection.channel.return_value.basic_publish.call_count
+                for connection in connections
+            ),
+            5,
+        )
+
+    def test_publish_concurrently_unroutable(self, mock_connection_class):
+        confirm_messages(mock_connection_class, bound={"ampath"})
+        pool = TopicQueuePublisherPool(
+            2, confirm=True, connection_parameters=MagicMock()
+        )
+        errors = pool.publish_concurrently(
+            "connections",
+            [("ampath", {"operation": "post"}), ("unbound", {"operation": "post"})],
+        )
+
+        # A domain with no queue bound fails, rather than "succeeding".
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], UnroutableError)
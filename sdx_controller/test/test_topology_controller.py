@@ -52,6 +52,19 @@ class TestTopologyController(BaseTestCase):
         )
         self.assert200(response, "Response body is : " + response.data.decode("utf-8"))
 
+    def test_get_topology_history_not_found(self):
+        """Test case for get_topology_history
+
+        Get a domain's topology at a version that is not kept
+        """
+        query_string = [("domain", "test_topology.net"), ("version", 789)]
+        response = self.client.open(
+            "/SDX-Controller/topology/history",
+            method="GET",
+            query_string=query_string,
+        )
+        self.assert404(response)
+
 
 if __name__ == "__main__":
     import unittest
@@ -0,0 +1,81 @@
+import unittest
+
+from sdx_controller.test.fake_db import FakeDb
+from sdx_controller.utils.topology_history import (
+    TopologyHistory,
+    apply_topology_diff,
+    topology_diff,
+)
+
+
+def make_topology(version):
+    return {
+        "id": "urn:sdx:topology:ampath.net",
+        "version": version,
+        "nodes": [{"id": "n1", "ports": []}],
+        "links": [
+            {"id": "l1", "residual_bandwidth": 100 - version},
+            {"id": "l2", "residual_bandwidth": 100},
+        ],
+    }
+
+
+class TopologyDiffTests(unittest.TestCase):
+    def test_diff_round_trip(self):
+        old = make_topology(1)
+        new = make_topology(2)
+        new["links"].pop()
+        new["nodes"].append({"id": "n2", "ports": []})
+
+        diff = topology_diff(old, new)
+        self.assertEqual(len(diff["elements"]["links"]["changed"]), 1)
+        self.assertEqual(apply_topology_diff(old, diff), new)
+
+    def test_no_diff_without_ids(self):
+        self.assertIsNone(topology_diff({"nodes": [{}]}, {"nodes": [{}]}))
+
+
+class TopologyHistoryTests(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDb()
+
+    def test_get_version(self):
+        history = TopologyHistory(self.db, max_versions=0, max_age_days=0)
+        for version in range(1, 4):
+            history.add_version("ampath.net", version, make_topology(version))
+
+        self.assertEqual(history.get_versions("ampath.net"), [1, 2, 3])
+        self.assertEqual(history.get_version("ampath.net", 2), make_topology(2))
+        self.assertIsNone(history.get_version("ampath.net", 4))
+
+    def test_keep_max_versions(self):
+        history = TopologyHistory(self.db, max_versions=3, max_age_days=0)
+        for version in range(1, 11):
+            history.add_version("ampath.net", version, make_topology(version))
+
+        self.assertEqual(history.get_versions("ampath.net"), [8, 9, 10])
+
+    def test_diffs(self):
+        history = TopologyHistory(
+            self.db,
+            max_versions=5,
+            max_age_days=0,
+            store_diffs=True,
+            snapshot_interval=4,
+        )
+        for version in range(1, 11):
+            history.add_version("ampath.net", version, make_topology(version))
+
+        # Full copies every 4 versions, and diffs in between.
+        self.assertIn("topology", self.db.versions[("ampath.net", 9)])
+        self.assertIn("diff", self.db.versions[("ampath.net", 10)])
+        # Version 6 was a diff on a version that has been removed.
+        self.assertIn("topology", self.db.versions[("ampath.net", 6)])
+        for version in range(6, 11):
+            self.assertEqual(
+                history.get_version("ampath.net", version), make_topology(version)
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
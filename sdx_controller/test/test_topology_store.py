@@ -0,0 +1,178 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sdx_datamodel.constants import Constants, MongoCollections
+
+from sdx_controller.test.fake_db import FakeDb
+from sdx_controller.utils.te_lock import get_te_lock
+from sdx_controller.utils.topology_store import TopologyStore
+
+
+def make_topology(bandwidth):
+    return {
+        "id": "urn:sdx:topology:sdx",
+        "version": 1,
+        "nodes": [
+            {
+                "id": "urn:sdx:node:a.net:n1",
+                "ports": [
+                    {"id": "urn:sdx:port:a.net:n1:1", "status": "up"},
+                    {"id": "urn:sdx:port:a.net:n1:2", "status": "up"},
+                ],
+            },
+        ],
+        "links": [
+            {"id": "urn:sdx:link:a.net:l1", "residual_bandwidth": bandwidth},
+            {"id": "urn:sdx:link:a.net:l2", "residual_bandwidth": 100},
+        ],
+    }
+
+
+class TopologyStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDb()
+        self.store = TopologyStore(self.db)
+
+    def test_latest_topology_round_trip(self):
+        self.store.save_latest_topology(make_topology(100))
+
+        # Read it back from the DB, without the in-memory snapshot.
+        topology = TopologyStore(self.db).get_latest_topology()
+        self.assertEqual(topology, make_topology(100))
+        self.assertEqual(self.store.get_latest_topology(), make_topology(100))
+
+    def test_stream_latest_topology(self):
+        self.assertIsNone(self.store.stream_latest_topology())
+        self.store.save_latest_topology(make_topology(100))
+
+        # From the DB a node or link at a time, and from the snapshot.
+        for store in (TopologyStore(self.db), self.store):
+            text = "".join(store.stream_latest_topology(batch_size=1))
+            self.assertEqual(json.loads(text), make_topology(100))
+
+    def test_only_changed_elements_are_written(self):
+        self.store.save_latest_topology(make_topology(100))
+        writes = self.db.writes
+
+        self.store.save_latest_topology(make_topology(50))
+        # The changed link, and the header.
+        self.assertEqual(self.db.writes - writes, 2)
+        self.assertEqual(
+            TopologyStore(self.db).get_latest_topology(), make_topology(50)
+        )
+
+    def test_removed_elements_are_deleted(self):
+        self.store.save_latest_topology(make_topology(100))
+        topology = make_topology(100)
+        topology["links"].pop()
+        self.store.save_latest_topology(topology)
+
+        elements = self.db.collections[MongoCollections.LATEST_TOPOLOGY_ELEMENTS]
+        self.assertNotIn("link:urn:sdx:link:a.net:l2", elements)
+        self.assertEqual(self.store.stats()["elements_deleted"], 1)
+
+    def test_legacy_latest_topology(self):
+        self.db.add_key_value_pair_to_db(
+            MongoCollections.TOPOLOGIES,
+            Constants.LATEST_TOPOLOGY,
+            make_topology(100),
+        )
+        self.assertEqual(self.store.get_latest_topology(), make_topology(100))
+
+    def test_unchanged_domain_topology_is_skipped(self):
+        topology = {"id": "urn:sdx:topology:a.net", "version": 1, "nodes": []}
+        self.assertTrue(self.store.save_domain_topology(topology["id"], topology))
+        self.assertFalse(self.store.save_domain_topology(topology["id"], topology))
+
+        topology["version"] = 2
+        self.assertTrue(self.store.save_domain_topology(topology["id"], topology))
+        self.assertEqual(self.store.stats()["domains_written"], 2)
+        self.assertEqual(self.store.stats()["domains_unchanged"], 1)
+
+    def test_scheduled_saves_are_coalesced(self):
+        store = TopologyStore(self.db, interval=0.2)
+        te_manager = MagicMock()
+        topology_manager = te_manager.topology_manager
+        topology_manager.get_topology_map.return_value = {}
+        topology_manager.get_topology.return_value.to_dict.return_value = make_topology(
+            100
+        )
+
+        for _ in range(50):
+            store.schedule_save(te_manager)
+        # Nothing is written until the interval is over.
+        self.assertEqual(self.db.writes, 0)
+
+        store.close()
+        self.assertEqual(store.stats()["updates_requested"], 50)
+        self.assertEqual(store.stats()["updates_written"], 1)
+        self.assertEqual(store.get_latest_topology(), make_topology(100))
+
+    def test_scheduled_save_without_interval(self):
+        store = TopologyStore(self.db, interval=0)
+        te_manager = MagicMock()
+        topology_manager = te_manager.topology_manager
+        topology_manager.get_topology_map.return_value = {}
+        topology_manager.get_topology.return_value.to_dict.return_value = make_topology(
+            100
+        )
+
+        store.schedule_save(te_manager)
+        self.assertEqual(store.stats()["updates_written"], 1)
+
+    def test_outdated_copy_is_not_written(self):
+        older, newer = self.store.next_sequence(), self.store.next_sequence()
+        self.store.save_latest_topology(make_topology(100), newer)
+        self.store.save_latest_topology(make_topology(50), older)
+
+        self.assertEqual(self.store.get_latest_topology(), make_topology(100))
+        self.assertEqual(self.store.stats()["outdated_skipped"], 1)
+
+    def test_writer_does_not_overwrite_newer_save(self):
+        store = TopologyStore(self.db, interval=0.05)
+        te_manager = MagicMock()
+        topology_manager = te_manager.topology_manager
+        topology_manager.get_topology_map.return_value = {}
+        topology_manager.get_topology.return_value.to_dict.return_value = make_topology(
+            50
+        )
+        save = store.save_latest_topology
+
+        def newer_saved_first(topology, sequence=None):
+            # A topology update is applied and saved directly, after
+            # the writer took its copy but before it writes it.
+            with get_te_lock():
+                newer_sequence = store.next_sequence()
+            save(make_topology(100), newer_sequence)
+            save(topology, sequence)
+
+        with patch.object(store, "save_latest_topology", side_effect=newer_saved_first):
+            store.schedule_save(te_manager)
+            store.close()
+
+        self.assertEqual(store.get_latest_topology(), make_topology(100))
+        self.assertEqual(store.stats()["outdated_skipped"], 1)
+
+    def test_topologies_copied_under_te_lock(self):
+        store = TopologyStore(self.db, interval=0.05)
+        te_manager = MagicMock()
+        topology_manager = te_manager.topology_manager
+        topology_manager.get_topology_map.return_value = {}
+        held = []
+
+        def to_dict():
+            held.append(get_te_lock()._is_owned())
+            return make_topology(100)
+
+        topology_manager.get_topology.return_value.to_dict.side_effect = to_dict
+
+        store.schedule_save(te_manager)
+        store.close()
+        # Copied on the writer thread, which held the TE lock meanwhile.
+        self.assertEqual(held, [True])
+        self.assertEqual(store.get_latest_topology(), make_topology(100))
+
+
+if __name__ == "__main__":
+    unittest.main()
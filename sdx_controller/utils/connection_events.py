@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+# Requests waiting on a connection read it again at least this often
+# (in seconds), in case it was changed without a notification: by
+# another controller process, for example.
+CONNECTION_EVENTS_POLL_SECONDS = float(os.getenv("CONNECTION_EVENTS_POLL_SECONDS", 1))
+
+
+class _Waiting(object):
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.waiters = 0
+        self.changes = 0
+
+
+class ConnectionEvents(object):
+    """
+    Let requests wait for a connection to be changed by LC messages,
+    without reading it from the database over and over.
+
+    Whatever changes a connection in the database calls `notify()`
+    with its service ID, which wakes the requests waiting on that
+    connection, so that they read it again right away.  Nothing is
+    kept for connections that nobody waits on.  Waiting requests also
+    read the connection again every `poll_interval` seconds, in case
+    it changed without a notification.
+    """
+
+    def __init__(self, poll_interval=CONNECTION_EVENTS_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        # service_id -> _Waiting, while requests wait on it.
+        self.waiting = {}
+
+    def notify(self, service_id):
+        """
+        Tell the requests waiting on a connection that it has changed.
+        """
+        with self.lock:
+            waiting = self.waiting.get(service_id)
+            if waiting is not None:
+                waiting.changes += 1
+                waiting.condition.notify_all()
+
+    def wait_for(self, service_id, read, settled, timeout):
+        """
+        Call `read()` now, each time the connection changes and every
+        `poll_interval` seconds, until `settled()` is true of what it
+        returns or `timeout` seconds have passed, and return what it
+        returned last.
+        """
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            waiting = self.waiting.get(service_id)
+            if waiting is None:
+                waiting = self.waiting[service_id] = _Waiting(self.lock)
+            waiting.waiters += 1
+
+        try:
+            while True:
+                # Changes made while reading are not missed, because
+                # they are counted from before the read.
+                with self.lock:
+                    changes = waiting.changes
+                value = read()
+                if settled(value):
+                    return value
+
+                with self.lock:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return value
+                    if self.poll_interval > 0:
+                        remaining = min(remaining, self.poll_interval)
+                    waiting.condition.wait_for(
+                        lambda: waiting.changes != changes, remaining
+                    )
+        finally:
+            with self.lock:
+                waiting.waiters -= 1
+                if not waiting.waiters:
+                    del self.waiting[service_id]
+
+
+_connection_events = ConnectionEvents()
+
+
+def get_connection_events():
+    """
+    Return the connection events shared by this process.
+    """
+    return _connection_events
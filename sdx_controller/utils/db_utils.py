@@ -1,14 +1,47 @@
+import json
 import logging
 import os
+import threading
 import time
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime, timezone
 from urllib.parse import urlparse
 
 import pymongo
-from sdx_datamodel.constants import MongoCollections
+from sdx_datamodel.constants import Constants, MongoCollections
+
+from sdx_controller.utils.parse_helper import ParseHelper
 
 pymongo_logger = logging.getLogger("pymongo")
 pymongo_logger.setLevel(logging.INFO)
 
+MongoCollections.CONNECTION_HISTORY = "connection_history"
+# One document per port (or link) listing the connections placed on it.
+MongoCollections.PORT_CONNECTIONS = "port_connections"
+MongoCollections.LINK_CONNECTIONS = "link_connections"
+
+# Collections that hold one document per event, indexed on (key,
+# timestamp), rather than one document per key.
+EVENT_COLLECTIONS = (MongoCollections.CONNECTION_HISTORY,)
+
+MongoCollections.TOPOLOGY_HISTORY = "topology_history"
+# Content hash of the topology last applied, by domain.
+MongoCollections.TOPOLOGY_HASHES = "topology_hashes"
+
+# Collections that hold one document per version of a key, with a
+# unique index on (key, version).
+VERSIONED_COLLECTIONS = (MongoCollections.TOPOLOGY_HISTORY,)
+
+# Number of values kept in the process-local cache of connections and
+# breakdowns.  The cache is disabled when this is 0, which is the
+# default, since it is only coherent when a single controller process
+# writes to the database.
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "0"))
+
+# Collections whose values are cached.
+CACHED_COLLECTIONS = (MongoCollections.CONNECTIONS, MongoCollections.BREAKDOWNS)
+
 
 def obfuscate_password_in_uri(uri: str) -> str:
     """
@@ -21,6 +54,140 @@ def obfuscate_password_in_uri(uri: str) -> str:
         return uri
 
 
+def _epoch_seconds(timestamp):
+    """
+    Return an archive timestamp, given as seconds since the epoch or as
+    an ISO 8601 date and time (UTC unless it says otherwise), as
+    seconds since the epoch, or None if it is neither.
+    """
+    if isinstance(timestamp, int):
+        return timestamp
+    timestamp = str(timestamp)
+    if timestamp.isdigit():
+        return int(timestamp)
+    try:
+        archived_at = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if archived_at.tzinfo is None:
+        archived_at = archived_at.replace(tzinfo=timezone.utc)
+    return int(archived_at.timestamp())
+
+
+class LruCache(object):
+    """
+    A bounded, thread-safe LRU cache, with hit/miss counters.
+
+    Values are copied on the way in and out, so that callers can
+    mutate what they get without changing the cached values.  A cache
+    with `max_size` of 0 never holds anything.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Counts changes, so that values read from the database before
+        # a concurrent write are not cached after that write.
+        self._writes = 0
+
+    def get(self, key):
+        """
+        Return a `(found, value)` tuple.
+        """
+        if self.max_size <= 0:
+            return False, None
+
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, deepcopy(self._entries[key])
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        value = deepcopy(value)
+        with self._lock:
+            self._writes += 1
+            self._store(key, value)
+
+    def fill_token(self):
+        """
+        Return a token to pass to `fill()` after reading a value from
+        the database.
+        """
+        with self._lock:
+            return self._writes
+
+    def fill(self, key, value, token):
+        """
+        Cache a value read from the database, unless the cache has
+        been changed since `token` was taken.
+        """
+        if self.max_size <= 0:
+            return
+
+        value = deepcopy(value)
+        with self._lock:
+            if token == self._writes:
+                self._store(key, value)
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def update_fields(self, key, fields):
+        """
+        Update some fields of a cached dict, if the dict is cached.
+        """
+        if self.max_size <= 0:
+            return
+
+        fields = deepcopy(fields)
+        with self._lock:
+            self._writes += 1
+            value = self._entries.get(key)
+            if isinstance(value, dict) and not any("." in name for name in fields):
+                value.update(fields)
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._writes += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Shared by all DbUtils instances in this process, so that writes made
+# through one instance are seen by reads made through the others.
+db_cache = LruCache(DB_CACHE_SIZE)
+
+
 class DbUtils(object):
     def __init__(self):
         self.db_name = os.environ.get("DB_NAME")
@@ -52,6 +219,7 @@ class DbUtils(object):
         self.logger.info(f"[DB] Using {obfuscate_password_in_uri(mongo_connstring)}")
 
         self.mongo_client = pymongo.MongoClient(mongo_connstring)
+        self.cache = db_cache
 
     def initialize_db(self):
         """
@@ -67,47 +235,83 @@ class DbUtils(object):
         self.sdxdb = self.mongo_client[self.db_name]
         # config_col = self.sdxdb[self.config_table_name]
         for key, collection in MongoCollections.__dict__.items():
-            if (
-                not key.startswith("__")
-                and collection not in self.sdxdb.list_collection_names()
-            ):
+            if key.startswith("__"):
+                continue
+            if collection not in self.sdxdb.list_collection_names():
                 self.sdxdb.create_collection(collection)
+            if collection in EVENT_COLLECTIONS:
+                self.sdxdb[collection].create_index(
+                    [("key", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)]
+                )
+                continue
+            if collection in VERSIONED_COLLECTIONS:
+                self.sdxdb[collection].create_index(
+                    [("key", pymongo.ASCENDING), ("version", pymongo.ASCENDING)],
+                    unique=True,
+                )
+                continue
+            # Documents are looked up by their `_id` index; convert
+            # any documents written in the old `{key: value}` shape.
+            self.migrate_legacy_documents(collection)
+
+        self.migrate_connections_dicts()
+        self.migrate_historical_connections()
+        self.migrate_topology_versions()
 
         self.logger.debug(f"DB {self.db_name} initialized")
 
+    def _cache_key(self, collection, key):
+        """
+        Return a cache key, or None if the collection is not cached.
+        """
+        if collection not in CACHED_COLLECTIONS:
+            return None
+        return (self.db_name, collection, key)
+
+    def _invalidate_cache(self, collection, key):
+        cache_key = self._cache_key(collection, key)
+        if cache_key:
+            self.cache.invalidate(cache_key)
+
+    def get_cache_stats(self):
+        """
+        Return counters of the connection/breakdown cache.
+        """
+        return self.cache.stats()
+
     def add_key_value_pair_to_db(self, collection, key, value, max_retries=3):
         """
         Adds or replaces a key-value pair in the database.
+
+        This is a single upsert.  On success, the returned
+        `UpdateResult` tells whether the document was inserted
+        (`upserted_id` is set), modified (`modified_count == 1`), or
+        left unchanged because it already had the given value
+        (`modified_count == 0`).  Returns None on failure.
         """
         key = str(key)
+        document = {"_id": key, "value": value, "deleted": False}
         retry_count = 0
 
         while retry_count < max_retries:
             try:
-                obj = self.read_from_db(collection, key)
-
-                if obj is None:
-                    # Document doesn't exist, create a new one
-                    document = {key: value}
-                    result = self.sdxdb[collection].insert_one(document)
-
-                    if result.acknowledged and result.inserted_id:
-                        return result
-                    logging.error("Insert operation not acknowledged")
-
-                else:
-                    # Document exists, replace with new key-value pair
-                    new_document = {key: value}
-                    new_document["_id"] = obj["_id"]
+                result = self.sdxdb[collection].replace_one(
+                    {"_id": key}, document, upsert=True
+                )
+                if not result.acknowledged:
+                    logging.error("Upsert operation not acknowledged")
+                    self._invalidate_cache(collection, key)
+                    return None
 
-                    query = {"_id": obj["_id"]}
-                    result = self.sdxdb[collection].replace_one(query, new_document)
+                cache_key = self._cache_key(collection, key)
+                if cache_key:
+                    self.cache.put(cache_key, value)
 
-                    if result.acknowledged and result.modified_count == 1:
-                        return result
-                    logging.error(
-                        f"Replace operation not successful: modified_count={result.modified_count}"
+                if result.upserted_id is None and result.modified_count == 0:
+                    self.logger.debug(
+                        f"Value unchanged. Collection: {collection}, Key: {key}"
                     )
+                return result
 
             except Exception as e:
                 retry_count += 1
@@ -115,6 +319,7 @@ class DbUtils(object):
                     logging.error(
                         f"Failed to add key-value pair after {max_retries} attempts. Collection: {collection}, Key: {key}. Error: {str(e)}"
                     )
+                    self._invalidate_cache(collection, key)
                     return None
 
                 time.sleep(0.5 * (2**retry_count))
@@ -128,44 +333,88 @@ class DbUtils(object):
         """
         Updates a single field in a JSON object.
         """
+        return self.update_fields_in_json(collection, key, {field_name: field_value})
+
+    def update_fields_in_json(self, collection, key, fields, increments=None):
+        """
+        Updates several fields in a JSON object, in one atomic
+        operation.
+
+        `fields` is a dict of field names and their new values, and
+        `increments` is an optional dict of numeric fields and the
+        amounts to add to them.
+        """
         key = str(key)
+        increments = increments or {}
 
         try:
-            # Update a nested field directly
-            # Format: {key}.{field_name} targets a specific field within a JSON object
-            update_query = {"$set": {f"{key}.{field_name}": field_value}}
+            # Update nested fields directly
+            # Format: value.{field_name} targets a specific field within a JSON object
+            update_query = {}
+            if fields:
+                update_query["$set"] = {
+                    f"value.{field_name}": field_value
+                    for field_name, field_value in fields.items()
+                }
+            if increments:
+                update_query["$inc"] = {
+                    f"value.{field_name}": amount
+                    for field_name, amount in increments.items()
+                }
+            if not update_query:
+                return None
 
-            # Perform atomic update operation
-            result = self.sdxdb[collection].update_one(
-                {key: {"$exists": True}},  # Find document where the key exists
-                update_query,
-            )
+            # Perform atomic update operation, looked up by primary key.
+            result = self.sdxdb[collection].update_one({"_id": key}, update_query)
 
             if result.matched_count == 0:
                 logging.error(
                     f"Document with key '{key}' not found in collection '{collection}'"
                 )
+                self._invalidate_cache(collection, key)
                 return None
 
+            cache_key = self._cache_key(collection, key)
+            if cache_key:
+                if increments:
+                    # The incremented values are only known to the DB.
+                    self.cache.invalidate(cache_key)
+                else:
+                    self.cache.update_fields(cache_key, fields)
             return result
 
         except Exception as e:
             logging.error(
-                f"Failed to update field. Collection: {collection}, Key: {key}, Field: {field_name}. Error: {str(e)}"
+                f"Failed to update fields. Collection: {collection}, Key: {key}, Fields: {list(fields)}. Error: {str(e)}"
             )
+            self._invalidate_cache(collection, key)
             return None
 
     def read_from_db(self, collection, key):
         """
         Reads a document from the database using the specified key.
+
+        The document is returned in the `{"_id": key, key: value}`
+        shape, so that callers can look up the value by key.
         """
         key = str(key)
+        cache_key = self._cache_key(collection, key)
+        if cache_key:
+            found, value = self.cache.get(cache_key)
+            if found:
+                return {"_id": key, key: value}
+            token = self.cache.fill_token()
+
         try:
-            # Find document where the key exists and not marked as deleted
+            # Find document by key, if it is not marked as deleted
             result = self.sdxdb[collection].find_one(
-                {"$expr": {"$getField": key}, "deleted": {"$ne": True}}
+                {"_id": key, "deleted": {"$ne": True}}
             )
-            return result
+            if result is None:
+                return None
+            if cache_key:
+                self.cache.fill(cache_key, result.get("value"), token)
+            return {"_id": key, key: result.get("value")}
         except Exception as e:
             logging.error(
                 f"Error reading from database. Collection: {collection}, Key: {key}. Error: {str(e)}"
@@ -176,20 +425,235 @@ class DbUtils(object):
         """
         Gets just the value for a specific key from the database.
         """
+        key = str(key)
         document = self.read_from_db(collection, key)
 
         if document and key in document:
             return document[key]
         return None
 
-    def get_all_entries_in_collection(self, collection):
+    def get_values_from_db(self, collection, keys):
+        """
+        Gets the values for several keys in one query, as a
+        `{key: value}` dict.  Keys that are not found are left out.
+        """
+        keys = [str(key) for key in keys]
+        try:
+            documents = self.sdxdb[collection].find(
+                {"_id": {"$in": keys}, "deleted": {"$ne": True}}
+            )
+            return {document["_id"]: document.get("value") for document in documents}
+        except Exception as e:
+            logging.error(
+                f"Error reading from database. Collection: {collection}, Keys: {keys}. Error: {str(e)}"
+            )
+            return {}
+
+    def add_to_set_in_db(self, collection, key, item):
         """
-        Gets all entries in a Mongo collection
+        Adds an item to the list stored under a key, creating the
+        list if it does not exist yet.
+        """
+        key = str(key)
+        try:
+            return self.sdxdb[collection].update_one(
+                {"_id": key},
+                {"$addToSet": {"value": item}, "$set": {"deleted": False}},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.error(
+                f"Failed to add to set. Collection: {collection}, Key: {key}, Item: {item}. Error: {str(e)}"
+            )
+            return None
+
+    def remove_from_set_in_db(self, collection, key, item):
+        """
+        Removes an item from the list stored under a key.
+        """
+        key = str(key)
+        try:
+            return self.sdxdb[collection].update_one(
+                {"_id": key}, {"$pull": {"value": item}}
+            )
+        except Exception as e:
+            logging.error(
+                f"Failed to remove from set. Collection: {collection}, Key: {key}, Item: {item}. Error: {str(e)}"
+            )
+            return None
+
+    def get_all_entries_in_collection(self, collection, key_pattern=None):
+        """
+        Gets all entries in a Mongo collection, as `{key: value}`
+        dicts.  With `key_pattern`, only entries whose key matches that
+        regular expression are returned.
         """
         db_collection = self.sdxdb[collection]
-        # MongoDB has an ObjectId for each item, so need to exclude the ObjectIds
-        all_entries = db_collection.find({"deleted": {"$ne": True}}, {"_id": 0})
-        return all_entries
+        query = {"deleted": {"$ne": True}}
+        if key_pattern is not None:
+            query["_id"] = {"$regex": key_pattern}
+        all_entries = db_collection.find(query)
+        return ({entry["_id"]: entry.get("value")} for entry in all_entries)
+
+    def find_entries_in_collection(
+        self,
+        collection,
+        query=None,
+        fields=None,
+        after_key=None,
+        limit=None,
+        batch_size=100,
+    ):
+        """
+        Gets the entries of a Mongo collection that match a query, as
+        `{key: value}` dicts in key order.
+
+        `query` is a Mongo query on the stored documents, so fields of
+        the value are named "value.<field>".  With `fields`, only those
+        fields of the value are read.  Entries are read lazily from a
+        cursor, starting after `after_key`, and at most `limit` of them.
+        """
+        query = dict(query or {})
+        query["deleted"] = {"$ne": True}
+        if after_key is not None:
+            key_query = query.get("_id")
+            if not isinstance(key_query, dict):
+                key_query = {} if key_query is None else {"$eq": key_query}
+            query["_id"] = {**key_query, "$gt": str(after_key)}
+
+        projection = None
+        if fields is not None:
+            projection = {f"value.{field}": 1 for field in fields} or {"_id": 1}
+
+        cursor = (
+            self.sdxdb[collection]
+            .find(query, projection)
+            .sort("_id", pymongo.ASCENDING)
+            .batch_size(batch_size)
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        return ({entry["_id"]: entry.get("value")} for entry in cursor)
+
+    def add_event_to_db(self, collection, key, timestamp, event):
+        """
+        Appends an event for a key to an event collection.
+        """
+        key = str(key)
+        try:
+            return self.sdxdb[collection].insert_one(
+                {"key": key, "timestamp": timestamp, "value": event}
+            )
+        except Exception as e:
+            logging.error(
+                f"Failed to add event. Collection: {collection}, Key: {key}. Error: {str(e)}"
+            )
+            return None
+
+    def get_events_from_db(
+        self,
+        collection,
+        key=None,
+        batch_size=100,
+        after_key=None,
+        since=None,
+        until=None,
+    ):
+        """
+        Gets the events for a key, or for all keys if no key is given,
+        as `(key, timestamp, event)` tuples in (key, timestamp) order.
+
+        Events can be limited to keys after `after_key`, and to
+        timestamps from `since` up to `until`.  They are read lazily
+        from a cursor, `batch_size` documents at a time.
+        """
+        query = {}
+        if key is not None:
+            query["key"] = str(key)
+        elif after_key is not None:
+            query["key"] = {"$gt": str(after_key)}
+        timestamp_range = {}
+        if since is not None:
+            timestamp_range["$gte"] = since
+        if until is not None:
+            timestamp_range["$lte"] = until
+        if timestamp_range:
+            query["timestamp"] = timestamp_range
+
+        cursor = (
+            self.sdxdb[collection]
+            .find(query, {"_id": 0})
+            .sort([("key", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING)])
+            .batch_size(batch_size)
+        )
+        return (
+            (document["key"], document["timestamp"], document.get("value"))
+            for document in cursor
+        )
+
+    def add_version_to_db(self, collection, key, version, document):
+        """
+        Adds or replaces one version of a key in a versioned
+        collection.  `document` holds the fields to store along with
+        the key and version.
+        """
+        key = str(key)
+        try:
+            return self.sdxdb[collection].replace_one(
+                {"key": key, "version": version},
+                {**document, "key": key, "version": version},
+                upsert=True,
+            )
+        except Exception as e:
+            logging.error(
+                f"Failed to add version. Collection: {collection}, Key: {key}, Version: {version}. Error: {str(e)}"
+            )
+            return None
+
+    def get_version_from_db(self, collection, key, version):
+        """
+        Gets one version of a key from a versioned collection, or None.
+        """
+        return self.sdxdb[collection].find_one(
+            {"key": str(key), "version": version}, {"_id": 0}
+        )
+
+    def get_versions_from_db(
+        self, collection, key, min_version=None, max_version=None, fields=None
+    ):
+        """
+        Gets the versions of a key in a versioned collection, in
+        version order, optionally limited to a range of versions and
+        to some fields.
+        """
+        query = {"key": str(key)}
+        version_range = {}
+        if min_version is not None:
+            version_range["$gte"] = min_version
+        if max_version is not None:
+            version_range["$lte"] = max_version
+        if version_range:
+            query["version"] = version_range
+
+        projection = {"_id": 0}
+        if fields is not None:
+            projection.update({field: 1 for field in ("key", "version", *fields)})
+
+        return (
+            self.sdxdb[collection]
+            .find(query, projection)
+            .sort("version", pymongo.ASCENDING)
+        )
+
+    def delete_versions_from_db(self, collection, key, before_version):
+        """
+        Deletes the versions of a key older than `before_version`.
+        Returns the number of versions deleted.
+        """
+        result = self.sdxdb[collection].delete_many(
+            {"key": str(key), "version": {"$lt": before_version}}
+        )
+        return result.deleted_count
 
     def mark_deleted(self, collection, key):
         """
@@ -197,13 +661,11 @@ class DbUtils(object):
         """
         db_collection = self.sdxdb[collection]
         key = str(key)
-        item_to_delete = self.read_from_db(collection, key)
-        if item_to_delete is None:
-            return False
-        filter = {"_id": item_to_delete["_id"]}
+        filter = {"_id": key, "deleted": {"$ne": True}}
         update = {"$set": {"deleted": True}}
-        db_collection.update_one(filter, update)
-        return True
+        result = db_collection.update_one(filter, update)
+        self._invalidate_cache(collection, key)
+        return result.matched_count > 0
 
     def delete_one_entry(self, collection, key):
         """
@@ -211,4 +673,152 @@ class DbUtils(object):
         """
         key = str(key)
         db_collection = self.sdxdb[collection]
-        db_collection.delete_one({key: {"$exists": True}})
+        db_collection.delete_one({"_id": key})
+        self._invalidate_cache(collection, key)
+
+    def migrate_connections_dicts(self):
+        """
+        Move port/link to connection mappings saved as one JSON blob
+        into per-port and per-link documents.
+
+        Adding a service ID to a set is idempotent, so a migration
+        that was interrupted is finished by running it again.
+        """
+        for collection, key, index_collection in (
+            (
+                MongoCollections.PORTS,
+                Constants.PORT_CONNECTIONS_DICT,
+                MongoCollections.PORT_CONNECTIONS,
+            ),
+            (
+                MongoCollections.LINKS,
+                Constants.LINK_CONNECTIONS_DICT,
+                MongoCollections.LINK_CONNECTIONS,
+            ),
+        ):
+            connections_dict_json = self.get_value_from_db(collection, key)
+            if not connections_dict_json:
+                continue
+
+            connections_dict = json.loads(connections_dict_json)
+            for index_key, service_ids in connections_dict.items():
+                for service_id in service_ids:
+                    self.add_to_set_in_db(index_collection, index_key, service_id)
+            self.delete_one_entry(collection, key)
+            self.logger.info(f"[DB] Migrated {key} to {index_collection}")
+
+    def migrate_historical_connections(self):
+        """
+        Move archived connections saved as one list per service_id
+        into one history document per archive event.
+
+        Events are upserted by (key, timestamp), so a migration that
+        was interrupted is finished by running it again, without
+        archiving any event twice.  Timestamps are stored as seconds
+        since the epoch; older entries that were archived with a date
+        and time string are converted, taking it to be in UTC.  An
+        entry with a timestamp that cannot be read is logged and left
+        where it is.
+        """
+        history = self.sdxdb[MongoCollections.CONNECTION_HISTORY]
+        for entry in self.get_all_entries_in_collection(
+            MongoCollections.HISTORICAL_CONNECTIONS
+        ):
+            service_id, historical_connections_list = next(iter(entry.items()))
+            unparsed = 0
+            for archived_event in historical_connections_list or []:
+                for archived_at, event in archived_event.items():
+                    timestamp = _epoch_seconds(archived_at)
+                    if timestamp is None:
+                        self.logger.warning(
+                            f"[DB] Not migrating archived connection {service_id} "
+                            f"with unknown timestamp {archived_at!r}"
+                        )
+                        unparsed += 1
+                        continue
+                    history.update_one(
+                        {"key": str(service_id), "timestamp": timestamp},
+                        {"$setOnInsert": {"value": event}},
+                        upsert=True,
+                    )
+            if unparsed:
+                # Keep the old entry, so that those events are not lost.
+                continue
+            self.delete_one_entry(MongoCollections.HISTORICAL_CONNECTIONS, service_id)
+            self.logger.info(f"[DB] Migrated archived connections of {service_id}")
+
+    def migrate_topology_versions(self):
+        """
+        Move topology versions saved as "{id}-{version}" entries of the
+        topologies collection into the topology history.
+
+        Versions are upserted by (key, version), so a migration that
+        was interrupted is finished by running it again.  Old versions
+        are removed as new ones of the same domain are added.
+        """
+        parse_helper = ParseHelper()
+        entries = self.get_all_entries_in_collection(
+            MongoCollections.TOPOLOGIES, key_pattern=r"-\d+$"
+        )
+        for entry in entries:
+            key, topology = next(iter(entry.items()))
+            if not isinstance(topology, dict) or not isinstance(
+                topology.get("id"), str
+            ):
+                continue
+            if key != f"{topology['id']}-{topology.get('version')}":
+                continue
+            domain = topology.get("domain_name") or parse_helper.find_domain_name(
+                topology["id"], ":"
+            )
+            self.add_version_to_db(
+                MongoCollections.TOPOLOGY_HISTORY,
+                domain,
+                topology["version"],
+                {"received_at": time.time(), "topology": topology},
+            )
+            self.delete_one_entry(MongoCollections.TOPOLOGIES, key)
+            self.logger.info(f"[DB] Moved topology {key} to history")
+
+    def migrate_legacy_documents(self, collection):
+        """
+        Convert documents of the old `{key: value}` shape into the
+        `{"_id": key, "value": value, "deleted": bool}` shape.
+
+        Old documents are recognized by their generated ObjectId.  A
+        live old document wins over a deleted one with the same key,
+        and a document already stored in the new shape wins over both.
+        Malformed old documents are left as they are.
+        """
+        db_collection = self.sdxdb[collection]
+        legacy_filter = {"_id": {"$type": "objectId"}}
+        if db_collection.count_documents(legacy_filter, limit=1) == 0:
+            return 0
+
+        migrated = 0
+        skipped = []
+        # Handle live entries first, so that they take precedence over
+        # deleted entries with the same key.
+        for deleted in (False, True):
+            deleted_filter = True if deleted else {"$ne": True}
+            legacy_documents = db_collection.find(
+                {**legacy_filter, "deleted": deleted_filter}
+            )
+            for document in legacy_documents:
+                keys = [k for k in document if k not in ("_id", "deleted")]
+                if len(keys) != 1:
+                    self.logger.warning(
+                        f"[DB] Not migrating malformed document {document['_id']} in {collection}"
+                    )
+                    skipped.append(document["_id"])
+                    continue
+                key = str(keys[0])
+                new_document = {"value": document[keys[0]], "deleted": deleted}
+                db_collection.update_one(
+                    {"_id": key}, {"$setOnInsert": new_document}, upsert=True
+                )
+                migrated += 1
+
+        db_collection.delete_many({"_id": {"$type": "objectId", "$nin": skipped}})
+        self.logger.info(f"[DB] Migrated {migrated} legacy documents in {collection}")
+        return migrated
@@ -0,0 +1,79 @@
+import json
+import os
+
+from flask import Response
+
+from sdx_controller.encoder import JSONEncoder
+
+# Size in characters of the pieces a streamed JSON response is sent in.
+JSON_STREAM_CHUNK_SIZE = int(os.getenv("JSON_STREAM_CHUNK_SIZE", 65536))
+
+# The app's encoder, so that models, dates and the like are encoded
+# the same way as in other responses.
+_encoder = JSONEncoder()
+
+
+def iter_json(value):
+    """
+    Encode a value as JSON, a piece at a time.
+    """
+    return _encoder.iterencode(value)
+
+
+def iter_json_object(items):
+    """
+    Encode `(key, value)` pairs as a JSON object, a piece at a time,
+    reading the pairs only as they are needed.
+    """
+    yield "{"
+    separator = ""
+    for key, value in items:
+        yield f"{separator}{json.dumps(str(key))}: "
+        yield from _encoder.iterencode(value)
+        separator = ", "
+    yield "}"
+
+
+def iter_json_array(values):
+    """
+    Encode values as a JSON array, a piece at a time, reading the
+    values only as they are needed.
+    """
+    yield "["
+    separator = ""
+    for value in values:
+        yield separator
+        yield from _encoder.iterencode(value)
+        separator = ", "
+    yield "]"
+
+
+def chunked(pieces, chunk_size=JSON_STREAM_CHUNK_SIZE):
+    """
+    Join pieces of text into chunks of at least `chunk_size`
+    characters, but the last one.
+    """
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield "".join(chunk)
+
+
+def json_stream_response(pieces, status=200, headers=None):
+    """
+    Return a response that sends pieces of JSON text as they are
+    made, so that a large response is never held in memory whole.
+    """
+    return Response(
+        chunked(pieces),
+        status=status,
+        headers=headers,
+        mimetype="application/json",
+    )
@@ -1,5 +1,59 @@
+import hashlib
 import json
 
+try:
+    # orjson parses large topology documents several times faster than
+    # the json module; use it when it is installed.
+    import orjson
+
+    def loads_json(data):
+        return orjson.loads(data)
+
+    def dumps_canonical_json(data):
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+except ImportError:
+
+    def loads_json(data):
+        return json.loads(data)
+
+    def dumps_canonical_json(data):
+        return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+
+def content_hash(data, ignored_keys=()):
+    """
+    Return a digest of the canonical JSON form of a dict, leaving out
+    the top-level `ignored_keys`.
+    """
+    data = {key: value for key, value in data.items() if key not in ignored_keys}
+    return hashlib.sha256(dumps_canonical_json(data)).hexdigest()
+
+
+HEARTBEAT_MSG_TYPE = "Heart Beat"
+TOPOLOGY_MSG_TYPE = "topology"
+
+
+class LcMessage:
+    """
+    A message received from a local controller, parsed once.
+
+    `msg_type` is the "msg_type" (or, for heartbeats, "type") of the
+    message, or "topology" for topology updates.  `domain` is the
+    domain the message is about, if known, and `payload` is the parsed
+    message.
+    """
+
+    __slots__ = ("msg_type", "domain", "payload")
+
+    def __init__(self, msg_type, domain, payload):
+        self.msg_type = msg_type
+        self.domain = domain
+        self.payload = payload
+
+    def __repr__(self):
+        return f"LcMessage(msg_type={self.msg_type!r}, domain={self.domain!r})"
+
 
 class ParseHelper:
     def __init__(self):
@@ -7,11 +61,37 @@ class ParseHelper:
 
     def is_json(self, json_str):
         try:
-            json.loads(json_str)
+            loads_json(json_str)
         except ValueError:
             return False
         return True
 
+    def parse_lc_message(self, message_body):
+        """
+        Parse a message received from a local controller.
+
+        Returns an LcMessage, or None if the message is not a JSON
+        object.
+        """
+        try:
+            payload = loads_json(message_body)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+
+        if payload.get("type") == HEARTBEAT_MSG_TYPE:
+            return LcMessage(HEARTBEAT_MSG_TYPE, payload.get("domain"), payload)
+
+        msg_type = payload.get("msg_type")
+        if msg_type:
+            return LcMessage(msg_type, payload.get("lc_domain"), payload)
+
+        domain = None
+        if isinstance(payload.get("id"), str):
+            domain = self.find_domain_name(payload["id"], ":")
+        return LcMessage(TOPOLOGY_MSG_TYPE, domain, payload)
+
     def find_domain_name(self, topology_id, delimiter):
         """
         Find domain name from topology id.
@@ -0,0 +1,17 @@
+import threading
+
+# The TE manager, with the topology, VLAN tables and bandwidth in it,
+# is not thread-safe.  HTTP requests, the placement queue, LC message
+# workers, restart recovery and the topology writer all use the same
+# one, so each of them holds this lock while using it.
+_te_lock = threading.RLock()
+
+
+def get_te_lock():
+    """
+    Return the lock that guards the TE manager of this process.
+
+    The lock is reentrant, so that a handler holding it can call
+    another that takes it too.
+    """
+    return _te_lock
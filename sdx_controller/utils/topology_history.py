@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+from copy import deepcopy
+
+# MongoCollections.TOPOLOGY_HISTORY is set up by db_utils.
+from sdx_controller.utils.db_utils import MongoCollections
+
+logger = logging.getLogger(__name__)
+
+# Number of versions of each domain's topology to keep (0 keeps all).
+TOPOLOGY_HISTORY_MAX_VERSIONS = int(os.getenv("TOPOLOGY_HISTORY_MAX_VERSIONS", 100))
+# Days to keep versions of a domain's topology for (0 keeps them all).
+# The newest version of a domain is always kept.
+TOPOLOGY_HISTORY_MAX_AGE_DAYS = float(os.getenv("TOPOLOGY_HISTORY_MAX_AGE_DAYS", 0))
+# Store versions as differences from the previous version, with a full
+# copy once every TOPOLOGY_HISTORY_SNAPSHOT_INTERVAL versions.
+TOPOLOGY_HISTORY_DIFFS = os.getenv("TOPOLOGY_HISTORY_DIFFS", "false").lower() == "true"
+TOPOLOGY_HISTORY_SNAPSHOT_INTERVAL = int(
+    os.getenv("TOPOLOGY_HISTORY_SNAPSHOT_INTERVAL", 10)
+)
+
+# Topology fields that hold lists of elements with an "id".
+ELEMENT_FIELDS = ("nodes", "links")
+
+
+def topology_diff(old, new):
+    """
+    Return the changes that turn topology `old` into `new`, as a dict
+    that apply_topology_diff() takes, or None if the topologies have
+    elements without an ID.
+    """
+    diff = {"set": {}, "unset": [], "elements": {}}
+
+    for key, value in new.items():
+        if key in ELEMENT_FIELDS:
+            continue
+        if key not in old or old[key] != value:
+            diff["set"][key] = value
+    diff["unset"] = [key for key in old if key not in new]
+
+    for field in ELEMENT_FIELDS:
+        if field not in new:
+            continue
+        old_elements = old.get(field) or []
+        new_elements = new.get(field) or []
+        if not all("id" in element for element in old_elements + new_elements):
+            return None
+        old_by_id = {element["id"]: element for element in old_elements}
+        diff["elements"][field] = {
+            "order": [element["id"] for element in new_elements],
+            "changed": [
+                element
+                for element in new_elements
+                if old_by_id.get(element["id"]) != element
+            ],
+        }
+
+    return diff
+
+
+def apply_topology_diff(old, diff):
+    """
+    Return the topology made by applying a diff from topology_diff()
+    to topology `old`.
+    """
+    new = {key: value for key, value in old.items() if key not in diff["unset"]}
+    new.update(diff["set"])
+
+    for field, changes in diff["elements"].items():
+        elements = {element["id"]: element for element in old.get(field) or []}
+        elements.update({element["id"]: element for element in changes["changed"]})
+        new[field] = [elements[element_id] for element_id in changes["order"]]
+
+    return new
+
+
+class TopologyHistory(object):
+    """
+    Keep past versions of each domain's topology.
+
+    Versions are stored in the topology_history collection, one
+    document per (domain, version), so that any version can be found
+    through the index without scanning.  Old versions are removed
+    according to the retention settings.  When diffs are enabled, most
+    versions are stored as the changes from the version before them.
+    """
+
+    def __init__(
+        self,
+        db_instance,
+        max_versions=TOPOLOGY_HISTORY_MAX_VERSIONS,
+        max_age_days=TOPOLOGY_HISTORY_MAX_AGE_DAYS,
+        store_diffs=TOPOLOGY_HISTORY_DIFFS,
+        snapshot_interval=TOPOLOGY_HISTORY_SNAPSHOT_INTERVAL,
+    ):
+        self.db_instance = db_instance
+        self.max_versions = max_versions
+        self.max_age_days = max_age_days
+        self.store_diffs = store_diffs
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.lock = threading.Lock()
+        # domain -> (version, topology, number of diffs since the last
+        # full copy) of the version last added.
+        self.latest = {}
+
+    def add_version(self, domain, version, topology):
+        """
+        Save a version of a domain's topology, and remove versions
+        that are no longer kept.
+        """
+        document = {"received_at": time.time()}
+        diffs_since_copy = 0
+
+        with self.lock:
+            latest = self.latest.get(domain)
+            diff = None
+            if (
+                self.store_diffs
+                and latest is not None
+                and latest[0] < version
+                and latest[2] + 1 < self.snapshot_interval
+            ):
+                diff = topology_diff(latest[1], topology)
+            if diff is not None:
+                document.update({"base": latest[0], "diff": diff})
+                diffs_since_copy = latest[2] + 1
+            else:
+                document["topology"] = topology
+
+            self.db_instance.add_version_to_db(
+                MongoCollections.TOPOLOGY_HISTORY, domain, version, document
+            )
+            if self.store_diffs:
+                self.latest[domain] = (version, deepcopy(topology), diffs_since_copy)
+
+        self.apply_retention(domain)
+
+    def get_version(self, domain, version):
+        """
+        Return a domain's topology at a version, or None if that
+        version is not kept.
+        """
+        document = self.db_instance.get_version_from_db(
+            MongoCollections.TOPOLOGY_HISTORY, domain, version
+        )
+        diffs = []
+        while document is not None and "diff" in document:
+            diffs.append(document["diff"])
+            document = self.db_instance.get_version_from_db(
+                MongoCollections.TOPOLOGY_HISTORY, domain, document["base"]
+            )
+        if document is None:
+            if diffs:
+                logger.error(f"Base of topology {domain} version {version} is missing")
+            return None
+
+        topology = document["topology"]
+        for diff in reversed(diffs):
+            topology = apply_topology_diff(topology, diff)
+        return topology
+
+    def get_versions(self, domain):
+        """
+        Return the versions kept of a domain's topology, oldest first.
+        """
+        return [
+            document["version"]
+            for document in self.db_instance.get_versions_from_db(
+                MongoCollections.TOPOLOGY_HISTORY, domain, fields=()
+            )
+        ]
+
+    def apply_retention(self, domain):
+        """
+        Remove the versions of a domain's topology that are too many or
+        too old.  Returns the number of versions removed.
+        """
+        if not self.max_versions and not self.max_age_days:
+            return 0
+
+        versions = list(
+            self.db_instance.get_versions_from_db(
+                MongoCollections.TOPOLOGY_HISTORY,
+                domain,
+                fields=("received_at", "base"),
+            )
+        )
+        kept = versions
+        if self.max_versions:
+            kept = kept[-self.max_versions :]
+        if self.max_age_days:
+            oldest_time = time.time() - self.max_age_days * 86400
+            kept = [
+                document
+                for document in kept
+                if document.get("received_at", 0) >= oldest_time
+            ] or kept[-1:]
+        if len(kept) == len(versions):
+            return 0
+
+        # Versions that are kept must not depend on removed ones.
+        oldest_version = kept[0]["version"]
+        for document in kept:
+            if "base" in document and document["base"] < oldest_version:
+                self.db_instance.add_version_to_db(
+                    MongoCollections.TOPOLOGY_HISTORY,
+                    domain,
+                    document["version"],
+                    {
+                        "received_at": document.get("received_at"),
+                        "topology": self.get_version(domain, document["version"]),
+                    },
+                )
+
+        return self.db_instance.delete_versions_from_db(
+            MongoCollections.TOPOLOGY_HISTORY, domain, oldest_version
+        )
@@ -0,0 +1,455 @@
+import json
+import logging
+import os
+import threading
+from copy import deepcopy
+
+from sdx_datamodel.constants import Constants, MongoCollections
+
+from sdx_controller.utils.json_stream import iter_json, iter_json_array
+from sdx_controller.utils.parse_helper import content_hash
+from sdx_controller.utils.te_lock import get_te_lock
+
+logger = logging.getLogger(__name__)
+
+MongoCollections.LATEST_TOPOLOGY_ELEMENTS = "latest_topology_elements"
+
+# Set in a LATEST_TOPOLOGY document that holds only the IDs of nodes
+# and links, whose contents are in LATEST_TOPOLOGY_ELEMENTS.
+ELEMENTS_FIELD = "elements_stored_separately"
+DIGEST_FIELD = "digest"
+
+# Topology changes made by placing or removing connections are written
+# to the database at most once per this many seconds, so that a burst
+# of changes is written once.  With 0, they are written right away.
+TOPOLOGY_DB_UPDATE_INTERVAL = float(os.getenv("TOPOLOGY_DB_UPDATE_INTERVAL", 1))
+
+# Number of nodes or links read at a time when streaming the topology.
+TOPOLOGY_STREAM_BATCH_SIZE = int(os.getenv("TOPOLOGY_STREAM_BATCH_SIZE", 100))
+
+
+def _split_topology(topology):
+    """
+    Split a topology into a header, where nodes, links and the ports
+    of nodes are replaced by their IDs, and a dict of those elements
+    keyed by "node:<id>", "port:<id>" and "link:<id>".
+    """
+    header = {
+        key: value for key, value in topology.items() if key not in ("nodes", "links")
+    }
+    elements = {}
+
+    node_ids = []
+    for node in topology.get("nodes") or []:
+        node = dict(node)
+        port_ids = []
+        for port in node.get("ports") or []:
+            elements[f"port:{port['id']}"] = port
+            port_ids.append(port["id"])
+        node["ports"] = port_ids
+        elements[f"node:{node['id']}"] = node
+        node_ids.append(node["id"])
+
+    link_ids = []
+    for link in topology.get("links") or []:
+        elements[f"link:{link['id']}"] = link
+        link_ids.append(link["id"])
+
+    header["nodes"] = node_ids
+    header["links"] = link_ids
+    header[ELEMENTS_FIELD] = True
+    return header, elements
+
+
+def _join_topology(header, elements):
+    """
+    Put together a topology split by _split_topology().
+    """
+    topology = {
+        key: value
+        for key, value in header.items()
+        if key not in (ELEMENTS_FIELD, DIGEST_FIELD)
+    }
+
+    nodes = []
+    for node_id in header.get("nodes", []):
+        node = elements.get(f"node:{node_id}")
+        if node is None:
+            logger.warning(f"Node {node_id} of latest topology is not in the DB")
+            continue
+        node = dict(node)
+        node["ports"] = [
+            elements[f"port:{port_id}"]
+            for port_id in node.get("ports", [])
+            if f"port:{port_id}" in elements
+        ]
+        nodes.append(node)
+
+    links = []
+    for link_id in header.get("links", []):
+        link = elements.get(f"link:{link_id}")
+        if link is None:
+            logger.warning(f"Link {link_id} of latest topology is not in the DB")
+            continue
+        links.append(link)
+
+    topology["nodes"] = nodes
+    topology["links"] = links
+    return topology
+
+
+class TopologyStore(object):
+    """
+    Save topologies to the database, writing only what has changed.
+
+    Each domain's topology is written only when its content differs
+    from what was last written.  The merged SDX topology is stored as
+    a small LATEST_TOPOLOGY document, with one document per node, port
+    and link in LATEST_TOPOLOGY_ELEMENTS, so that an update rewrites
+    just the elements that changed.  The last merged topology read or
+    written is kept in memory, and reused while the digest stored in
+    LATEST_TOPOLOGY matches it.
+
+    Copies of topologies may be saved by different threads, and reach
+    the database in another order than they were taken in.  A copy
+    taken with a sequence number from `next_sequence()` is not written
+    over one with a greater number.
+    """
+
+    def __init__(self, db_instance, interval=TOPOLOGY_DB_UPDATE_INTERVAL):
+        self.db_instance = db_instance
+        self.interval = interval
+        self.lock = threading.Lock()
+        # TE manager whose topologies are waiting to be written.
+        self.pending = None
+        self.pending_lock = threading.Lock()
+        self.pending_event = threading.Event()
+        self.exit_event = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.writer = None
+        # Content hash of each element in the database; loaded when
+        # the latest topology is first saved.
+        self.element_hashes = None
+        # Content hash of the topology last written for each domain.
+        self.domain_hashes = {}
+        # (digest, topology) of the latest topology.
+        self.snapshot = None
+        # Last sequence number given out, and the greatest one written
+        # for each domain topology and for the latest topology.
+        self.sequence = 0
+        self.written_sequences = {}
+        self.counters = {
+            "domains_written": 0,
+            "domains_unchanged": 0,
+            "elements_written": 0,
+            "elements_deleted": 0,
+            "updates_requested": 0,
+            "updates_written": 0,
+            "outdated_skipped": 0,
+        }
+
+    def _load_element_hashes(self):
+        self.element_hashes = {}
+        for entry in self.db_instance.get_all_entries_in_collection(
+            MongoCollections.LATEST_TOPOLOGY_ELEMENTS
+        ):
+            key, value = next(iter(entry.items()))
+            if isinstance(value, dict):
+                self.element_hashes[key] = content_hash(value)
+
+    def next_sequence(self):
+        """
+        Return a sequence number for a copy of a topology that is about
+        to be saved.  Take it while holding the TE lock, as the copy is
+        taken, so that numbers follow the order of changes to the TE
+        manager.
+        """
+        with self.lock:
+            self.sequence += 1
+            return self.sequence
+
+    def _is_outdated(self, key, sequence):
+        # Called with self.lock held.
+        if sequence is None:
+            return False
+        if sequence < self.written_sequences.get(key, 0):
+            self.counters["outdated_skipped"] += 1
+            return True
+        self.written_sequences[key] = sequence
+        return False
+
+    def save_domain_topology(self, topology_id, topology, sequence=None):
+        """
+        Save a domain's topology, unless it is the same as the one
+        last saved, or older than it by `sequence`.  Returns True if it
+        was written.
+        """
+        topology_hash = content_hash(topology)
+        with self.lock:
+            if self._is_outdated(topology_id, sequence):
+                return False
+            if self.domain_hashes.get(topology_id) == topology_hash:
+                self.counters["domains_unchanged"] += 1
+                return False
+            self.db_instance.add_key_value_pair_to_db(
+                MongoCollections.TOPOLOGIES, topology_id, topology
+            )
+            self.domain_hashes[topology_id] = topology_hash
+            self.counters["domains_written"] += 1
+            return True
+
+    def save_latest_topology(self, topology, sequence=None):
+        """
+        Save the merged SDX topology, writing only the nodes, ports and
+        links that were added or changed, and deleting those that were
+        removed.  Nothing is written if the topology is older, by
+        `sequence`, than the one last saved.
+        """
+        header, elements = _split_topology(topology)
+        hashes = {key: content_hash(value) for key, value in elements.items()}
+        header[DIGEST_FIELD] = content_hash({"header": header, "elements": hashes})
+
+        with self.lock:
+            if self._is_outdated(Constants.LATEST_TOPOLOGY, sequence):
+                return
+            if self.element_hashes is None:
+                self._load_element_hashes()
+
+            # Write elements before the header that refers to them,
+            # and delete old ones only once the header no longer does.
+            for key, value in elements.items():
+                if self.element_hashes.get(key) != hashes[key]:
+                    self.db_instance.add_key_value_pair_to_db(
+                        MongoCollections.LATEST_TOPOLOGY_ELEMENTS, key, value
+                    )
+                    self.element_hashes[key] = hashes[key]
+                    self.counters["elements_written"] += 1
+
+            self.db_instance.add_key_value_pair_to_db(
+                MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY, header
+            )
+
+            for key in set(self.element_hashes) - set(hashes):
+                self.db_instance.delete_one_entry(
+                    MongoCollections.LATEST_TOPOLOGY_ELEMENTS, key
+                )
+                del self.element_hashes[key]
+                self.counters["elements_deleted"] += 1
+
+            self.snapshot = (header[DIGEST_FIELD], topology)
+
+    def save_topologies(self, te_manager):
+        """
+        Save the domain topologies and the merged topology of a TE
+        manager.
+
+        The topologies are copied while holding the TE lock, so that
+        they do not change as they are copied, and written to the DB
+        once it is released, unless newer copies were written first.
+        """
+        topology_manager = te_manager.topology_manager
+        with get_te_lock():
+            domains = {
+                domain_name: topology.to_dict()
+                for domain_name, topology in topology_manager.get_topology_map().items()
+            }
+            latest = topology_manager.get_topology().to_dict()
+            sequence = self.next_sequence()
+        for domain_name, topology in domains.items():
+            self.save_domain_topology(domain_name, topology, sequence)
+        self.save_latest_topology(latest, sequence)
+        with self.lock:
+            self.counters["updates_written"] += 1
+
+    def schedule_save(self, te_manager):
+        """
+        Ask for the topologies of a TE manager to be saved.
+
+        Requests made within the update interval are written together,
+        by a background thread, once the interval is over.
+        """
+        with self.lock:
+            self.counters["updates_requested"] += 1
+        if self.interval <= 0:
+            self.save_topologies(te_manager)
+            return
+
+        with self.pending_lock:
+            self.pending = te_manager
+            if self.writer is None:
+                self.writer = threading.Thread(
+                    target=self._write_pending, name="topology-writer", daemon=True
+                )
+                self.writer.start()
+        self.pending_event.set()
+
+    def _write_pending(self):
+        while not self.exit_event.is_set():
+            self.pending_event.wait()
+            # Let more changes come in before writing them all.
+            self.exit_event.wait(self.interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                logger.exception(f"Failed to save topologies: {exc}")
+
+    def flush(self):
+        """
+        Save the topologies waiting to be written, if any.
+        """
+        with self.flush_lock:
+            with self.pending_lock:
+                te_manager = self.pending
+                self.pending = None
+                self.pending_event.clear()
+            if te_manager is None:
+                return
+            try:
+                self.save_topologies(te_manager)
+            except Exception:
+                # Try again later, unless there is something newer.
+                with self.pending_lock:
+                    if self.pending is None:
+                        self.pending = te_manager
+                        self.pending_event.set()
+                raise
+
+    def close(self):
+        """
+        Stop the background writer, and save what it has not saved.
+        """
+        self.exit_event.set()
+        self.pending_event.set()
+        if self.writer is not None:
+            self.writer.join()
+        self.flush()
+
+    def get_latest_topology(self):
+        """
+        Return the merged SDX topology, or None if there is none.
+        """
+        header = self.db_instance.get_value_from_db(
+            MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY
+        )
+        if not header:
+            return None
+        if not header.get(ELEMENTS_FIELD):
+            # Saved whole, before elements were stored separately.
+            return header
+
+        digest = header.get(DIGEST_FIELD)
+        with self.lock:
+            snapshot = self.snapshot
+        if snapshot is not None and snapshot[0] == digest:
+            return deepcopy(snapshot[1])
+
+        elements = {}
+        for entry in self.db_instance.get_all_entries_in_collection(
+            MongoCollections.LATEST_TOPOLOGY_ELEMENTS
+        ):
+            elements.update(entry)
+        topology = _join_topology(header, elements)
+
+        with self.lock:
+            self.snapshot = (digest, topology)
+        return deepcopy(topology)
+
+    def stream_latest_topology(self, batch_size=TOPOLOGY_STREAM_BATCH_SIZE):
+        """
+        Return the merged SDX topology as pieces of JSON text, or None
+        if there is none.
+
+        The topology is not put together in memory: nodes, ports and
+        links are read `batch_size` nodes or links at a time, as the
+        pieces are needed.
+        """
+        header = self.db_instance.get_value_from_db(
+            MongoCollections.TOPOLOGIES, Constants.LATEST_TOPOLOGY
+        )
+        if not header:
+            return None
+        if not header.get(ELEMENTS_FIELD):
+            # Saved whole, before elements were stored separately.
+            return iter_json(header)
+
+        with self.lock:
+            snapshot = self.snapshot
+        if snapshot is not None and snapshot[0] == header.get(DIGEST_FIELD):
+            # Snapshots are replaced, never changed, so this can be
+            # encoded without a copy.
+            return iter_json(snapshot[1])
+
+        return self._iter_topology_json(header, batch_size)
+
+    def _read_elements(self, keys):
+        elements = {}
+        for entry in self.db_instance.find_entries_in_collection(
+            MongoCollections.LATEST_TOPOLOGY_ELEMENTS, query={"_id": {"$in": keys}}
+        ):
+            elements.update(entry)
+        return elements
+
+    def _iter_elements(self, field, element_ids, batch_size):
+        # Nodes (with their ports) or links, read a batch at a time.
+        kind = field[:-1]
+        for start in range(0, len(element_ids), batch_size):
+            batch = element_ids[start : start + batch_size]
+            elements = self._read_elements([f"{kind}:{id}" for id in batch])
+            if field == "nodes":
+                elements.update(
+                    self._read_elements(
+                        [
+                            f"port:{port_id}"
+                            for node in elements.values()
+                            for port_id in node.get("ports", [])
+                        ]
+                    )
+                )
+            yield from _join_topology({field: batch}, elements)[field]
+
+    def _iter_topology_json(self, header, batch_size):
+        yield "{"
+        for key, value in header.items():
+            if key not in ("nodes", "links", ELEMENTS_FIELD, DIGEST_FIELD):
+                yield f"{json.dumps(key)}: "
+                yield from iter_json(value)
+                yield ", "
+        for separator, field in (("", "nodes"), (", ", "links")):
+            yield f'{separator}"{field}": '
+            yield from iter_json_array(
+                self._iter_elements(field, header.get(field, []), batch_size)
+            )
+        yield "}"
+
+    def stats(self):
+        """
+        Return counts of topology documents written and skipped.
+        """
+        with self.lock:
+            return dict(self.counters)
+
+
+_topology_store = None
+_topology_store_lock = threading.Lock()
+
+
+def get_topology_store(db_instance):
+    """
+    Return the topology store shared by this process, creating it
+    with `db_instance` the first time.
+    """
+    global _topology_store
+    with _topology_store_lock:
+        if _topology_store is None:
+            _topology_store = TopologyStore(db_instance)
+        return _topology_store
+
+
+def close_topology_store():
+    """
+    Save pending topology changes of the shared topology store, if
+    there is one.
+    """
+    with _topology_store_lock:
+        if _topology_store is not None:
+            _topology_store.close()